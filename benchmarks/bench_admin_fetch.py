@@ -0,0 +1,110 @@
+# benchmarks/bench_admin_fetch.py
+"""Compare admin panel fetch strategies against a fake Firestore
+
+    python benchmarks/bench_admin_fetch.py --users 10000 --latency 0.002
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "tests"))
+
+import main  # noqa: E402
+from fake_firestore import FakeFirestore  # noqa: E402
+
+
+def populate(db: FakeFirestore, users: int, messages_per_user: int):
+    """Fill the fake with users, each holding a few messages"""
+    start = datetime(2024, 1, 1)
+    for user in range(users):
+        user_id = f"user_{user:05d}" if user % 3 else f"anon_{user:08x}"
+        for message in range(messages_per_user):
+            db._apply(f"conversations/{user_id}/messages/m{message:03d}", {
+                "input": f"Question {message} from {user_id}",
+                "response": "Answer",
+                "timestamp": start + timedelta(minutes=user * messages_per_user + message),
+                "is_anonymous": user_id.startswith("anon_")
+            }, merge=False)
+
+
+def populate_sqlite(store, users: int, messages_per_user: int):
+    """Same data set in a SQLiteStore"""
+    start = datetime(2024, 1, 1)
+    for user in range(users):
+        user_id = f"user_{user:05d}" if user % 3 else f"anon_{user:08x}"
+        for message in range(messages_per_user):
+            store.save_message(user_id, f"Question {message} from {user_id}", "Answer",
+                               start + timedelta(minutes=user * messages_per_user + message))
+
+
+def fetch_sequential(db: FakeFirestore):
+    """The previous implementation: list users, then one query per user"""
+    conversations = []
+    for user_doc_ref in db.collection("conversations").list_documents():
+        for msg_doc in user_doc_ref.collection("messages").stream():
+            data = msg_doc.to_dict()
+            conversations.append({
+                "user_id": user_doc_ref.id,
+                "message_id": msg_doc.id,
+                "input": data.get("input", ""),
+                "response": data.get("response", ""),
+                "timestamp": data.get("timestamp")
+            })
+    return conversations
+
+
+def run(label: str, db, fetch):
+    if db is not None:
+        db.reads = db.round_trips = 0
+    start = time.perf_counter()
+    rows = fetch()
+    elapsed = time.perf_counter() - start
+    round_trips, reads = (db.round_trips, db.reads) if db is not None else ("-", "-")
+    print(f"{label:<22} {elapsed:>9.3f}s {round_trips:>12} {reads:>10} {len(rows):>10}")
+    return elapsed
+
+
+def main_benchmark():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--messages-per-user", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.002, help="seconds per simulated RPC")
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--limit", type=int, default=None, help="limit for the collection group query")
+    args = parser.parse_args()
+
+    db = FakeFirestore()
+    populate(db, args.users, args.messages_per_user)
+    db.latency = args.latency
+
+    # Bypass __init__ so no Firebase credentials are needed
+    chat_manager = main.ChatManager.__new__(main.ChatManager)
+    chat_manager.store = main.FirestoreStore(db)
+
+    sqlite_dir = tempfile.TemporaryDirectory()
+    sqlite_manager = main.ChatManager.__new__(main.ChatManager)
+    sqlite_manager.store = main.SQLiteStore(os.path.join(sqlite_dir.name, "bench.db"))
+    populate_sqlite(sqlite_manager.store, args.users, args.messages_per_user)
+
+    print(f"{args.users} users x {args.messages_per_user} messages, {args.latency * 1000:.1f} ms per RPC\n")
+    print(f"{'strategy':<22} {'time':>10} {'round trips':>12} {'reads':>10} {'rows':>10}")
+    baseline = run("sequential (before)", db, lambda: fetch_sequential(db))
+    grouped = run("collection_group", db,
+                  lambda: chat_manager.get_all_conversations(limit=args.limit, mode="collection_group"))
+    parallel = run(f"parallel x{args.workers}", db,
+                   lambda: chat_manager.get_all_conversations(mode="parallel", max_workers=args.workers))
+    local = run("sqlite (local)", None, lambda: sqlite_manager.get_all_conversations(limit=args.limit))
+
+    print(f"\ncollection_group speedup: {baseline / grouped:.1f}x")
+    print(f"parallel speedup:         {baseline / parallel:.1f}x")
+    print(f"sqlite speedup:           {baseline / local:.1f}x")
+    sqlite_dir.cleanup()
+
+
+if __name__ == "__main__":
+    main_benchmark()
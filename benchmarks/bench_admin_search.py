@@ -0,0 +1,99 @@
+# benchmarks/bench_admin_search.py
+"""Compare the admin search index with scanning the snapshot DataFrame
+
+    python benchmarks/bench_admin_search.py --messages 50000 --queries 200
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+QUESTIONS = [
+    "Kapan jadwal perwalian semester ini?",
+    "Bagaimana cara mengisi KRS di portal akademik?",
+    "Siapa dosen pembimbing skripsi untuk angkatan 2021?",
+    "Berapa SKS minimal untuk mendaftar magang?",
+    "Where can I find the course schedules for TRPL students?",
+    "Apa syarat pendaftaran sidang skripsi?",
+    "Dimana ruang laboratorium pemrograman?",
+    "How do I submit my internship report?"
+]
+ANSWERS = [
+    "Jadwal perwalian dapat dilihat di portal akademik pada menu Perwalian.",
+    "Pengisian KRS dilakukan melalui portal akademik setelah pembayaran UKT.",
+    "Dosen pembimbing ditetapkan oleh koordinator skripsi setiap semester.",
+    "Mahasiswa dapat mendaftar magang setelah menyelesaikan minimal 100 SKS.",
+    "The schedules are published on the academic portal every semester.",
+    "Syarat sidang: lulus semua mata kuliah dan naskah disetujui pembimbing.",
+    "Laboratorium pemrograman berada di gedung E lantai 2.",
+    "Internship reports are submitted to the internship coordinator by email."
+]
+QUERIES = ["jadwal perwalian", "pendaftaran magang", "skripsi pembimbing", "schedule", "laboratorium",
+           "mengisi krs", "internship report", "sidang"]
+
+
+def build_rows(messages: int, seed: int = 1):
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    return [{
+        "user_id": f"user_{rng.randrange(2000):05d}",
+        "message_id": f"m{i:07d}",
+        "input": f"{rng.choice(QUESTIONS)} ({i})",
+        "response": rng.choice(ANSWERS),
+        "timestamp": start + timedelta(minutes=i)
+    } for i in range(messages)]
+
+
+def main_benchmark():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    import pandas as pd
+
+    rows = build_rows(args.messages)
+    df = pd.DataFrame(rows, columns=main.AdminSnapshot.COLUMNS)
+
+    index = main.ConversationSearchIndex()
+    start = time.perf_counter()
+    index.add_many(rows)
+    build = time.perf_counter() - start
+    stats = index.stats()
+    print(f"index build              {build * 1000:8.1f} ms for {stats['messages']} messages "
+          f"({stats['terms']} terms, {stats['postings']} postings)")
+
+    start = time.perf_counter()
+    index.add_many(build_rows(200, seed=2)[:100])
+    print(f"incremental add of 100   {(time.perf_counter() - start) * 1000:8.1f} ms")
+
+    indexed, scanned = [], []
+    for i in range(args.queries):
+        query = QUERIES[i % len(QUERIES)]
+
+        start = time.perf_counter()
+        index.search(query, user_filter="user_00", limit=200)
+        indexed.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        mask = df["input"].str.contains(query, case=False, regex=False)
+        mask |= df["response"].str.contains(query, case=False, regex=False)
+        mask &= df["user_id"].str.contains("user_00", regex=False)
+        df[mask]
+        scanned.append(time.perf_counter() - start)
+
+    print(f"indexed search           median {statistics.median(indexed) * 1000:8.2f} ms "
+          f"(max {max(indexed) * 1000:.2f})")
+    print(f"DataFrame substring scan median {statistics.median(scanned) * 1000:8.2f} ms "
+          f"(max {max(scanned) * 1000:.2f}, exact substrings only, unranked)")
+
+
+if __name__ == "__main__":
+    main_benchmark()
@@ -0,0 +1,323 @@
+# benchmarks/bench_load.py
+"""Drive the chat turn from many simulated sessions against the mock backend
+
+    python benchmarks/bench_load.py --sessions 50 --turns 5 --latency 1.0 --error-rate 0.02
+
+Each session runs on its own thread, like Streamlit script runs, and calls
+main.run_chat_turn, the same turn chat_page runs: build the conversation
+context, look the question up in the answer index, send (streamed or not)
+while the input is stored, visualization processing and save on the turn
+pipeline, session memory cap; overlap_saved is the pipeline time a turn did
+not wait for. first_token is measured from the start of the turn.
+Storage is a throwaway SQLite file unless --storage firestore is given. Exit code is 1 when --max-turn-p95 is
+exceeded, so the script can gate a deploy.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_llm_server import add_config_arguments, config_from_args, start_mock_server  # noqa: E402
+
+STAGES = ["retrieval", "persist_input", "first_token", "send", "viz", "save", "overlap_saved", "turn",
+          "normal_turn", "greedy_turn"]
+
+DATA_QUESTIONS = [
+    "Tolong buat grafik jumlah mahasiswa per angkatan",
+    "Berapa data jumlah mahasiswa TRPL tiap tahun?",
+    "Tampilkan perbandingan jumlah lulusan per angkatan"
+]
+PLAIN_QUESTIONS = [
+    "Kapan jadwal perwalian semester ini?",
+    "Bagaimana cara mengisi KRS?",
+    "Siapa dosen pembimbing akademik saya?"
+]
+
+
+def percentile(values, q: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not values:
+        return 0.0
+    index = max(0, min(len(values) - 1, int(round(q / 100 * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+class LoadRecorder:
+    """Thread-safe collection of per-stage timings"""
+
+    def __init__(self, metrics=None):
+        self.lock = threading.Lock()
+        # Registry the turn pipeline reports its background spans to
+        self.metrics = metrics
+        self.timings = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.cached_turns = 0
+        self.coalesced_turns = 0
+        self.retrieved_turns = 0
+        self.prompt_chars = []
+
+    def record(self, stage: str, seconds: float):
+        with self.lock:
+            self.timings[stage].append(seconds)
+
+    def error(self, message: str):
+        with self.lock:
+            self.errors[message.split(":")[0]] += 1
+
+    def summary(self) -> dict:
+        result = {}
+        for stage in STAGES:
+            values = sorted(self.timings.get(stage, []))
+            result[stage] = {
+                "count": len(values),
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+                "p99": percentile(values, 99),
+                "max": values[-1] if values else 0.0
+            }
+        return result
+
+
+def pick_prompt(rng: random.Random, session: int, turn: int, viz_ratio: float, repeat_ratio: float) -> str:
+    questions = DATA_QUESTIONS if rng.random() < viz_ratio else PLAIN_QUESTIONS
+    question = rng.choice(questions)
+    if rng.random() < repeat_ratio:
+        # Popular question asked verbatim by many students - answer cache candidate
+        return question
+    return f"{question} (sesi {session}, giliran {turn})"
+
+
+def run_turn(main, chat_manager, recorder: LoadRecorder, messages: list, context_builder, user_id: str,
+             prompt: str) -> float:
+    """One chat_page turn through main.run_chat_turn, without the Streamlit rendering"""
+    trace = main.TurnTrace(recorder.metrics, user_id, prompt)
+    result = main.run_chat_turn(chat_manager, messages, context_builder, user_id, prompt, trace)
+
+    with recorder.lock:
+        recorder.prompt_chars.append(trace.sizes["prompt"])
+        recorder.retrieved_turns += bool(result.get("retrieved"))
+        recorder.cached_turns += bool(result.get("cached"))
+        recorder.coalesced_turns += bool(result.get("coalesced"))
+    for stage, name in (("retrieval", "retrieval"), ("persist_input", "persist_input"),
+                        ("first_token", "first_token"), ("model", "send"), ("visualization", "viz"),
+                        ("save", "save"), ("overlap_saved", "overlap_saved"), ("turn", "turn")):
+        if stage in trace.stages:
+            recorder.record(name, trace.stages[stage])
+
+    if result.get("save_error"):
+        recorder.error(f"Save failed: {result['save_error']}")
+    if not result["success"]:
+        recorder.error("Rate limited" if result.get("rate_limited") else result["error"])
+    return trace.stages["turn"]
+
+
+def run_session(main, chat_manager, recorder: LoadRecorder, session: int, args) -> int:
+    rng = random.Random(session if args.seed is None else args.seed * 100003 + session)
+    # Stagger session starts over the ramp-up period
+    time.sleep(args.ramp_up * session / max(args.sessions, 1))
+
+    messages = []
+    context_builder = main.ConversationContext(char_budget=args.context_budget)
+    user_id = f"anon_{session:08x}" if session % 3 else f"loadtest_user_{session}"
+    # Greedy sessions are one user in many tabs firing several times as many questions without pausing
+    greedy = session < args.greedy_sessions
+    if greedy:
+        user_id = "anon_greedy"
+    for turn in range(args.turns * (5 if greedy else 1)):
+        prompt = pick_prompt(rng, session, turn, args.viz_ratio, args.repeat_ratio)
+        elapsed = run_turn(main, chat_manager, recorder, messages, context_builder, user_id, prompt)
+        if args.greedy_sessions:
+            recorder.record("greedy_turn" if greedy else "normal_turn", elapsed)
+        if args.think_time and not greedy:
+            time.sleep(rng.expovariate(1 / args.think_time))
+    return sum(message.approx_size() for message in messages)
+
+
+def main_benchmark():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--think-time", type=float, default=0.0, help="mean seconds between turns")
+    parser.add_argument("--ramp-up", type=float, default=0.0, help="seconds to start all sessions")
+    parser.add_argument("--viz-ratio", type=float, default=0.3, help="share of data questions")
+    parser.add_argument("--repeat-ratio", type=float, default=0.0,
+                        help="share of verbatim popular questions (answer cache hits)")
+    parser.add_argument("--context-budget", type=int, default=0,
+                        help="context_char_budget of the app (0 = prompt only)")
+    parser.add_argument("--max-concurrent", type=int, default=4,
+                        help="llm_max_concurrent of the app, default as deployed (0 = no admission queue)")
+    parser.add_argument("--rate-limit", type=float, default=0.0,
+                        help="rate_limit_per_minute per user (0 = unlimited)")
+    parser.add_argument("--greedy-sessions", type=int, default=0,
+                        help="sessions of one user sending 5x the turns back to back")
+    parser.add_argument("--no-retrieval", action="store_true", help="disable the answer index")
+    parser.add_argument("--no-stream", action="store_true", help="use the non-streaming /generate call")
+    parser.add_argument("--batching", action="store_true",
+                        help="micro-batch non-streaming calls to /generate_batch (implies --no-stream)")
+    parser.add_argument("--batch-window-ms", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--pool-size", type=int, default=10, help="llm_pool_size of the app")
+    parser.add_argument("--storage", choices=["sqlite", "firestore"], default="sqlite")
+    parser.add_argument("--backend-url", default="",
+                        help="comma separated running backends instead of the in-process mock")
+    parser.add_argument("--backends", type=int, default=1, help="number of in-process mock backends")
+    parser.add_argument("--slow-backend-factor", type=float, default=1.0,
+                        help="latency multiplier of the first mock backend")
+    parser.add_argument("--routing", choices=["least_outstanding", "ewma"], default="least_outstanding")
+    parser.add_argument("--tracemalloc", action="store_true", help="trace Python allocations (slower)")
+    parser.add_argument("--json", default="", help="write the report to this JSON file")
+    parser.add_argument("--max-turn-p95", type=float, default=0.0, help="fail when turn p95 exceeds this")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+    if args.batching:
+        args.no_stream = True
+
+    mock_configs, servers = [], []
+    if args.backend_url:
+        backend_url = args.backend_url
+    else:
+        # One mock per simulated GPU box; the app routes over all of them
+        urls = []
+        for index in range(args.backends):
+            config = config_from_args(args)
+            if args.slow_backend_factor != 1.0 and index == 0:
+                config.latency *= args.slow_backend_factor
+            server, url = start_mock_server(config)
+            mock_configs.append(config)
+            servers.append(server)
+            urls.append(url)
+        backend_url = ",".join(urls)
+
+    # Settings are read through get_setting(), so the environment configures the app
+    data_dir = tempfile.TemporaryDirectory()
+    os.environ.update({
+        "NGROK_API_URLS": backend_url,
+        "LLM_ROUTING": args.routing,
+        "STREAM_RESPONSES": "false" if args.no_stream else "true",
+        "LLM_POOL_SIZE": str(args.pool_size),
+        "STORAGE_BACKEND": args.storage,
+        "SQLITE_PATH": os.path.join(data_dir.name, "load.db"),
+        "ANSWER_CACHE_PATH": "",
+        "LLM_MAX_CONCURRENT": str(args.max_concurrent),
+        "RATE_LIMIT_PER_MINUTE": str(args.rate_limit),
+        "RETRIEVAL_ENABLED": "false" if args.no_retrieval else "true",
+        "RETRIEVAL_REFRESH_INTERVAL": "1.0",
+        "LLM_BATCHING": "true" if args.batching else "false",
+        "LLM_BATCH_WINDOW_MS": str(args.batch_window_ms),
+        "LLM_BATCH_SIZE": str(args.batch_size)
+    })
+
+    import main  # noqa: E402
+    chat_manager = main.get_chat_manager()
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    recorder = LoadRecorder(main.MetricsRegistry())
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.sessions) as executor:
+        session_bytes = list(executor.map(lambda s: run_session(main, chat_manager, recorder, s, args),
+                                          range(args.sessions)))
+    elapsed = time.perf_counter() - start
+
+    traced_peak = tracemalloc.get_traced_memory()[1] if args.tracemalloc else None
+    if args.tracemalloc:
+        tracemalloc.stop()
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    summary = recorder.summary()
+    turns = summary["turn"]["count"]
+    prompt_chars = sorted(recorder.prompt_chars)
+    report = {
+        "sessions": args.sessions,
+        "turns": turns,
+        "elapsed_seconds": elapsed,
+        "throughput_turns_per_second": turns / elapsed if elapsed else 0.0,
+        "errors": dict(recorder.errors),
+        "cached_turns": recorder.cached_turns,
+        "coalesced_turns": recorder.coalesced_turns,
+        "retrieved_turns": recorder.retrieved_turns,
+        "prompt_chars": {
+            "avg": sum(prompt_chars) / len(prompt_chars) if prompt_chars else 0.0,
+            "p95": percentile(prompt_chars, 95),
+            "max": prompt_chars[-1] if prompt_chars else 0
+        },
+        "stages": summary,
+        "memory": {
+            "peak_rss_kb": rss_after,
+            "rss_growth_kb": rss_after - rss_before,
+            "traced_peak_bytes": traced_peak,
+            "session_state_bytes_avg": sum(session_bytes) / len(session_bytes) if session_bytes else 0
+        },
+        "llm_client": chat_manager.llm_client.stats(),
+        "backends": chat_manager.llm_client.backend_stats(),
+        "batching": chat_manager.batcher.stats() if chat_manager.batcher is not None else None,
+        "admission": chat_manager.admission.stats() if chat_manager.admission is not None else None,
+        "rate_limited": chat_manager.rate_limiter.rejected,
+        "mock_backends": [config.stats() for config in mock_configs]
+    }
+
+    print(f"{args.sessions} sessions x {args.turns} turns against {backend_url} "
+          f"({'streaming' if not args.no_stream else 'non-streaming'}, {args.storage})\n")
+    print(f"{'stage':<14} {'count':>7} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'max ms':>10}")
+    for stage, stats in summary.items():
+        if stats["count"]:
+            print(f"{stage:<14} {stats['count']:>7} {stats['p50'] * 1000:>10.1f} {stats['p95'] * 1000:>10.1f} "
+                  f"{stats['p99'] * 1000:>10.1f} {stats['max'] * 1000:>10.1f}")
+    print(f"\nthroughput:   {report['throughput_turns_per_second']:.1f} turns/s over {elapsed:.1f}s")
+    saved = recorder.timings.get("overlap_saved", [])
+    if saved:
+        print(f"overlap:      {sum(saved) / len(saved) * 1000:.1f} ms saved per turn by storing and "
+              f"processing alongside the model call")
+    print(f"errors:       {sum(recorder.errors.values())} {dict(recorder.errors) or ''}")
+    print(f"cache hits:   {recorder.cached_turns}, coalesced: {recorder.coalesced_turns}, "
+          f"answered from index: {recorder.retrieved_turns}")
+    print(f"prompt size:  avg {report['prompt_chars']['avg']:.0f} chars, p95 {report['prompt_chars']['p95']}, "
+          f"max {report['prompt_chars']['max']} (context budget {args.context_budget})")
+    print(f"memory:       peak RSS {rss_after / 1024:.0f} MB (+{(rss_after - rss_before) / 1024:.0f} MB), "
+          f"session state {report['memory']['session_state_bytes_avg'] / 1024:.1f} KB/session"
+          + (f", traced peak {traced_peak / 1024 / 1024:.1f} MB" if traced_peak is not None else ""))
+    client = report["llm_client"]
+    print(f"connections:  {client['connections_opened']} opened, {client['connections_reused']} reused, "
+          f"{client['retries']} retries")
+    if report["batching"] is not None:
+        batching = report["batching"]
+        print(f"batching:     {batching['batches']} batches, avg {batching['avg_batch_size']:.1f} prompts, "
+              f"largest {batching['largest_batch']}, endpoint supported: {batching['supported']}")
+    if report["admission"] is not None:
+        admission = report["admission"]
+        print(f"admission:    {admission['queued']} of {admission['admitted']} calls queued, "
+              f"avg wait {admission['avg_wait'] * 1000:.0f} ms, longest queue {admission['longest_queue']}, "
+              f"{admission['timeouts']} timeouts, {report['rate_limited']} rate limited")
+    if len(report["backends"]) > 1:
+        for backend in report["backends"]:
+            ewma = f"{backend['ewma_ms']:.0f} ms" if backend["ewma_ms"] is not None else "-"
+            print(f"  {backend['url']:<28} {backend['requests']:>6} requests, ewma {ewma}, "
+                  f"{backend['failures']} failures")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, default=str)
+
+    for server in servers:
+        server.shutdown()
+    data_dir.cleanup()
+
+    if args.max_turn_p95 and summary["turn"]["p95"] > args.max_turn_p95:
+        print(f"\nFAIL: turn p95 {summary['turn']['p95']:.3f}s > {args.max_turn_p95:.3f}s")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_benchmark()
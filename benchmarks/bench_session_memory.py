@@ -0,0 +1,96 @@
+# benchmarks/bench_session_memory.py
+"""Measure bytes per chat session for the old dict messages vs ChatMessage
+
+    python benchmarks/bench_session_memory.py --turns 50 --viz-ratio 0.3
+"""
+import argparse
+import gc
+import os
+import sys
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+QUESTION = "Tolong buat grafik perbandingan jumlah mahasiswa per angkatan"
+ANSWER = "\n".join(
+    ["Berikut data jumlah mahasiswa TRPL per angkatan:"] +
+    [f"{i}. Angkatan {2018 + i}: {80 + i * 7} mahasiswa" for i in range(1, 7)]
+)
+PLAIN_ANSWER = "Dosen pembimbing akademik dapat dilihat di portal akademik pada menu Perwalian. " * 3
+
+
+def build_legacy_session(viz_manager, turns: int, viz_ratio: float):
+    """Messages as they were stored before: dicts with datetimes and live figures"""
+    messages = []
+    for turn in range(turns):
+        with_viz = turn < turns * viz_ratio
+        messages.append({"role": "user", "content": QUESTION, "timestamp": datetime.now()})
+        answer = ANSWER if with_viz else PLAIN_ANSWER
+        data = viz_manager.extract_data_from_response(answer) if with_viz else []
+        messages.append({
+            "role": "assistant",
+            "content": answer,
+            "timestamp": datetime.now(),
+            "visualization": viz_manager.create_visualization(data, "comparison") if data and turn % 2 else None,
+            "table": viz_manager.create_table(data) if data and not turn % 2 else None
+        })
+    return messages
+
+
+def build_compact_session(chat_manager, turns: int, viz_ratio: float):
+    messages = []
+    for turn in range(turns):
+        with_viz = turn < turns * viz_ratio
+        messages.append(main.ChatMessage("user", QUESTION))
+        answer = ANSWER if with_viz else PLAIN_ANSWER
+        processed = chat_manager.process_response_with_visualization(QUESTION if with_viz else "siapa dosen PA", answer)
+        message = main.ChatMessage("assistant", answer, viz_type=processed["viz_type"],
+                                   viz_data=processed["viz_data"])
+        # Rendered HTML is cached on the message, include it in the measurement
+        main.get_message_html(message)
+        messages.append(message)
+    return messages
+
+
+def measure(build, sessions: int) -> float:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    kept = [build() for _ in range(sessions)]
+    gc.collect()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    total = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    del kept
+    return total / sessions
+
+
+def main_benchmark():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--viz-ratio", type=float, default=0.3)
+    parser.add_argument("--sessions", type=int, default=5)
+    args = parser.parse_args()
+
+    viz_manager = main.DataVisualizationManager()
+    chat_manager = main.ChatManager.__new__(main.ChatManager)
+    chat_manager.viz_manager = viz_manager
+
+    # Warm up plotly/pandas so import-time allocations are not counted
+    build_legacy_session(viz_manager, 2, 1.0)
+
+    legacy = measure(lambda: build_legacy_session(viz_manager, args.turns, args.viz_ratio), args.sessions)
+    compact = measure(lambda: build_compact_session(chat_manager, args.turns, args.viz_ratio), args.sessions)
+
+    print(f"{args.turns} turns per session, {args.viz_ratio:.0%} with charts/tables\n")
+    print(f"{'store':<20} {'bytes/session':>15}")
+    print(f"{'dict + figures':<20} {legacy:>15,.0f}")
+    print(f"{'ChatMessage':<20} {compact:>15,.0f}")
+    print(f"\nreduction: {legacy / compact:.1f}x")
+
+
+if __name__ == "__main__":
+    main_benchmark()
@@ -0,0 +1,138 @@
+# benchmarks/bench_startup.py
+"""Report cold-start import time, per-rerun script execution time and warm-up readiness
+
+    python benchmarks/bench_startup.py --cold-runs 5 --reruns 20
+
+Reruns are driven with Streamlit's AppTest against a throwaway SQLite store
+and the mock model backend, so no Firebase project is needed. The warm-up is
+followed through the /ready endpoint of the metrics server: time until ready,
+its phases, and the time to the first answered chat turn.
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COLD_START_SNIPPET = """
+import sys, time
+start = time.perf_counter()
+import main
+elapsed = time.perf_counter() - start
+heavy = [name for name in ("pandas", "plotly.express", "numpy") if name in sys.modules]
+print(elapsed, ",".join(heavy) or "-")
+"""
+
+
+def measure_cold_start(runs: int):
+    timings, heavy = [], "-"
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", COLD_START_SNIPPET], cwd=ROOT,
+            capture_output=True, text=True, check=True
+        ).stdout.split()
+        timings.append(float(output[0]))
+        heavy = output[1]
+    return timings, heavy
+
+
+def read_ready(port: int):
+    """Status code and warm-up report from the /ready endpoint"""
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/ready", timeout=5) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as e:
+        return e.code, json.load(e)
+
+
+def measure_reruns(reruns: int, timeout: float, metrics_port: int):
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(os.path.join(ROOT, "main.py"), default_timeout=timeout)
+    # The first run starts the warm-up and pays for whatever it has not finished yet
+    start = time.perf_counter()
+    app.run()
+    first = time.perf_counter() - start
+
+    status, report = read_ready(metrics_port)
+    polls = 0
+    while status != 200 and not report["finished"] and time.perf_counter() - start < timeout:
+        time.sleep(0.05)
+        status, report = read_ready(metrics_port)
+        polls += 1
+
+    timings = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        app.run()
+        timings.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    app.chat_input[0].set_value("Kapan jadwal perwalian semester ini?").run()
+    first_turn = time.perf_counter() - start
+    _, report = read_ready(metrics_port)
+    return first, timings, [e.value for e in app.exception], report, first_turn
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def main_benchmark():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cold-runs", type=int, default=5)
+    parser.add_argument("--reruns", type=int, default=20)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--latency", type=float, default=0.2, help="mock model latency in seconds")
+    parser.add_argument("--no-warmup", action="store_true", help="disable the warm-up to compare")
+    args = parser.parse_args()
+
+    from mock_llm_server import MockLLMConfig, start_mock_server
+
+    server, backend_url = start_mock_server(MockLLMConfig(latency=args.latency, latency_dist="fixed"))
+    metrics_port = free_port()
+
+    # Picked up by get_setting() in the subprocesses and in AppTest
+    data_dir = tempfile.TemporaryDirectory()
+    os.environ["STORAGE_BACKEND"] = "sqlite"
+    os.environ["SQLITE_PATH"] = os.path.join(data_dir.name, "bench.db")
+    os.environ["NGROK_API_URL"] = backend_url
+    os.environ["METRICS_PORT"] = str(metrics_port)
+    os.environ["ANSWER_CACHE_PATH"] = ""
+    os.environ["WARMUP_ENABLED"] = "false" if args.no_warmup else "true"
+
+    timings, heavy = measure_cold_start(args.cold_runs)
+    print(f"cold import of main.py   median {statistics.median(timings) * 1000:8.1f} ms "
+          f"(min {min(timings) * 1000:.1f}, max {max(timings) * 1000:.1f})")
+    print(f"heavy modules after import: {heavy}")
+
+    first, reruns, errors, report, first_turn = measure_reruns(args.reruns, args.timeout, metrics_port)
+    print(f"first script run         {first * 1000:8.1f} ms")
+    print(f"rerun                    median {statistics.median(reruns) * 1000:8.1f} ms "
+          f"(p95 {sorted(reruns)[int(len(reruns) * 0.95) - 1] * 1000:.1f})")
+    if report["ready_seconds"] is not None:
+        print(f"ready after              {report['ready_seconds'] * 1000:8.1f} ms "
+              f"({'ready' if report['ready'] else 'degraded'})")
+    for phase in report["phases"]:
+        print(f"  {phase['phase']:<22} {phase['seconds'] * 1000:8.1f} ms  {phase['error'] or phase['detail']}")
+    print(f"first chat turn          {first_turn * 1000:8.1f} ms")
+    if report["first_response_seconds"] is not None:
+        print(f"first answer after start {report['first_response_seconds'] * 1000:8.1f} ms")
+    if errors:
+        print(f"app raised: {errors[0]}")
+    server.shutdown()
+    data_dir.cleanup()
+
+
+if __name__ == "__main__":
+    main_benchmark()
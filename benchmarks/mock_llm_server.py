@@ -0,0 +1,285 @@
+# benchmarks/mock_llm_server.py
+"""Local stand-in for the model backend implementing the /generate contract
+
+    python benchmarks/mock_llm_server.py --port 8001 --latency 1.5 --latency-dist lognormal \
+        --error-rate 0.02 --stream sse
+
+Requests with ``"stream": true`` are answered as SSE, NDJSON or chunked text
+depending on --stream; everything else gets the plain JSON response.
+/generate_batch answers ``{"requests": [...]}`` with ``{"responses": [...]}``
+in one decode pass that costs --batch-overhead extra latency per additional
+prompt (disable it with --no-batch to test the fallback). The optional
+``context`` of a request adds --latency-per-kchar per 1000 characters of
+prompt plus context, like prefill does on a real model. Prompts
+that ask for data (grafik, data, jumlah, ...) get a numbered list so the
+visualization path of the app is exercised too.
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict
+
+DATA_KEYWORDS = ("grafik", "chart", "data", "jumlah", "statistik", "perbandingan", "tabel", "trend")
+
+PLAIN_ANSWER = (
+    "Jadwal perwalian dapat dilihat di portal akademik pada menu Perwalian. "
+    "Silakan hubungi dosen pembimbing akademik jika ada kendala pengisian KRS."
+)
+
+
+def build_answer(prompt: str) -> str:
+    """Deterministic answer for a prompt, with list data for data questions"""
+    if any(keyword in prompt.lower() for keyword in DATA_KEYWORDS):
+        rows = [f"{i}. Angkatan {2018 + i}: {80 + (len(prompt) + i * 7) % 60} mahasiswa" for i in range(1, 7)]
+        return "\n".join(["Berikut data jumlah mahasiswa TRPL per angkatan:"] + rows)
+    return PLAIN_ANSWER
+
+
+class MockLLMConfig:
+    """Behaviour of the mock backend, shared by all handler threads"""
+
+    def __init__(self, latency: float = 1.0, latency_dist: str = "lognormal", latency_sigma: float = 0.5,
+                 error_rate: float = 0.0, error_status: int = 500, stream: str = "sse",
+                 first_token_share: float = 0.3, words_per_chunk: int = 3, batch: bool = True,
+                 batch_overhead: float = 0.1, concurrency: int = 0, latency_per_kchar: float = 0.0,
+                 seed=None):
+        self.latency = latency
+        self.latency_dist = latency_dist
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.stream = stream
+        # Part of the latency spent before the first token when streaming
+        self.first_token_share = first_token_share
+        self.words_per_chunk = words_per_chunk
+        self.batch = batch
+        self.batch_overhead = batch_overhead
+        self.latency_per_kchar = latency_per_kchar
+        # A GPU decodes a limited number of requests at once; the rest queue up
+        self.slots = threading.BoundedSemaphore(concurrency) if concurrency else None
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counters = {"requests": 0, "errors": 0, "streamed": 0, "batches": 0, "batched_prompts": 0,
+                         "in_flight": 0, "max_in_flight": 0}
+
+    def sample_latency(self) -> float:
+        with self.lock:
+            if self.latency_dist == "fixed":
+                return self.latency
+            if self.latency_dist == "uniform":
+                return self.random.uniform(0, 2 * self.latency)
+            if self.latency_dist == "exponential":
+                return self.random.expovariate(1 / self.latency) if self.latency else 0.0
+            # lognormal with the configured mean
+            mu = math.log(max(self.latency, 1e-6)) - self.latency_sigma ** 2 / 2
+            return self.random.lognormvariate(mu, self.latency_sigma)
+
+    def prefill_latency(self, request: Dict) -> float:
+        """Extra time for reading a long prompt and its conversation context"""
+        context = request.get("context") or {}
+        chars = len(request.get("prompt", "")) + len(context.get("summary", ""))
+        chars += sum(len(turn.get("content", "")) for turn in context.get("turns", []))
+        return self.latency_per_kchar * chars / 1000
+
+    @contextmanager
+    def slot(self):
+        if self.slots is None:
+            yield
+            return
+        with self.slots:
+            yield
+
+    def should_fail(self) -> bool:
+        with self.lock:
+            return self.random.random() < self.error_rate
+
+    def count(self, name: str, amount: int = 1):
+        with self.lock:
+            self.counters[name] += amount
+            if name == "in_flight":
+                self.counters["max_in_flight"] = max(self.counters["max_in_flight"], self.counters["in_flight"])
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return dict(self.counters)
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    # Keep-alive so the app's connection pool behaves like it does against ngrok
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle(self):
+        try:
+            super().handle()
+        except (ConnectionResetError, BrokenPipeError):
+            # Client went away (pool closed at shutdown, cancelled stream)
+            pass
+
+    @property
+    def config(self) -> MockLLMConfig:
+        return self.server.config
+
+    def _send_json(self, status: int, body: Dict):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _write_chunk(self, text: str):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _stream(self, answer: str, latency: float):
+        content_types = {"sse": "text/event-stream", "ndjson": "application/x-ndjson", "text": "text/plain"}
+        words = answer.split(" ")
+        chunks = [" ".join(words[i:i + self.config.words_per_chunk])
+                  for i in range(0, len(words), self.config.words_per_chunk)]
+        chunks = [chunk if i == 0 else " " + chunk for i, chunk in enumerate(chunks)]
+        per_chunk = latency * (1 - self.config.first_token_share) / max(len(chunks), 1)
+
+        self.send_response(200)
+        self.send_header("Content-Type", f"{content_types[self.config.stream]}; charset=utf-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        time.sleep(latency * self.config.first_token_share)
+        for chunk in chunks:
+            if self.config.stream == "sse":
+                self._write_chunk(f"data: {json.dumps({'token': chunk})}\n\n")
+            elif self.config.stream == "ndjson":
+                self._write_chunk(json.dumps({"token": chunk}) + "\n")
+            else:
+                self._write_chunk(chunk)
+            time.sleep(per_chunk)
+        if self.config.stream == "sse":
+            self._write_chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, {"status": "ok"})
+        elif self.path == "/stats":
+            self._send_json(200, self.config.stats())
+        else:
+            self._send_json(404, {"error": "Not found", "status": "error"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": "Invalid JSON", "status": "error"})
+            return
+
+        if self.path == "/generate_batch" and self.config.batch:
+            self._generate_batch(body.get("requests", []))
+            return
+        if self.path != "/generate":
+            self._send_json(404, {"error": "Not found", "status": "error"})
+            return
+
+        self.config.count("requests")
+        self.config.count("in_flight")
+        try:
+            latency = self.config.sample_latency() + self.config.prefill_latency(body)
+            if self.config.should_fail():
+                self.config.count("errors")
+                time.sleep(latency * self.config.first_token_share)
+                self._send_json(self.config.error_status, {"error": "Mock backend failure", "status": "error"})
+                return
+
+            answer = build_answer(body.get("prompt", ""))
+            with self.config.slot():
+                if body.get("stream") and self.config.stream != "none":
+                    self.config.count("streamed")
+                    self._stream(answer, latency)
+                else:
+                    time.sleep(latency)
+                    self._send_json(200, {"response": answer, "status": "success"})
+        finally:
+            self.config.count("in_flight", -1)
+
+
+    def _generate_batch(self, requests):
+        self.config.count("batches")
+        self.config.count("batched_prompts", len(requests))
+        self.config.count("in_flight")
+        try:
+            # Decoding prompts together costs a little more than one prompt, far less than N
+            latency = self.config.sample_latency() * (1 + self.config.batch_overhead * max(len(requests) - 1, 0))
+            latency += sum(self.config.prefill_latency(request) for request in requests)
+            with self.config.slot():
+                time.sleep(latency)
+            responses = []
+            for request in requests:
+                if self.config.should_fail():
+                    self.config.count("errors")
+                    responses.append({"error": "Mock backend failure", "status": "error"})
+                else:
+                    responses.append({"response": build_answer(request.get("prompt", "")), "status": "success"})
+            self._send_json(200, {"responses": responses})
+        finally:
+            self.config.count("in_flight", -1)
+
+
+def start_mock_server(config: MockLLMConfig, host: str = "127.0.0.1", port: int = 0):
+    """Start the mock backend on a daemon thread, returns (server, base_url)"""
+    server = ThreadingHTTPServer((host, port), MockLLMHandler)
+    server.daemon_threads = True
+    server.config = config
+    threading.Thread(target=server.serve_forever, name="mock-llm-server", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def add_config_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--latency", type=float, default=1.0, help="mean seconds per generation")
+    parser.add_argument("--latency-dist", choices=["fixed", "uniform", "exponential", "lognormal"],
+                        default="lognormal")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="sigma of the lognormal distribution")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--stream", choices=["sse", "ndjson", "text", "none"], default="sse")
+    parser.add_argument("--concurrency", type=int, default=0,
+                        help="requests decoded at once, others queue (0 = unlimited)")
+    parser.add_argument("--no-batch", action="store_true", help="answer /generate_batch with 404")
+    parser.add_argument("--batch-overhead", type=float, default=0.1,
+                        help="extra latency share per additional prompt in a batch")
+    parser.add_argument("--latency-per-kchar", type=float, default=0.0,
+                        help="extra seconds per 1000 characters of prompt and context")
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def config_from_args(args) -> MockLLMConfig:
+    return MockLLMConfig(latency=args.latency, latency_dist=args.latency_dist,
+                         latency_sigma=args.latency_sigma, error_rate=args.error_rate,
+                         error_status=args.error_status, stream=args.stream, batch=not args.no_batch,
+                         batch_overhead=args.batch_overhead, concurrency=args.concurrency,
+                         latency_per_kchar=args.latency_per_kchar, seed=args.seed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    server, url = start_mock_server(config_from_args(args), args.host, args.port)
+    print(f"Mock /generate listening on {url} (set NGROK_API_URL={url})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -1,1067 +1,5204 @@
-# main.py
-import streamlit as st
-import firebase_admin
-from firebase_admin import credentials, firestore, auth
-import requests
-import json
-import time
-from datetime import datetime
-import pandas as pd
-from typing import Dict, List, Optional
-import uuid
-import plotly.express as px
-import plotly.graph_objects as go
-import re
-
-# Page configuration
-st.set_page_config(
-    page_title="Academic Chatbot",
-    page_icon="🎓",
-    layout="wide",
-    initial_sidebar_state="expanded"
-)
-
-# Custom CSS for modern chat UI
-def load_css():
-    st.markdown("""
-    <style>
-    /* Main theme colors - Sky Blue */
-    :root {
-        --primary-color: #a600ff;
-        --secondary-color: #4682B4;
-        --accent-color: #1E90FF;
-        --background-color: #F0F8FF;
-        --text-color: #1cd8d8;
-        --chat-bg: #FFFFFF;
-        --user-msg-bg: #a600ff;
-        --bot-msg-bg: #4682B4;
-    }
-    
-    /* Hide default Streamlit elements */
-    #MainMenu {visibility: hidden;}
-    footer {visibility: hidden;}
-    header {visibility: hidden;}
-    
-    /* Main container styling */
-    .main-container {
-        background: linear-gradient(135deg, #F0F8FF 0%, #E6F3FF 100%);
-        min-height: 100vh;
-        padding: 0;
-    }
-    
-    /* Header styling */
-    .chat-header {
-        background: linear-gradient(90deg, var(--primary-color), var(--secondary-color));
-        padding: 1rem 2rem;
-        border-radius: 0 0 20px 20px;
-        margin-bottom: 2rem;
-        box-shadow: 0 4px 12px rgba(0,0,0,0.1);
-    }
-    
-    .chat-title {
-        color: white;
-        font-size: 2rem;
-        font-weight: 700;
-        margin: 0;
-        display: flex;
-        align-items: center;
-        gap: 10px;
-    }
-    
-    .chat-subtitle {
-        color: rgba(255,255,255,0.9);
-        font-size: 1rem;
-        margin: 0;
-        margin-top: 5px;
-    }
-    
-    /* Chat container */
-    .chat-container {
-        max-width: 800px;
-        margin: 0 auto;
-        padding: 0 1rem;
-    }
-    
-    /* Message styling */
-    .message-container {
-        margin-bottom: 1rem;
-        animation: fadeIn 0.3s ease-in;
-    }
-    
-    .user-message {
-        background: var(--user-msg-bg);
-        border: 1px solid var(--primary-color);
-        border-radius: 18px 18px 5px 18px;
-        padding: 12px 16px;
-        margin-left: 20%;
-        position: relative;
-    }
-    
-    .bot-message {
-        background: var(--bot-msg-bg);
-        border: 1px solid #E0E0E0;
-        border-radius: 18px 18px 18px 5px;
-        padding: 12px 16px;
-        margin-right: 20%;
-        position: relative;
-    }
-    
-    .message-time {
-        font-size: 0.75rem;
-        color: #888;
-        margin-top: 5px;
-        text-align: right;
-    }
-    
-    .bot-message .message-time {
-        text-align: left;
-    }
-    
-    /* Typing indicator */
-    .typing-indicator {
-        background: var(--bot-msg-bg);
-        border: 1px solid #E0E0E0;
-        border-radius: 18px 18px 18px 5px;
-        padding: 12px 16px;
-        margin-right: 20%;
-        margin-bottom: 1rem;
-    }
-    
-    .typing-dots {
-        display: flex;
-        gap: 4px;
-        align-items: center;
-    }
-    
-    .typing-dot {
-        width: 8px;
-        height: 8px;
-        border-radius: 50%;
-        background-color: var(--secondary-color);
-        animation: typingDot 1.4s infinite ease-in-out;
-    }
-    
-    .typing-dot:nth-child(1) { animation-delay: -0.32s; }
-    .typing-dot:nth-child(2) { animation-delay: -0.16s; }
-    
-    @keyframes typingDot {
-        0%, 80%, 100% { transform: scale(0.8); opacity: 0.5; }
-        40% { transform: scale(1); opacity: 1; }
-    }
-    
-    @keyframes fadeIn {
-        from { opacity: 0; transform: translateY(10px); }
-        to { opacity: 1; transform: translateY(0); }
-    }
-    
-    /* Input styling */
-    .stTextInput > div > div > input {
-        border-radius: 25px;
-        border: 2px solid var(--primary-color);
-        padding: 12px 20px;
-        font-size: 1rem;
-    }
-    
-    .stTextInput > div > div > input:focus {
-        border-color: var(--secondary-color);
-        box-shadow: 0 0 0 2px rgba(70, 130, 180, 0.2);
-    }
-    
-    /* Button styling */
-    .stButton > button {
-        background: linear-gradient(90deg, var(--primary-color), var(--secondary-color));
-        color: white;
-        border: none;
-        border-radius: 25px;
-        padding: 12px 24px;
-        font-weight: 600;
-        transition: all 0.3s ease;
-    }
-    
-    .stButton > button:hover {
-        transform: translateY(-2px);
-        box-shadow: 0 4px 12px rgba(0,0,0,0.2);
-    }
-    
-    /* Sidebar styling */
-    .css-1d391kg {
-        background: linear-gradient(180deg, var(--background-color), white);
-    }
-    
-    /* Pagination */
-    .pagination-container {
-        display: flex;
-        justify-content: center;
-        align-items: center;
-        gap: 10px;
-        margin: 20px 0;
-    }
-    
-    .pagination-btn {
-        background: var(--primary-color);
-        color: white;
-        border: none;
-        border-radius: 20px;
-        padding: 8px 16px;
-        cursor: pointer;
-        transition: all 0.3s ease;
-    }
-    
-    .pagination-btn:hover {
-        background: var(--secondary-color);
-    }
-    
-    .pagination-btn:disabled {
-        background: #ccc;
-        cursor: not-allowed;
-    }
-    </style>
-    """, unsafe_allow_html=True)
-
-class DataVisualizationManager:
-    def __init__(self):
-        pass
-    
-    def detect_data_request(self, user_input: str, bot_response: str) -> Dict:
-        """Detect if user is asking for data visualization"""
-        viz_keywords = [
-            'grafik', 'chart', 'plot', 'visualisasi', 'tabel', 'table',
-            'diagram', 'statistik', 'data', 'perbandingan', 'trend'
-        ]
-        
-        user_lower = user_input.lower()
-        response_lower = bot_response.lower()
-        
-        # Check if user asking for visualization
-        needs_viz = any(keyword in user_lower for keyword in viz_keywords)
-        
-        # Check if response contains structured data
-        has_numbers = bool(re.search(r'\d+', bot_response))
-        has_lists = '1.' in bot_response or '2.' in bot_response or '-' in bot_response
-        
-        return {
-            "needs_visualization": needs_viz,
-            "has_data": has_numbers and has_lists,
-            "type": self._determine_viz_type(user_input, bot_response)
-        }
-    
-    def _determine_viz_type(self, user_input: str, bot_response: str) -> str:
-        """Determine what type of visualization to create"""
-        user_lower = user_input.lower()
-        
-        if any(word in user_lower for word in ['perbandingan', 'compare', 'vs']):
-            return 'comparison'
-        elif any(word in user_lower for word in ['trend', 'waktu', 'time', 'tahun']):
-            return 'timeline'
-        elif any(word in user_lower for word in ['distribusi', 'percentage', 'persen']):
-            return 'pie'
-        elif any(word in user_lower for word in ['tabel', 'table', 'list']):
-            return 'table'
-        else:
-            return 'bar'
-    
-    def extract_data_from_response(self, response: str) -> List[Dict]:
-        """Extract structured data from AI response"""
-        lines = response.split('\n')
-        data = []
-        
-        for line in lines:
-            # Look for patterns like "1. Item: Value" or "- Item: Value"
-            pattern = r'(?:\d+\.\s*|-\s*)([^:]+):\s*(.+)'
-            match = re.search(pattern, line)
-            
-            if match:
-                label = match.group(1).strip()
-                value_text = match.group(2).strip()
-                
-                # Try to extract numbers
-                number_match = re.search(r'(\d+(?:\.\d+)?)', value_text)
-                if number_match:
-                    value = float(number_match.group(1))
-                    data.append({"label": label, "value": value, "description": value_text})
-        
-        return data
-    
-    def create_visualization(self, data: List[Dict], viz_type: str, title: str = "Data Visualization"):
-        """Create visualization based on data and type"""
-        if not data:
-            return None
-        
-        df = pd.DataFrame(data)
-        
-        if viz_type == 'bar':
-            fig = px.bar(df, x='label', y='value', title=title,
-                        color='value', color_continuous_scale='Blues')
-            fig.update_layout(xaxis_tickangle=-45)
-            
-        elif viz_type == 'pie':
-            fig = px.pie(df, values='value', names='label', title=title)
-            
-        elif viz_type == 'comparison':
-            fig = px.bar(df, x='label', y='value', title=title,
-                        color='label', color_discrete_sequence=px.colors.qualitative.Set3)
-            
-        elif viz_type == 'timeline':
-            fig = px.line(df, x='label', y='value', title=title,
-                         markers=True, line_shape='spline')
-            
-        else:  # default bar
-            fig = px.bar(df, x='label', y='value', title=title)
-        
-        # Customize layout
-        fig.update_layout(
-            template='plotly_white',
-            height=400,
-            margin=dict(t=50, l=50, r=50, b=50)
-        )
-        
-        return fig
-    
-    def create_table(self, data: List[Dict], title: str = "Data Table"):
-        """Create a formatted table from data"""
-        if not data:
-            return None
-        
-        df = pd.DataFrame(data)
-        return df
-
-# Firebase initialization
-@st.cache_resource
-def init_firebase():
-    try:
-        # Try to get existing app
-        app = firebase_admin.get_app()
-    except ValueError:
-        # Initialize new app
-        try:
-            if st.secrets.get("firebase"):
-                # For Streamlit Cloud deployment
-                firebase_config = dict(st.secrets["firebase"])
-                
-                # Fix private key formatting
-                if "private_key" in firebase_config:
-                    private_key = firebase_config["private_key"]
-                    # Replace literal \n with actual newlines
-                    if "\\n" in private_key:
-                        firebase_config["private_key"] = private_key.replace("\\n", "\n")
-                
-                cred = credentials.Certificate(firebase_config)
-            else:
-                # For local development - check if file exists
-                import os
-                if os.path.exists("firebase-credentials.json"):
-                    cred = credentials.Certificate("firebase-credentials.json")
-                else:
-                    st.error("❌ Firebase credentials file not found!")
-                    st.info("Please create 'firebase-credentials.json' file with your Firebase service account key.")
-                    st.stop()
-            
-            app = firebase_admin.initialize_app(cred)
-            
-        except Exception as e:
-            st.error(f"❌ Firebase initialization failed: {str(e)}")
-            st.info("🔧 **Troubleshooting Steps:**")
-            st.info("1. Check if your Firebase service account key is valid")
-            st.info("2. Ensure private_key format is correct (with proper newlines)")
-            st.info("3. Verify project_id and other credentials")
-            st.info("4. Make sure Firestore is enabled in your Firebase project")
-            
-            # Show debug information
-            # with st.expander("🐛 Debug Information"):
-            #     if st.secrets.get("firebase"):
-            #         config_keys = list(st.secrets["firebase"].keys())
-            #         st.write("Available config keys:", config_keys)
-            #         if "private_key" in st.secrets["firebase"]:
-            #             pk = st.secrets["firebase"]["private_key"]
-            #             st.write("Private key starts with:", pk[:50] + "...")
-            #             st.write("Contains \\n?", "\\n" in pk)
-            #             st.write("Contains newlines?", "\n" in pk)
-            #     else:
-            #         st.write("No Firebase secrets found in Streamlit configuration")
-            
-            # st.stop()
-    
-    return firestore.client()
-
-# Authentication functions
-class AuthManager:
-    def __init__(self):
-        self.db = init_firebase()
-    
-    def create_user_account(self, email: str, password: str, display_name: str):
-        """Create a new user account"""
-        try:
-            user = auth.create_user(
-                email=email,
-                password=password,
-                display_name=display_name
-            )
-            return {"success": True, "user_id": user.uid}
-        except Exception as e:
-            return {"success": False, "error": str(e)}
-    
-    def verify_user_credentials(self, email: str, password: str):
-        """Verify user credentials (simplified for demo)"""
-        try:
-            # In real implementation, you'd verify password hash
-            # For now, we'll just check if user exists
-            user = auth.get_user_by_email(email)
-            return {"success": True, "user_id": user.uid, "display_name": user.display_name}
-        except Exception as e:
-            return {"success": False, "error": str(e)}
-    
-    def is_admin(self, email: str) -> bool:
-        """Check if user is admin"""
-        # Define admin emails here or in database
-        admin_emails = ["rizkyanandaalamsyahdly@gmail.com", "administrator@akademik.com"]
-        return email.lower() in admin_emails
-
-def generate_anonymous_user_id():
-    """Generate anonymous user ID"""
-    if "anonymous_user_id" not in st.session_state:
-        st.session_state.anonymous_user_id = f"anon_{uuid.uuid4().hex[:8]}"
-    return st.session_state.anonymous_user_id
-
-# Chat functions
-class ChatManager:
-    def __init__(self):
-        self.db = init_firebase()
-        self.api_url = st.secrets.get("ngrok_api_url", "YOUR_NGROK_URL_HERE")
-        self.viz_manager = DataVisualizationManager()
-    
-    def process_response_with_visualization(self, user_input: str, bot_response: str) -> Dict:
-        """Process response and create visualization if needed"""
-        viz_info = self.viz_manager.detect_data_request(user_input, bot_response)
-        
-        result = {
-            "response": bot_response,
-            "visualization": None,
-            "table": None,
-            "viz_type": None
-        }
-        
-        if viz_info["needs_visualization"] and viz_info["has_data"]:
-            data = self.viz_manager.extract_data_from_response(bot_response)
-            
-            if data:
-                if viz_info["type"] == 'table':
-                    result["table"] = self.viz_manager.create_table(data, "Data Table")
-                else:
-                    result["visualization"] = self.viz_manager.create_visualization(
-                        data, viz_info["type"], "Academic Data Visualization"
-                    )
-                    result["viz_type"] = viz_info["type"]
-        
-        return result
-    
-    def send_message_to_api(self, prompt: str) -> Dict:
-        """Send message to ngrok API"""
-        try:
-            headers = {"Content-Type": "application/json"}
-            payload = {"prompt": prompt}
-            
-            response = requests.post(f"{self.api_url}/generate", 
-                                   json=payload, headers=headers, timeout=30)
-            
-            if response.status_code == 200:
-                data = response.json()
-                return {"success": True, "response": data.get("response", "No response received")}
-            else:
-                return {"success": False, "error": f"API Error: {response.status_code}"}
-        
-        except requests.exceptions.RequestException as e:
-            return {"success": False, "error": f"Connection error: {str(e)}"}
-    
-    def save_conversation(self, user_id: str, user_input: str, bot_response: str):
-        """Save conversation to Firestore"""
-        try:
-            doc_ref = self.db.collection("conversations").document(user_id).collection("messages").document()
-            doc_ref.set({
-                "input": user_input,
-                "response": bot_response,
-                "timestamp": datetime.now(),
-                "is_anonymous": user_id.startswith("anon_")  # Track if user is anonymous
-            })
-            return True
-        except Exception as e:
-            st.error(f"Error saving conversation: {e}")
-            return False
-    
-    def get_conversation_history(self, user_id: str, page: int = 1, page_size: int = 10) -> Dict:
-        """Get paginated conversation history"""
-        try:
-            query = (self.db.collection("conversations")
-                    .document(user_id)
-                    .collection("messages")
-                    .order_by("timestamp", direction=firestore.Query.DESCENDING)
-                    .limit(page_size)
-                    .offset((page - 1) * page_size))
-            
-            docs = query.stream()
-            messages = []
-            
-            for doc in docs:
-                data = doc.to_dict()
-                messages.append({
-                    "id": doc.id,
-                    "input": data.get("input", ""),
-                    "response": data.get("response", ""),
-                    "timestamp": data.get("timestamp")
-                })
-            
-            # Get total count for pagination
-            total_docs = len(list(self.db.collection("conversations")
-                                .document(user_id)
-                                .collection("messages").stream()))
-            
-            return {
-                "success": True,
-                "messages": messages,
-                "total": total_docs,
-                "page": page,
-                "total_pages": (total_docs + page_size - 1) // page_size
-            }
-        
-        except Exception as e:
-            return {"success": False, "error": str(e)}
-    
-    def get_all_conversations(self) -> List[Dict]:
-        """Get all conversations for admin panel"""
-        try:
-            conversations = []
-            users_ref = self.db.collection("conversations")
-            
-            # Gunakan list_documents() untuk mendapatkan semua document references
-            user_doc_refs = users_ref.list_documents()
-            
-            for user_doc_ref in user_doc_refs:
-                user_id = user_doc_ref.id
-                
-                # Langsung akses subcollection messages tanpa cek parent document
-                messages_ref = user_doc_ref.collection("messages")
-                
-                # Ambil semua messages
-                messages = list(messages_ref.stream())
-                
-                for msg_doc in messages:
-                    data = msg_doc.to_dict()
-                    conversations.append({
-                        "user_id": user_id,
-                        "message_id": msg_doc.id,
-                        "input": data.get("input", ""),
-                        "response": data.get("response", ""),
-                        "timestamp": data.get("timestamp")
-                    })
-            
-            return conversations
-        
-        except Exception as e:
-            st.error(f"Error fetching conversations: {e}")
-            return []
-
-# UI Components
-def render_chat_header():
-    """Render chat header"""
-    st.markdown("""
-    <div class="chat-header">
-        <div class="chat-title">
-            <img src="https://hmpstrplpolmed.com/assets/img/logo/hmpstrpl.webp" 
-                 width="60" height="auto" alt="Logo">
-            🎓 Academic Chatbot
-        </div>
-        <div class="chat-subtitle">
-            Powered by Llama 3.1 Fine-tuned Model | Tanyakan Informasi Seputar TRPL | Informasi Dosen, Mahasiswa, RPS, Seputar Magang, Skripsi dan Lainnya
-        </div>
-    </div>
-    """, unsafe_allow_html=True)
-
-def render_typing_indicator():
-    """Render typing indicator"""
-    st.markdown("""
-    <div class="typing-indicator">
-        <div class="typing-dots">
-            <div class="typing-dot"></div>
-            <div class="typing-dot"></div>
-            <div class="typing-dot"></div>
-            <span style="margin-left: 10px; color: #666;">AI sedang mengetik...</span>
-        </div>
-    </div>
-    """, unsafe_allow_html=True)
-
-def render_message_with_viz(message: str, is_user: bool, timestamp: datetime = None, 
-                           visualization=None, table=None):
-    """Render a chat message with optional visualization"""
-    if timestamp is None:
-        timestamp = datetime.now()
-    
-    message_class = "user-message" if is_user else "bot-message"
-    time_str = timestamp.strftime("%H:%M")
-    
-    # Render text message
-    st.markdown(f"""
-    <div class="message-container">
-        <div class="{message_class}">
-            <div>{message}</div>
-            <div class="message-time">{time_str}</div>
-        </div>
-    </div>
-    """, unsafe_allow_html=True)
-    
-    # Render visualization if available
-    if not is_user:  # Only for bot messages
-        if visualization is not None:
-            st.plotly_chart(visualization, use_container_width=True)
-        
-        if table is not None:
-            st.subheader("📊 Data Table")
-            st.dataframe(table, use_container_width=True)
-
-def render_pagination(current_page: int, total_pages: int, key_prefix: str = ""):
-    """Render pagination controls"""
-    if total_pages <= 1:
-        return current_page
-    
-    col1, col2, col3, col4, col5 = st.columns([1, 1, 2, 1, 1])
-    
-    with col1:
-        if st.button("⬅️ First", key=f"{key_prefix}_first", disabled=current_page <= 1):
-            return 1
-    
-    with col2:
-        if st.button("◀️ Prev", key=f"{key_prefix}_prev", disabled=current_page <= 1):
-            return current_page - 1
-    
-    with col3:
-        st.markdown(f"<div style='text-align: center; padding: 10px;'>Page {current_page} of {total_pages}</div>", 
-                   unsafe_allow_html=True)
-    
-    with col4:
-        if st.button("Next ▶️", key=f"{key_prefix}_next", disabled=current_page >= total_pages):
-            return current_page + 1
-    
-    with col5:
-        if st.button("Last ➡️", key=f"{key_prefix}_last", disabled=current_page >= total_pages):
-            return total_pages
-    
-    return current_page
-
-def render_sidebar():
-    """Render sidebar with login/logout options"""
-    with st.sidebar:
-        if st.session_state.get("user_id"):
-            # Logged in user
-            st.markdown(f"### Welcome, {st.session_state.user_name}! 👋")
-            st.success("✅ Logged in")
-        else:
-            # Anonymous user
-            st.markdown("### 👤 Anonymous User")
-            st.info("💡 Login to save your chat history!")
-            
-            if st.button("🔑 Login", use_container_width=True):
-                st.session_state.show_login = True
-                st.rerun()
-        
-        if st.button("🔄 New Chat", use_container_width=True):
-            st.session_state.messages = []
-            st.session_state.show_history = False
-            st.rerun()
-        
-        # Chat History - only for logged in users
-        if st.session_state.get("user_id"):
-            if st.button("📚 Chat History", use_container_width=True):
-                st.session_state.show_history = not st.session_state.get("show_history", False)
-                st.rerun()
-        else:
-            if st.button("📚 Chat History", use_container_width=True, disabled=True):
-                pass
-            st.caption("Login required to view history")
-        
-        # Admin Panel - only for logged in admins
-        if st.session_state.get("is_admin", False):
-            if st.button("👨‍💼 Admin Panel", use_container_width=True):
-                st.session_state.current_page_name = "admin"
-                st.rerun()
-        
-        # Logout button - only for logged in users
-        if st.session_state.get("user_id"):
-            if st.button("🚪 Logout", use_container_width=True):
-                # Keep anonymous ID but clear login data
-                anon_id = st.session_state.get("anonymous_user_id")
-                for key in list(st.session_state.keys()):
-                    if key != "anonymous_user_id":
-                        del st.session_state[key]
-                if anon_id:
-                    st.session_state.anonymous_user_id = anon_id
-                st.rerun()
-
-# Main pages
-# def login_page():
-#     """Login/Register page"""
-#     st.markdown("<h1 style='text-align: center; color: #4682B4;'>🎓 Academic Chatbot</h1>", unsafe_allow_html=True)
-#     st.markdown("<p style='text-align: center; color: #666;'>Sign in to start chatting with our AI assistant</p>", unsafe_allow_html=True)
-    
-#     auth_manager = AuthManager()
-    
-#     tab1, tab2 = st.tabs(["Sign In", "Sign Up"])
-    
-#     with tab1:
-#         with st.form("login_form"):
-#             email = st.text_input("Email", placeholder="Enter your email")
-#             password = st.text_input("Password", type="password", placeholder="Enter your password")
-            
-#             if st.form_submit_button("Sign In", use_container_width=True):
-#                 if email and password:
-#                     result = auth_manager.verify_user_credentials(email, password)
-#                     if result["success"]:
-#                         st.session_state.user_id = result["user_id"]
-#                         st.session_state.user_email = email
-#                         st.session_state.user_name = result.get("display_name", email.split("@")[0])
-#                         st.session_state.is_admin = auth_manager.is_admin(email)
-#                         st.success("Login successful!")
-#                         st.rerun()
-#                     else:
-#                         st.error(f"Login failed: {result['error']}")
-#                 else:
-#                     st.warning("Please fill in all fields")
-    
-#     with tab2:
-#         with st.form("register_form"):
-#             reg_name = st.text_input("Full Name", placeholder="Enter your full name")
-#             reg_email = st.text_input("Email", placeholder="Enter your email")
-#             reg_password = st.text_input("Password", type="password", placeholder="Create a password")
-#             reg_confirm = st.text_input("Confirm Password", type="password", placeholder="Confirm your password")
-            
-#             if st.form_submit_button("Sign Up", use_container_width=True):
-#                 if all([reg_name, reg_email, reg_password, reg_confirm]):
-#                     if reg_password == reg_confirm:
-#                         result = auth_manager.create_user_account(reg_email, reg_password, reg_name)
-#                         if result["success"]:
-#                             st.success("Account created successfully! Please sign in.")
-#                         else:
-#                             st.error(f"Registration failed: {result['error']}")
-#                     else:
-#                         st.error("Passwords don't match")
-#                 else:
-#                     st.warning("Please fill in all fields")
-
-def show_login_modal():
-    """Show login modal for anonymous users"""
-    st.markdown("## 🔑 Login to Save Your Chat History")
-    
-    auth_manager = AuthManager()
-    
-    tab1, tab2 = st.tabs(["Sign In", "Sign Up"])
-    
-    with tab1:
-        with st.form("login_form_modal"):
-            email = st.text_input("Email", placeholder="Enter your email")
-            password = st.text_input("Password", type="password", placeholder="Enter your password")
-            
-            col1, col2 = st.columns(2)
-            with col1:
-                if st.form_submit_button("Sign In", use_container_width=True):
-                    if email and password:
-                        result = auth_manager.verify_user_credentials(email, password)
-                        if result["success"]:
-                            st.session_state.user_id = result["user_id"]
-                            st.session_state.user_email = email
-                            st.session_state.user_name = result.get("display_name", email.split("@")[0])
-                            st.session_state.is_admin = auth_manager.is_admin(email)
-                            st.session_state.show_login = False
-                            st.success("Login successful!")
-                            st.rerun()
-                        else:
-                            st.error(f"Login failed: {result['error']}")
-                    else:
-                        st.warning("Please fill in all fields")
-            
-            with col2:
-                if st.form_submit_button("Cancel", use_container_width=True):
-                    st.session_state.show_login = False
-                    st.rerun()
-    
-    with tab2:
-        with st.form("register_form_modal"):
-            reg_name = st.text_input("Full Name", placeholder="Enter your full name")
-            reg_email = st.text_input("Email", placeholder="Enter your email")
-            reg_password = st.text_input("Password", type="password", placeholder="Create a password")
-            reg_confirm = st.text_input("Confirm Password", type="password", placeholder="Confirm your password")
-            
-            col1, col2 = st.columns(2)
-            with col1:
-                if st.form_submit_button("Sign Up", use_container_width=True):
-                    if all([reg_name, reg_email, reg_password, reg_confirm]):
-                        if reg_password == reg_confirm:
-                            result = auth_manager.create_user_account(reg_email, reg_password, reg_name)
-                            if result["success"]:
-                                st.success("Account created successfully! Please sign in.")
-                            else:
-                                st.error(f"Registration failed: {result['error']}")
-                        else:
-                            st.error("Passwords don't match")
-                    else:
-                        st.warning("Please fill in all fields")
-            
-            with col2:
-                if st.form_submit_button("Cancel", use_container_width=True):
-                    st.session_state.show_login = False
-                    st.rerun()
-
-def chat_page():
-    """Main chat interface"""
-    load_css()
-    render_chat_header()
-    
-    chat_manager = ChatManager()
-    
-    # Initialize session state
-    if "messages" not in st.session_state:
-        st.session_state.messages = []
-    if "current_page" not in st.session_state:
-        st.session_state.current_page = 1
-    
-    # Get user ID (logged in or anonymous)
-    current_user_id = st.session_state.get("user_id", generate_anonymous_user_id())
-    
-    # Render sidebar
-    render_sidebar()
-    
-    # Show login modal if requested
-    if st.session_state.get("show_login", False):
-        show_login_modal()
-        return
-    
-    # Main chat area
-    if st.session_state.get("show_history", False):
-        if not st.session_state.get("user_id"):
-            st.warning("⚠️ Please login to view chat history")
-            return
-            
-        st.subheader("📚 Chat History")
-        
-        history_result = chat_manager.get_conversation_history(
-            st.session_state.user_id, 
-            st.session_state.current_page
-        )
-        
-        if history_result["success"]:
-            messages = history_result["messages"]
-            
-            if messages:
-                for msg in reversed(messages):
-                    with st.expander(f"💬 {msg['input'][:50]}... - {msg['timestamp'].strftime('%Y-%m-%d %H:%M')}"):
-                        st.markdown(f"**You:** {msg['input']}")
-                        st.markdown(f"**AI:** {msg['response']}")
-                
-                st.session_state.current_page = render_pagination(
-                    history_result["page"], 
-                    history_result["total_pages"],
-                    "history"
-                )
-            else:
-                st.info("No chat history found.")
-        else:
-            st.error(f"Error loading history: {history_result['error']}")
-        
-        return
-    
-    # Chat interface
-    st.markdown('<div class="chat-container">', unsafe_allow_html=True)
-    
-    # Display messages
-    for message in st.session_state.messages:
-        render_message_with_viz(
-            message["content"], 
-            message["role"] == "user",
-            message.get("timestamp", datetime.now()),
-            message.get("visualization"),
-            message.get("table")
-        )
-    
-    # Chat input
-    user_input = st.chat_input("Type your academic question here...")
-    
-    if user_input:
-        # Add user message
-        user_msg = {
-            "role": "user", 
-            "content": user_input, 
-            "timestamp": datetime.now()
-        }
-        st.session_state.messages.append(user_msg)
-        
-        # Show typing indicator
-        with st.empty():
-            render_typing_indicator()
-            time.sleep(1)
-            
-            # Get AI response
-            result = chat_manager.send_message_to_api(user_input)
-            
-            if result["success"]:
-                bot_response = result["response"]
-                
-                # Process for visualization
-                processed_result = chat_manager.process_response_with_visualization(
-                    user_input, bot_response
-                )
-                
-                # Add bot message with visualization data
-                bot_msg = {
-                    "role": "assistant", 
-                    "content": processed_result["response"], 
-                    "timestamp": datetime.now(),
-                    "visualization": processed_result["visualization"],
-                    "table": processed_result["table"]
-                }
-                st.session_state.messages.append(bot_msg)
-                
-                # Save to database (works for both logged in and anonymous users)
-                chat_manager.save_conversation(
-                    current_user_id, 
-                    user_input, 
-                    bot_response
-                )
-            else:
-                error_msg = {
-                    "role": "assistant", 
-                    "content": f"Sorry, I encountered an error: {result['error']}", 
-                    "timestamp": datetime.now()
-                }
-                st.session_state.messages.append(error_msg)
-        
-        st.rerun()
-    
-    st.markdown('</div>', unsafe_allow_html=True)
-
-def admin_page():
-    """Admin panel for viewing all conversations"""
-    st.title("👨‍💼 Admin Panel")
-    
-    chat_manager = ChatManager()
-    
-    # Back button
-    if st.button("⬅️ Back to Chat"):
-        st.session_state.current_page_name = "chat"
-        st.rerun()
-    
-    st.subheader("📊 All Conversations")
-    
-    # Tambahkan debug info
-    # with st.expander("🐛 Debug Info"):
-    #     try:
-    #         # Debug 1: Cek semua collections di root level
-    #         collections = chat_manager.db.collections()
-    #         st.write("Available collections:")
-    #         for collection in collections:
-    #             st.write(f"- {collection.id}")
-            
-    #         # Debug 2: Cek apakah ada data di collection conversations
-    #         conversations_ref = chat_manager.db.collection("conversations")
-            
-    #         # Coba ambil semua documents (termasuk yang tidak ada parent doc)
-    #         all_docs = list(conversations_ref.list_documents())
-    #         st.write(f"Documents in conversations collection: {len(all_docs)}")
-            
-    #         # Debug 3: Cek setiap document
-    #         for doc_ref in all_docs:
-    #             st.write(f"Document ID: {doc_ref.id}")
-                
-    #             # Cek apakah document benar-benar ada
-    #             doc_snapshot = doc_ref.get()
-    #             if doc_snapshot.exists:
-    #                 st.write(f"  - Document exists with data: {doc_snapshot.to_dict()}")
-    #             else:
-    #                 st.write(f"  - Document doesn't exist (only subcollections)")
-                
-    #             # Cek subcollections
-    #             subcollections = doc_ref.collections()
-    #             for subcoll in subcollections:
-    #                 subcoll_docs = list(subcoll.stream())
-    #                 st.write(f"  - Subcollection '{subcoll.id}': {len(subcoll_docs)} messages")
-            
-    #         # Debug 4: Langsung cek method save_conversation
-    #         st.write(f"Current user_id: {st.session_state.get('user_id', 'Not set')}")
-            
-    #     except Exception as e:
-    #         st.error(f"Debug error: {e}")
-    #         import traceback
-    #         st.code(traceback.format_exc())
-            
-    # Get all conversations
-    conversations = chat_manager.get_all_conversations()
-    
-    if conversations:
-        # Convert to DataFrame
-        df = pd.DataFrame(conversations)
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-        df = df.sort_values('timestamp', ascending=False)
-        
-        # Stats
-        col1, col2, col3 = st.columns(3)
-        with col1:
-            st.metric("Total Messages", len(conversations))
-        with col2:
-            st.metric("Unique Users", df['user_id'].nunique())
-        with col3:
-            st.metric("Today's Messages", 
-                     len(df[df['timestamp'].dt.date == datetime.now().date()]))
-        
-        # Export button
-        if st.button("📥 Export Data"):
-            csv = df.to_csv(index=False)
-            st.download_button(
-                label="Download CSV",
-                data=csv,
-                file_name=f"conversations_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                mime="text/csv"
-            )
-        
-        # Display conversations
-        st.subheader("Recent Conversations")
-        
-        # Pagination for admin view
-        page_size = 20
-        total_pages = (len(df) + page_size - 1) // page_size
-        
-        if "admin_page" not in st.session_state:
-            st.session_state.admin_page = 1
-        
-        start_idx = (st.session_state.admin_page - 1) * page_size
-        end_idx = start_idx + page_size
-        page_df = df.iloc[start_idx:end_idx]
-        
-        for _, row in page_df.iterrows():
-            with st.expander(f"👤 {row['user_id'][:8]}... - {row['timestamp'].strftime('%Y-%m-%d %H:%M:%S')}"):
-                st.markdown(f"**User Input:** {row['input']}")
-                st.markdown(f"**AI Response:** {row['response']}")
-                st.markdown(f"**Timestamp:** {row['timestamp']}")
-        
-        # Admin pagination
-        st.session_state.admin_page = render_pagination(
-            st.session_state.admin_page, 
-            total_pages,
-            "admin"
-        )
-        
-    else:
-        st.info("No conversations found.")
-
-# Main app
-def main():
-    load_css()
-    
-    # Initialize anonymous user ID jika belum ada user_id
-    if "user_id" not in st.session_state:
-        generate_anonymous_user_id()
-    
-    # Route to appropriate page
-    current_page = st.session_state.get("current_page_name", "chat")
-    
-    if current_page == "admin" and st.session_state.get("is_admin", False):
-        admin_page()
-    else:
-        chat_page()
-
-if __name__ == "__main__":
-    main()
+# main.py
+import streamlit as st
+import firebase_admin
+from firebase_admin import credentials, firestore, auth
+import requests
+import json
+import time
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Dict, List, Optional
+import uuid
+import re
+import os
+import random
+import math
+import threading
+import atexit
+import functools
+import glob
+from abc import ABC, abstractmethod
+import tempfile
+import queue
+import logging
+import csv
+import gzip
+import hashlib
+import sqlite3
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+if TYPE_CHECKING:
+    # pandas is imported lazily where it is used; this only resolves the annotations
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Page configuration
+st.set_page_config(
+    page_title="Academic Chatbot",
+    page_icon="🎓",
+    layout="wide",
+    initial_sidebar_state="expanded"
+)
+
+# Configuration helpers
+def get_setting(key: str, default=None):
+    """Read a setting from Streamlit secrets, falling back to environment variables"""
+    try:
+        if key in st.secrets:
+            return st.secrets[key]
+    except FileNotFoundError:
+        # No secrets.toml available (local scripts, benchmarks)
+        pass
+    
+    env_value = os.environ.get(key.upper())
+    if env_value is None:
+        return default
+    
+    # Cast environment strings to the type of the default value
+    if isinstance(default, bool):
+        return env_value.strip().lower() in ("1", "true", "yes", "on")
+    if isinstance(default, int):
+        return int(env_value)
+    if isinstance(default, float):
+        return float(env_value)
+    return env_value
+
+# Custom CSS for modern chat UI
+def load_css():
+    st.markdown("""
+    <style>
+    /* Main theme colors - Sky Blue */
+    :root {
+        --primary-color: #a600ff;
+        --secondary-color: #4682B4;
+        --accent-color: #1E90FF;
+        --background-color: #F0F8FF;
+        --text-color: #1cd8d8;
+        --chat-bg: #FFFFFF;
+        --user-msg-bg: #a600ff;
+        --bot-msg-bg: #4682B4;
+    }
+    
+    /* Hide default Streamlit elements */
+    #MainMenu {visibility: hidden;}
+    footer {visibility: hidden;}
+    header {visibility: hidden;}
+    
+    /* Main container styling */
+    .main-container {
+        background: linear-gradient(135deg, #F0F8FF 0%, #E6F3FF 100%);
+        min-height: 100vh;
+        padding: 0;
+    }
+    
+    /* Header styling */
+    .chat-header {
+        background: linear-gradient(90deg, var(--primary-color), var(--secondary-color));
+        padding: 1rem 2rem;
+        border-radius: 0 0 20px 20px;
+        margin-bottom: 2rem;
+        box-shadow: 0 4px 12px rgba(0,0,0,0.1);
+    }
+    
+    .chat-title {
+        color: white;
+        font-size: 2rem;
+        font-weight: 700;
+        margin: 0;
+        display: flex;
+        align-items: center;
+        gap: 10px;
+    }
+    
+    .chat-subtitle {
+        color: rgba(255,255,255,0.9);
+        font-size: 1rem;
+        margin: 0;
+        margin-top: 5px;
+    }
+    
+    /* Chat container */
+    .chat-container {
+        max-width: 800px;
+        margin: 0 auto;
+        padding: 0 1rem;
+    }
+    
+    /* Message styling */
+    .message-container {
+        margin-bottom: 1rem;
+        animation: fadeIn 0.3s ease-in;
+    }
+    
+    .user-message {
+        background: var(--user-msg-bg);
+        border: 1px solid var(--primary-color);
+        border-radius: 18px 18px 5px 18px;
+        padding: 12px 16px;
+        margin-left: 20%;
+        position: relative;
+    }
+    
+    .bot-message {
+        background: var(--bot-msg-bg);
+        border: 1px solid #E0E0E0;
+        border-radius: 18px 18px 18px 5px;
+        padding: 12px 16px;
+        margin-right: 20%;
+        position: relative;
+    }
+    
+    .message-time {
+        font-size: 0.75rem;
+        color: #888;
+        margin-top: 5px;
+        text-align: right;
+    }
+    
+    .bot-message .message-time {
+        text-align: left;
+    }
+    
+    /* Typing indicator */
+    .typing-indicator {
+        background: var(--bot-msg-bg);
+        border: 1px solid #E0E0E0;
+        border-radius: 18px 18px 18px 5px;
+        padding: 12px 16px;
+        margin-right: 20%;
+        margin-bottom: 1rem;
+    }
+    
+    .typing-dots {
+        display: flex;
+        gap: 4px;
+        align-items: center;
+    }
+    
+    .typing-dot {
+        width: 8px;
+        height: 8px;
+        border-radius: 50%;
+        background-color: var(--secondary-color);
+        animation: typingDot 1.4s infinite ease-in-out;
+    }
+    
+    .typing-dot:nth-child(1) { animation-delay: -0.32s; }
+    .typing-dot:nth-child(2) { animation-delay: -0.16s; }
+    
+    @keyframes typingDot {
+        0%, 80%, 100% { transform: scale(0.8); opacity: 0.5; }
+        40% { transform: scale(1); opacity: 1; }
+    }
+    
+    @keyframes fadeIn {
+        from { opacity: 0; transform: translateY(10px); }
+        to { opacity: 1; transform: translateY(0); }
+    }
+    
+    /* Input styling */
+    .stTextInput > div > div > input {
+        border-radius: 25px;
+        border: 2px solid var(--primary-color);
+        padding: 12px 20px;
+        font-size: 1rem;
+    }
+    
+    .stTextInput > div > div > input:focus {
+        border-color: var(--secondary-color);
+        box-shadow: 0 0 0 2px rgba(70, 130, 180, 0.2);
+    }
+    
+    /* Button styling */
+    .stButton > button {
+        background: linear-gradient(90deg, var(--primary-color), var(--secondary-color));
+        color: white;
+        border: none;
+        border-radius: 25px;
+        padding: 12px 24px;
+        font-weight: 600;
+        transition: all 0.3s ease;
+    }
+    
+    .stButton > button:hover {
+        transform: translateY(-2px);
+        box-shadow: 0 4px 12px rgba(0,0,0,0.2);
+    }
+    
+    /* Sidebar styling */
+    .css-1d391kg {
+        background: linear-gradient(180deg, var(--background-color), white);
+    }
+    
+    /* Pagination */
+    .pagination-container {
+        display: flex;
+        justify-content: center;
+        align-items: center;
+        gap: 10px;
+        margin: 20px 0;
+    }
+    
+    .pagination-btn {
+        background: var(--primary-color);
+        color: white;
+        border: none;
+        border-radius: 20px;
+        padding: 8px 16px;
+        cursor: pointer;
+        transition: all 0.3s ease;
+    }
+    
+    .pagination-btn:hover {
+        background: var(--secondary-color);
+    }
+    
+    .pagination-btn:disabled {
+        background: #ccc;
+        cursor: not-allowed;
+    }
+    </style>
+    """, unsafe_allow_html=True)
+
+class DataVisualizationManager:
+    def __init__(self):
+        pass
+    
+    def detect_data_request(self, user_input: str, bot_response: str) -> Dict:
+        """Detect if user is asking for data visualization"""
+        viz_keywords = [
+            'grafik', 'chart', 'plot', 'visualisasi', 'tabel', 'table',
+            'diagram', 'statistik', 'data', 'perbandingan', 'trend'
+        ]
+        
+        user_lower = user_input.lower()
+        response_lower = bot_response.lower()
+        
+        # Check if user asking for visualization
+        needs_viz = any(keyword in user_lower for keyword in viz_keywords)
+        
+        # Check if response contains structured data
+        has_numbers = bool(re.search(r'\d+', bot_response))
+        has_lists = '1.' in bot_response or '2.' in bot_response or '-' in bot_response
+        
+        return {
+            "needs_visualization": needs_viz,
+            "has_data": has_numbers and has_lists,
+            "type": self._determine_viz_type(user_input, bot_response)
+        }
+    
+    def _determine_viz_type(self, user_input: str, bot_response: str) -> str:
+        """Determine what type of visualization to create"""
+        user_lower = user_input.lower()
+        
+        if any(word in user_lower for word in ['perbandingan', 'compare', 'vs']):
+            return 'comparison'
+        elif any(word in user_lower for word in ['trend', 'waktu', 'time', 'tahun']):
+            return 'timeline'
+        elif any(word in user_lower for word in ['distribusi', 'percentage', 'persen']):
+            return 'pie'
+        elif any(word in user_lower for word in ['tabel', 'table', 'list']):
+            return 'table'
+        else:
+            return 'bar'
+    
+    def extract_data_from_response(self, response: str) -> List[Dict]:
+        """Extract structured data from AI response"""
+        lines = response.split('\n')
+        data = []
+        
+        for line in lines:
+            # Look for patterns like "1. Item: Value" or "- Item: Value"
+            pattern = r'(?:\d+\.\s*|-\s*)([^:]+):\s*(.+)'
+            match = re.search(pattern, line)
+            
+            if match:
+                label = match.group(1).strip()
+                value_text = match.group(2).strip()
+                
+                # Try to extract numbers
+                number_match = re.search(r'(\d+(?:\.\d+)?)', value_text)
+                if number_match:
+                    value = float(number_match.group(1))
+                    data.append({"label": label, "value": value, "description": value_text})
+        
+        return data
+    
+    def create_visualization(self, data: List[Dict], viz_type: str, title: str = "Data Visualization"):
+        """Create visualization based on data and type"""
+        if not data:
+            return None
+
+        # Imported lazily - most sessions never render a chart
+        import pandas as pd
+        import plotly.express as px
+
+        df = pd.DataFrame(data)
+
+        if viz_type == 'bar':
+            fig = px.bar(df, x='label', y='value', title=title,
+                        color='value', color_continuous_scale='Blues')
+            fig.update_layout(xaxis_tickangle=-45)
+            
+        elif viz_type == 'pie':
+            fig = px.pie(df, values='value', names='label', title=title)
+            
+        elif viz_type == 'comparison':
+            fig = px.bar(df, x='label', y='value', title=title,
+                        color='label', color_discrete_sequence=px.colors.qualitative.Set3)
+            
+        elif viz_type == 'timeline':
+            fig = px.line(df, x='label', y='value', title=title,
+                         markers=True, line_shape='spline')
+            
+        else:  # default bar
+            fig = px.bar(df, x='label', y='value', title=title)
+        
+        # Customize layout
+        fig.update_layout(
+            template='plotly_white',
+            height=400,
+            margin=dict(t=50, l=50, r=50, b=50)
+        )
+        
+        return fig
+    
+    def create_table(self, data: List[Dict], title: str = "Data Table"):
+        """Create a formatted table from data"""
+        if not data:
+            return None
+
+        import pandas as pd
+        df = pd.DataFrame(data)
+        return df
+
+# Firebase initialization
+@st.cache_resource
+def init_firebase():
+    try:
+        # Try to get existing app
+        app = firebase_admin.get_app()
+    except ValueError:
+        # Initialize new app
+        try:
+            if st.secrets.get("firebase"):
+                # For Streamlit Cloud deployment
+                firebase_config = dict(st.secrets["firebase"])
+                
+                # Fix private key formatting
+                if "private_key" in firebase_config:
+                    private_key = firebase_config["private_key"]
+                    # Replace literal \n with actual newlines
+                    if "\\n" in private_key:
+                        firebase_config["private_key"] = private_key.replace("\\n", "\n")
+                
+                cred = credentials.Certificate(firebase_config)
+            else:
+                # For local development - check if file exists
+                import os
+                if os.path.exists("firebase-credentials.json"):
+                    cred = credentials.Certificate("firebase-credentials.json")
+                else:
+                    st.error("❌ Firebase credentials file not found!")
+                    st.info("Please create 'firebase-credentials.json' file with your Firebase service account key.")
+                    st.stop()
+            
+            app = firebase_admin.initialize_app(cred)
+            
+        except Exception as e:
+            st.error(f"❌ Firebase initialization failed: {str(e)}")
+            st.info("🔧 **Troubleshooting Steps:**")
+            st.info("1. Check if your Firebase service account key is valid")
+            st.info("2. Ensure private_key format is correct (with proper newlines)")
+            st.info("3. Verify project_id and other credentials")
+            st.info("4. Make sure Firestore is enabled in your Firebase project")
+            
+            # Show debug information
+            # with st.expander("🐛 Debug Information"):
+            #     if st.secrets.get("firebase"):
+            #         config_keys = list(st.secrets["firebase"].keys())
+            #         st.write("Available config keys:", config_keys)
+            #         if "private_key" in st.secrets["firebase"]:
+            #             pk = st.secrets["firebase"]["private_key"]
+            #             st.write("Private key starts with:", pk[:50] + "...")
+            #             st.write("Contains \\n?", "\\n" in pk)
+            #             st.write("Contains newlines?", "\n" in pk)
+            #     else:
+            #         st.write("No Firebase secrets found in Streamlit configuration")
+            
+            # st.stop()
+    
+    return firestore.client()
+
+# LLM backend client
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised when the backend is skipped because the circuit breaker is open"""
+
+class CircuitBreaker:
+    """Fail fast while the backend is down, probe again after a cool-down"""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow_request(self) -> bool:
+        """Check whether a request may go to the backend"""
+        with self.lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self.trial_in_flight:
+                # Let a single trial request through
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.consecutive_failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.consecutive_failures += 1
+            if self.trial_in_flight or self.consecutive_failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self.trial_in_flight = False
+
+class LLMBackend:
+    """One model server of the pool: circuit breaker, load and latency estimate"""
+
+    def __init__(self, base_url: str, breaker_threshold: int = 5, breaker_reset: float = 30.0,
+                 ewma_alpha: float = 0.3):
+        self.base_url = base_url.rstrip("/")
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_reset)
+        self.ewma_alpha = ewma_alpha
+        self.ewma_latency = None
+        self.outstanding = 0
+        self.healthy = True
+        self.last_health_check = None
+        self.last_health_error = None
+        self.lock = threading.Lock()
+        self.counters = {"requests": 0, "failures": 0, "ejections": 0, "readmissions": 0}
+
+    def available(self) -> bool:
+        """Passing health checks and not ejected by its circuit breaker"""
+        return self.healthy and self.breaker.state != "open"
+
+    def load_score(self, routing: str) -> tuple:
+        """Lower is better"""
+        latency = self.ewma_latency or 0.0
+        if routing == "ewma":
+            # Expected wait: smoothed latency scaled by the requests already queued
+            return (latency * (self.outstanding + 1), self.outstanding)
+        return (self.outstanding, latency)
+
+    def begin(self):
+        with self.lock:
+            self.outstanding += 1
+            self.counters["requests"] += 1
+
+    def end(self):
+        with self.lock:
+            self.outstanding = max(self.outstanding - 1, 0)
+
+    def record_latency(self, seconds: float):
+        with self.lock:
+            if self.ewma_latency is None:
+                self.ewma_latency = seconds
+            else:
+                self.ewma_latency += self.ewma_alpha * (seconds - self.ewma_latency)
+
+    def record_failure(self):
+        was_available = self.available()
+        self.breaker.record_failure()
+        with self.lock:
+            self.counters["failures"] += 1
+            if was_available and not self.available():
+                self.counters["ejections"] += 1
+
+    def set_health(self, ok: bool, error: Optional[str] = None):
+        """Apply an active health check result, ejecting or readmitting the backend"""
+        was_available = self.available()
+        if ok and not was_available:
+            # Answering health checks again - readmit without waiting for the breaker cool-down
+            self.breaker.record_success()
+        with self.lock:
+            self.last_health_check = datetime.now()
+            self.last_health_error = error
+            self.healthy = ok
+            if was_available and not ok:
+                self.counters["ejections"] += 1
+            elif ok and not was_available:
+                self.counters["readmissions"] += 1
+
+    def stats(self) -> Dict:
+        with self.lock:
+            stats = dict(self.counters)
+            stats.update({
+                "url": self.base_url,
+                "healthy": self.healthy,
+                "outstanding": self.outstanding,
+                "ewma_ms": self.ewma_latency * 1000 if self.ewma_latency is not None else None,
+                "last_health_error": self.last_health_error
+            })
+        stats["circuit_state"] = self.breaker.state
+        return stats
+
+class LLMClient:
+    """Pooled keep-alive HTTP client routing requests over one or more model backends"""
+
+    # Gateway errors from the tunnel mean the request never reached the model
+    RETRY_STATUS_CODES = (502, 503, 504)
+    ROUTING_POLICIES = ("least_outstanding", "ewma")
+
+    def __init__(self, base_urls, pool_size: int = 10, max_retries: int = 2,
+                 backoff_base: float = 0.5, backoff_max: float = 4.0, timeout: float = 30,
+                 breaker_threshold: int = 5, breaker_reset: float = 30.0,
+                 routing: str = "least_outstanding", health_check_interval: float = 10.0,
+                 health_path: str = "/health"):
+        if isinstance(base_urls, str):
+            base_urls = [base_urls]
+        if routing not in self.ROUTING_POLICIES:
+            raise ValueError(f"Unknown llm_routing: {routing}")
+        self.backends = [LLMBackend(url, breaker_threshold, breaker_reset) for url in base_urls]
+        self.base_url = self.backends[0].base_url
+        self.routing = routing
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.health_path = health_path
+
+        self.session = requests.Session()
+        # One keep-alive pool per backend host
+        self.adapter = requests.adapters.HTTPAdapter(
+            pool_connections=len(self.backends), pool_maxsize=pool_size, max_retries=0
+        )
+        self.session.mount("http://", self.adapter)
+        self.session.mount("https://", self.adapter)
+
+        self.lock = threading.Lock()
+        self.counters = {
+            "requests": 0,
+            "retries": 0,
+            "failures": 0,
+            "circuit_rejections": 0,
+            "last_request_reused_connection": False
+        }
+
+        # Active health checks only matter when there is another backend to route to
+        self.stopping = threading.Event()
+        if len(self.backends) > 1 and health_check_interval > 0:
+            self.health_check_interval = health_check_interval
+            threading.Thread(target=self._health_loop, name="llm-health-check", daemon=True).start()
+
+    def _count(self, name: str, amount: int = 1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def _backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _pool_counters(self) -> tuple:
+        """Total (connections opened, requests sent) across the urllib3 pools"""
+        pools = self.adapter.poolmanager.pools
+        opened = sent = 0
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                opened += pool.num_connections
+                sent += pool.num_requests
+        return opened, sent
+
+    def _choose_backend(self, exclude) -> Optional[LLMBackend]:
+        """Pick the least loaded available backend that its breaker lets through"""
+        candidates = [b for b in self.backends if b not in exclude and b.available()]
+        if not candidates:
+            # Nothing known-good left - let the breakers decide (keeps a lone backend usable)
+            candidates = [b for b in self.backends if b not in exclude] or list(self.backends)
+
+        # Shuffle first so equally loaded backends share the traffic
+        random.shuffle(candidates)
+        for backend in sorted(candidates, key=lambda b: b.load_score(self.routing)):
+            if backend.breaker.allow_request():
+                return backend
+        return None
+
+    def _track(self, response: requests.Response, backend: LLMBackend, stream: bool,
+               start: float) -> requests.Response:
+        """Keep a streamed request outstanding on its backend until the body is closed"""
+        if not stream:
+            backend.record_latency(time.perf_counter() - start)
+            backend.end()
+            return response
+
+        close = response.close
+        released = threading.Event()
+
+        def close_and_release():
+            try:
+                close()
+            finally:
+                if not released.is_set():
+                    released.set()
+                    # Streamed headers arrive at once - the generation time is what routing needs
+                    backend.record_latency(time.perf_counter() - start)
+                    backend.end()
+
+        response.close = close_and_release
+        # Lets the stream reader count a connection lost mid-answer against this backend
+        response.record_failure = lambda: self._record_failure(backend)
+        return response
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        """POST to a backend with bounded retries, failover and circuit breaking"""
+        kwargs.setdefault("timeout", self.timeout)
+        tried = set()
+        backend = None
+
+        for attempt in range(self.max_retries + 1):
+            # Retries prefer a backend that has not failed this request yet
+            chosen = self._choose_backend(tried)
+            if chosen is None:
+                if backend is None:
+                    self._count("circuit_rejections")
+                    raise CircuitOpenError("Model backend is unavailable, please try again shortly")
+                chosen = backend
+            backend = chosen
+            tried.add(backend)
+            if attempt == 0:
+                self._count("requests")
+
+            connections_before, _ = self._pool_counters()
+            backend.begin()
+            start = time.perf_counter()
+            handed_off = False
+            try:
+                try:
+                    response = self.session.post(f"{backend.base_url}{path}", **kwargs)
+                except requests.exceptions.ConnectionError:
+                    if attempt >= self.max_retries:
+                        self._record_failure(backend)
+                        raise
+                    backend.record_failure()
+                    self._count("retries")
+                    time.sleep(self._backoff(attempt))
+                    continue
+                except Exception:
+                    # ReadTimeout (the model may still be generating - not safe to resend), bad
+                    # URLs, redirect loops: still a failure, or a half-open trial would never end
+                    self._record_failure(backend)
+                    raise
+
+                with self.lock:
+                    self.counters["last_request_reused_connection"] = self._pool_counters()[0] == connections_before
+
+                if response.status_code in self.RETRY_STATUS_CODES and attempt < self.max_retries:
+                    response.close()
+                    backend.record_failure()
+                    self._count("retries")
+                    time.sleep(self._backoff(attempt))
+                    continue
+
+                if response.status_code >= 500:
+                    self._record_failure(backend)
+                else:
+                    backend.breaker.record_success()
+                handed_off = True
+                return self._track(response, backend, kwargs.get("stream", False), start)
+            finally:
+                if not handed_off:
+                    backend.end()
+
+    def _record_failure(self, backend: LLMBackend):
+        self._count("failures")
+        backend.record_failure()
+
+    def _health_loop(self):
+        while not self.stopping.wait(self.health_check_interval):
+            self.check_health()
+
+    def check_health(self):
+        """Probe every backend; any HTTP answer below 500 counts as alive"""
+        for backend in self.backends:
+            try:
+                response = self.session.get(f"{backend.base_url}{self.health_path}",
+                                            timeout=min(5.0, self.timeout))
+                response.close()
+                ok = response.status_code < 500
+                error = None if ok else f"HTTP {response.status_code}"
+            except requests.exceptions.RequestException as e:
+                ok, error = False, str(e)
+            backend.set_health(ok, error)
+
+    def stats(self) -> Dict:
+        """Connection reuse and failure metrics"""
+        opened, sent = self._pool_counters()
+        with self.lock:
+            stats = dict(self.counters)
+
+        states = [backend.breaker.state for backend in self.backends]
+        stats["connections_opened"] = opened
+        stats["connections_reused"] = max(sent - opened, 0)
+        # Closed while any backend still takes traffic
+        stats["circuit_state"] = next(state for state in ("closed", "half_open", "open") if state in states)
+        stats["consecutive_failures"] = min(backend.breaker.consecutive_failures for backend in self.backends)
+        stats["healthy_backends"] = sum(backend.available() for backend in self.backends)
+        stats["backends"] = len(self.backends)
+        return stats
+
+    def backend_stats(self) -> List[Dict]:
+        return [backend.stats() for backend in self.backends]
+
+def get_backend_urls() -> List[str]:
+    """ngrok_api_urls (list or comma separated), falling back to ngrok_api_url"""
+    urls = get_setting("ngrok_api_urls", [])
+    if isinstance(urls, str):
+        urls = urls.split(",")
+    urls = [url.strip() for url in urls if url and url.strip()]
+    return urls or [get_setting("ngrok_api_url", "YOUR_NGROK_URL_HERE")]
+
+@st.cache_resource
+def get_llm_client() -> LLMClient:
+    """Process-wide pooled client shared by all sessions"""
+    return LLMClient(
+        get_backend_urls(),
+        pool_size=get_setting("llm_pool_size", 10),
+        max_retries=get_setting("llm_max_retries", 2),
+        backoff_base=get_setting("llm_backoff_base", 0.5),
+        timeout=get_setting("llm_timeout", 30),
+        breaker_threshold=get_setting("llm_breaker_threshold", 5),
+        breaker_reset=get_setting("llm_breaker_reset", 30.0),
+        routing=get_setting("llm_routing", "least_outstanding"),
+        health_check_interval=get_setting("llm_health_interval", 10.0),
+        health_path=get_setting("llm_health_path", "/health")
+    )
+
+# Answer cache
+def normalize_prompt(prompt: str) -> str:
+    """Fold case, punctuation and whitespace so repeated questions share a key"""
+    text = re.sub(r"[^\w\s]", " ", prompt.casefold())
+    return " ".join(text.split())
+
+class ResponseCache:
+    """LRU cache with TTL for backend answers, optionally persisted to disk"""
+
+    def __init__(self, max_entries: int = 1000, ttl: float = 86400, path: str = "",
+                 persist_interval: float = 30.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.persist_interval = persist_interval
+        self.entries = OrderedDict()
+        # Normalized prompt -> keys of its answers under every context scope
+        self.scopes = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self.last_persist = 0.0
+        self.dirty = False
+
+        if self.path:
+            self._load()
+            atexit.register(self.persist)
+
+    def _key(self, prompt: str, scope: str = "") -> str:
+        key = normalize_prompt(prompt)
+        # Answers given with conversation context are only reused under the same context
+        return f"{key}#{scope}" if key and scope else key
+
+    def _index(self, key: str, entry: Dict):
+        self.scopes.setdefault(normalize_prompt(entry["prompt"]), set()).add(key)
+
+    def _drop(self, key: str):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        prompt = normalize_prompt(entry["prompt"])
+        keys = self.scopes.get(prompt)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.scopes[prompt]
+
+    def get(self, prompt: str, scope: str = "") -> Optional[str]:
+        """Return the cached answer for a prompt, or None"""
+        key = self._key(prompt, scope)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and time.time() - entry["created"] > self.ttl:
+                self._drop(key)
+                self.dirty = True
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            self.saved_seconds += entry["latency"]
+            return entry["response"]
+
+    def put(self, prompt: str, response: str, latency: float = 0.0, scope: str = ""):
+        """Store an answer along with the backend time it took to produce"""
+        key = self._key(prompt, scope)
+        if not key:
+            return
+
+        with self.lock:
+            self._drop(key)
+            entry = {
+                "prompt": prompt,
+                "response": response,
+                "created": time.time(),
+                "latency": latency
+            }
+            self.entries[key] = entry
+            self._index(key, entry)
+            while len(self.entries) > self.max_entries:
+                self._drop(next(iter(self.entries)))
+            self.dirty = True
+
+        if self.path and time.monotonic() - self.last_persist >= self.persist_interval:
+            self.persist()
+
+    def invalidate(self, prompt: str) -> int:
+        """Drop the cached answers of a prompt under every context scope"""
+        with self.lock:
+            keys = list(self.scopes.get(normalize_prompt(prompt), ()))
+            for key in keys:
+                self._drop(key)
+            self.dirty = self.dirty or bool(keys)
+        if keys and self.path:
+            self.persist()
+        return len(keys)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.scopes.clear()
+            self.dirty = True
+        if self.path:
+            self.persist()
+
+    def cached_prompts(self) -> List[str]:
+        """Original prompts of cached entries, most recently used first"""
+        with self.lock:
+            prompts = {}
+            for entry in reversed(self.entries.values()):
+                prompts.setdefault(normalize_prompt(entry["prompt"]), entry["prompt"])
+            return list(prompts.values())
+
+    def stats(self) -> Dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "saved_seconds": self.saved_seconds
+            }
+
+    def persist(self):
+        """Write the cache to disk atomically"""
+        with self.lock:
+            if not self.dirty:
+                return
+            snapshot = list(self.entries.items())
+            self.dirty = False
+            self.last_persist = time.monotonic()
+
+        try:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            with tempfile.NamedTemporaryFile("w", dir=directory, delete=False, encoding="utf-8") as tmp:
+                json.dump(snapshot, tmp)
+            os.replace(tmp.name, self.path)
+        except OSError:
+            # Disk persistence is best effort - the in-memory cache keeps working
+            with self.lock:
+                self.dirty = True
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        now = time.time()
+        for key, entry in snapshot[-self.max_entries:]:
+            if now - entry["created"] <= self.ttl:
+                self.entries[key] = entry
+                self._index(key, entry)
+
+@st.cache_resource
+def get_answer_cache() -> ResponseCache:
+    """Process-wide answer cache shared by all sessions"""
+    return ResponseCache(
+        max_entries=get_setting("answer_cache_size", 1000),
+        ttl=get_setting("answer_cache_ttl", 86400),
+        path=get_setting("answer_cache_path", "")
+    )
+
+# Request coalescing
+class InFlightCall:
+    """One upstream request that identical concurrent prompts wait on"""
+
+    __slots__ = ("event", "result", "stream", "started")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.stream = None
+        self.started = time.monotonic()
+
+class SharedStream:
+    """Replay one upstream chunk stream to any number of readers"""
+
+    def __init__(self, source, on_done=None):
+        self.source = iter(source)
+        self.on_done = on_done
+        self.chunks = []
+        self.done = False
+        # Set when every reader left before the source ended - the replayed answer is incomplete
+        self.aborted = False
+        self.readers = 0
+        self.lock = threading.Lock()
+
+    def _finish(self):
+        self.done = True
+        if self.on_done is not None:
+            self.on_done()
+
+    def __iter__(self):
+        return SharedStreamReader(self)
+
+    def _chunk(self, index: int) -> str:
+        with self.lock:
+            if index >= len(self.chunks):
+                if self.done:
+                    raise StopIteration
+                # Whoever reaches the end first pulls the next chunk for everyone
+                try:
+                    self.chunks.append(next(self.source))
+                except StopIteration:
+                    self._finish()
+                    raise
+                except Exception:
+                    self._finish()
+                    raise
+            return self.chunks[index]
+
+    def _join(self):
+        with self.lock:
+            self.readers += 1
+
+    def _leave(self):
+        """Close the upstream response once the last reader is gone (rerun, New Chat, closed tab)"""
+        with self.lock:
+            self.readers -= 1
+            if self.readers or self.done:
+                return
+            self.aborted = True
+            try:
+                close = getattr(self.source, "close", None)
+                if close is not None:
+                    close()
+            finally:
+                self._finish()
+
+class SharedStreamReader:
+    """One reader's position in a SharedStream; closing it, or dropping it, leaves the stream"""
+
+    def __init__(self, shared: SharedStream):
+        self.shared = shared
+        self.index = 0
+        self.closed = False
+        shared._join()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        if self.closed:
+            raise StopIteration
+        try:
+            chunk = self.shared._chunk(self.index)
+        except BaseException:
+            self.close()
+            raise
+        self.index += 1
+        return chunk
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.shared._leave()
+
+    def __del__(self):
+        self.close()
+
+class SingleFlight:
+    """Attach concurrent identical prompts to a single in-flight backend request"""
+
+    def __init__(self, max_age: float = 120.0):
+        # A call older than this is not joined, in case its leader went away
+        self.max_age = max_age
+        self.calls = {}
+        self.lock = threading.Lock()
+        self.counters = {"leaders": 0, "coalesced": 0, "follower_timeouts": 0}
+
+    def join(self, key) -> tuple:
+        """Return (call, is_leader); the leader must publish a result"""
+        with self.lock:
+            call = self.calls.get(key)
+            if call is not None and time.monotonic() - call.started < self.max_age:
+                self.counters["coalesced"] += 1
+                return call, False
+            call = self.calls[key] = InFlightCall()
+            self.counters["leaders"] += 1
+            return call, True
+
+    def publish(self, key, call: InFlightCall, result: Dict, stream: Optional[SharedStream] = None):
+        """Hand the leader's result to the waiting followers"""
+        call.result = result
+        call.stream = stream
+        call.event.set()
+        if stream is None:
+            self.release(key, call)
+
+    def release(self, key, call: InFlightCall):
+        with self.lock:
+            if self.calls.get(key) is call:
+                del self.calls[key]
+
+    def wait(self, call: InFlightCall, timeout: float) -> Optional[Dict]:
+        if not call.event.wait(timeout):
+            with self.lock:
+                self.counters["follower_timeouts"] += 1
+            return None
+        return call.result
+
+    def stats(self) -> Dict:
+        with self.lock:
+            stats = dict(self.counters)
+            stats["in_flight"] = len(self.calls)
+        total = stats["leaders"] + stats["coalesced"]
+        stats["coalesced_ratio"] = stats["coalesced"] / total if total else 0.0
+        return stats
+
+# Micro-batching
+class BatchItem:
+    """One prompt waiting in the micro-batcher"""
+
+    __slots__ = ("payload", "event", "result", "ticket", "abandoned")
+
+    def __init__(self, payload: Dict, ticket: Optional["AdmissionTicket"] = None):
+        self.payload = payload
+        self.event = threading.Event()
+        self.result = None
+        # The caller's admission share, released by the batcher once the item is done with
+        self.ticket = ticket
+        # Set when the caller stopped waiting; the prompt is then not sent at all
+        self.abandoned = False
+
+class MicroBatcher:
+    """Collect prompts from concurrent sessions and send them to /generate_batch together"""
+
+    def __init__(self, llm_client: LLMClient, window: float = 0.02, max_batch_size: int = 8,
+                 path: str = "/generate_batch", max_in_flight: int = 4,
+                 admission: Optional["FairQueue"] = None):
+        self.llm_client = llm_client
+        # Callers are admitted per user with a 1/max_batch_size share each; the batcher releases them
+        self.admission = admission
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.path = path
+        # None until the first batch tells us whether the backend has the endpoint
+        self.supported = None
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.counters = {"batches": 0, "batched_prompts": 0, "largest_batch": 0, "failed_batches": 0,
+                         "abandoned_prompts": 0}
+
+        # Batches are sent from a pool so collecting the next one never waits on the model
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="llm-batch")
+        threading.Thread(target=self._run, name="llm-micro-batcher", daemon=True).start()
+
+    def submit(self, payload: Dict, timeout: float, ticket: Optional["AdmissionTicket"] = None) -> Optional[Dict]:
+        """Queue one payload and wait for its result; None means send it on its own"""
+        item = BatchItem(payload, ticket)
+        if self.supported is False:
+            self._release([item])
+            return None
+        self.queue.put(item)
+        if not item.event.wait(timeout):
+            item.abandoned = True
+            return {"success": False, "error": "Timed out waiting for the batch response"}
+        return item.result
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self.executor.submit(self._dispatch, batch)
+
+    def _finish(self, batch: List[BatchItem], results: List[Optional[Dict]]):
+        for item, result in zip(batch, results):
+            if not item.event.is_set():
+                item.result = result
+                item.event.set()
+
+    def _release(self, items: List[BatchItem]):
+        if self.admission is not None:
+            for item in items:
+                self.admission.release(item.ticket)
+
+    def _dispatch(self, batch: List[BatchItem]):
+        # Nobody reads the answer of a caller that already timed out - don't spend the GPU on it
+        live = [item for item in batch if not item.abandoned]
+        if len(live) < len(batch):
+            with self.lock:
+                self.counters["abandoned_prompts"] += len(batch) - len(live)
+        try:
+            if live:
+                self._send_batch(live)
+        except Exception as e:
+            # Never leave a session waiting on a batch that blew up
+            logger.exception("Micro-batch of %d prompts failed", len(live))
+            self._count_failure()
+            self._finish(live, [{"success": False, "error": f"Batch error: {str(e)}"}] * len(live))
+        finally:
+            self._release(batch)
+
+    @staticmethod
+    def _parse_batch(body, size: int) -> List[Dict]:
+        """Map a /generate_batch reply to one result per prompt, rejecting malformed replies"""
+        if not isinstance(body, dict) or not isinstance(body.get("responses"), list):
+            raise ValueError("expected an object with a 'responses' list")
+        responses = body["responses"]
+        if len(responses) != size:
+            raise ValueError(f"expected {size} responses, got {len(responses)}")
+
+        results = []
+        for data in responses:
+            if isinstance(data, str):
+                data = {"response": data}
+            if not isinstance(data, dict):
+                raise ValueError(f"unexpected response entry: {data!r}")
+            if data.get("error"):
+                results.append({"success": False, "error": f"API Error: {data['error']}"})
+            else:
+                results.append({"success": True, "response": str(data.get("response") or "No response received")})
+        return results
+
+    def _send_batch(self, batch: List[BatchItem]):
+        try:
+            response = self.llm_client.post(self.path, json={"requests": [item.payload for item in batch]},
+                                             headers={"Content-Type": "application/json"})
+        except requests.exceptions.RequestException as e:
+            self._count_failure()
+            self._finish(batch, [{"success": False, "error": f"Connection error: {str(e)}"}] * len(batch))
+            return
+
+        try:
+            if response.status_code in (404, 405):
+                # No batch endpoint on this backend - everyone falls back to /generate
+                self.supported = False
+                logger.info("Backend has no %s endpoint, micro-batching disabled", self.path)
+                self._finish(batch, [None] * len(batch))
+                return
+
+            if response.status_code != 200:
+                self._count_failure()
+                self._finish(batch, [{"success": False, "error": f"API Error: {response.status_code}"}] * len(batch))
+                return
+
+            results = self._parse_batch(response.json(), len(batch))
+            self.supported = True
+
+            with self.lock:
+                self.counters["batches"] += 1
+                self.counters["batched_prompts"] += len(batch)
+                self.counters["largest_batch"] = max(self.counters["largest_batch"], len(batch))
+            self._finish(batch, results)
+
+        except ValueError as e:
+            self._count_failure()
+            self._finish(batch, [{"success": False, "error": f"Invalid batch response: {str(e)}"}] * len(batch))
+        finally:
+            response.close()
+
+    def _count_failure(self):
+        with self.lock:
+            self.counters["failed_batches"] += 1
+
+    def stats(self) -> Dict:
+        with self.lock:
+            stats = dict(self.counters)
+        stats["avg_batch_size"] = stats["batched_prompts"] / stats["batches"] if stats["batches"] else 0.0
+        stats["supported"] = self.supported
+        stats["queued"] = self.queue.qsize()
+        return stats
+
+@st.cache_resource
+def get_micro_batcher() -> Optional[MicroBatcher]:
+    """Process-wide micro-batcher, or None when llm_batching is off"""
+    if not get_setting("llm_batching", False):
+        return None
+    if get_setting("stream_responses", True):
+        logger.warning("llm_batching only applies to non-streaming calls; set stream_responses = false")
+    return MicroBatcher(
+        get_llm_client(),
+        window=get_setting("llm_batch_window_ms", 20) / 1000,
+        max_batch_size=get_setting("llm_batch_size", 8),
+        max_in_flight=get_setting("llm_pool_size", 10),
+        admission=get_admission_queue()
+    )
+
+# Admission control
+class RateLimiter:
+    """Token bucket per user: `burst` requests at once, refilled at `rate_per_minute`"""
+
+    def __init__(self, rate_per_minute: float = 10.0, burst: int = 5, max_users: int = 10000):
+        self.rate = rate_per_minute / 60
+        self.burst = burst
+        self.max_users = max_users
+        # Least recently used first, so bounding the table is a pop from the front
+        self.buckets = OrderedDict()
+        self.rejected = 0
+        self.lock = threading.Lock()
+
+    def acquire(self, user_id: str) -> float:
+        """Take a token; returns 0 when allowed, otherwise seconds until the next token"""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        with self.lock:
+            tokens, last = self.buckets.get(user_id, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            allowed = tokens >= 1
+            self.buckets[user_id] = (tokens - 1 if allowed else tokens, now)
+            self.buckets.move_to_end(user_id)
+            while len(self.buckets) > self.max_users:
+                # The least recently seen user has most likely refilled already
+                self.buckets.popitem(last=False)
+
+            if not allowed:
+                self.rejected += 1
+                return (1 - tokens) / self.rate
+            return 0.0
+
+class AdmissionTicket:
+    """One upstream call waiting for, or holding, a slot"""
+
+    __slots__ = ("user_id", "weight", "granted", "granted_at")
+
+    def __init__(self, user_id: str, weight: float = 1.0):
+        self.user_id = user_id
+        # Share of a slot; a prompt sent in a micro-batch of n holds 1/n
+        self.weight = weight
+        self.granted = False
+        self.granted_at = 0.0
+
+class FairQueue:
+    """Global cap on concurrent upstream calls; waiting users are served round-robin"""
+
+    def __init__(self, max_concurrent: int = 4, max_hold: float = 300.0):
+        self.max_concurrent = max_concurrent
+        # A slot held longer than this is reclaimed - a backstop for a holder that never released it
+        self.max_hold = max_hold
+        self.active = {}
+        # user_id -> tickets of that user; the first user is served next, then moves to the back
+        self.waiting = OrderedDict()
+        self.condition = threading.Condition()
+        self.counters = {"admitted": 0, "queued": 0, "timeouts": 0, "expired_slots": 0, "longest_queue": 0}
+        self.wait_seconds = 0.0
+
+    def enter(self, user_id: str, timeout: float, on_position=None, weight: float = 1.0) -> Optional[AdmissionTicket]:
+        """Wait for a slot, reporting the queue position (0 once admitted); None on timeout"""
+        ticket = AdmissionTicket(user_id, weight)
+        with self.condition:
+            self._expire_slots()
+            if not self.waiting and self._fits(ticket):
+                self._grant(ticket)
+                return ticket
+            self.waiting.setdefault(user_id, deque()).append(ticket)
+            self.counters["queued"] += 1
+            self.counters["longest_queue"] = max(self.counters["longest_queue"],
+                                                 sum(len(tickets) for tickets in self.waiting.values()))
+
+        start = time.monotonic()
+        deadline = start + timeout
+        last_position = None
+        while True:
+            with self.condition:
+                self._expire_slots()
+                if ticket.granted:
+                    self.wait_seconds += time.monotonic() - start
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._withdraw(ticket)
+                    self.counters["timeouts"] += 1
+                    return None
+                position = self._position(ticket)
+
+            # Rendering happens outside the lock
+            if on_position is not None and position != last_position:
+                on_position(position)
+                last_position = position
+
+            with self.condition:
+                if not ticket.granted:
+                    self.condition.wait(min(remaining, 1.0))
+
+        if on_position is not None:
+            on_position(0)
+        return ticket
+
+    def release(self, ticket: Optional[AdmissionTicket]):
+        if ticket is None:
+            return
+        with self.condition:
+            if self.active.pop(ticket, None) is not None:
+                self._grant_waiting()
+
+    def _load(self) -> float:
+        return sum(ticket.weight for ticket in self.active)
+
+    def _fits(self, ticket: AdmissionTicket) -> bool:
+        # The epsilon absorbs rounding of fractional (batched) shares
+        return self._load() + ticket.weight <= self.max_concurrent + 1e-9
+
+    def _grant(self, ticket: AdmissionTicket):
+        ticket.granted = True
+        ticket.granted_at = time.monotonic()
+        self.active[ticket] = ticket.granted_at
+        self.counters["admitted"] += 1
+
+    def _grant_waiting(self):
+        while self.waiting:
+            user_id, tickets = next(iter(self.waiting.items()))
+            if not self._fits(tickets[0]):
+                break
+            self._grant(tickets.popleft())
+            if tickets:
+                self.waiting.move_to_end(user_id)
+            else:
+                del self.waiting[user_id]
+        self.condition.notify_all()
+
+    def _withdraw(self, ticket: AdmissionTicket):
+        tickets = self.waiting.get(ticket.user_id)
+        if tickets is not None and ticket in tickets:
+            tickets.remove(ticket)
+            if not tickets:
+                del self.waiting[ticket.user_id]
+
+    def _position(self, ticket: AdmissionTicket) -> int:
+        """1-based place in the round-robin order"""
+        round_index = self.waiting[ticket.user_id].index(ticket)
+        ahead = round_index
+        before = True
+        for user_id, user_tickets in self.waiting.items():
+            if user_id == ticket.user_id:
+                before = False
+                continue
+            # Every user is served once per round: their earlier rounds go first, and this
+            # round too when they come before us in the rotation
+            ahead += min(len(user_tickets), round_index + before)
+        return ahead + 1
+
+    def _expire_slots(self):
+        now = time.monotonic()
+        expired = [ticket for ticket, granted_at in self.active.items() if now - granted_at > self.max_hold]
+        for ticket in expired:
+            del self.active[ticket]
+            self.counters["expired_slots"] += 1
+        if expired:
+            self._grant_waiting()
+
+    def stats(self) -> Dict:
+        with self.condition:
+            queued = self.counters["queued"]
+            return dict(
+                self.counters,
+                max_concurrent=self.max_concurrent,
+                active=len(self.active),
+                load=self._load(),
+                waiting=sum(len(tickets) for tickets in self.waiting.values()),
+                waiting_users=len(self.waiting),
+                avg_wait=self.wait_seconds / queued if queued else 0.0
+            )
+
+@st.cache_resource
+def get_admission_queue() -> Optional[FairQueue]:
+    """Process-wide cap on upstream calls, None when llm_max_concurrent is 0"""
+    max_concurrent = get_setting("llm_max_concurrent", 4)
+    return FairQueue(max_concurrent) if max_concurrent > 0 else None
+
+# Write-behind persistence
+class WriteBehindQueue:
+    """Buffer Firestore writes and commit them in batches from a background worker"""
+
+    # Firestore rejects batches with more than 500 writes
+    MAX_BATCH_SIZE = 500
+
+    def __init__(self, db, max_queue_size: int = 1000, batch_size: int = 500,
+                 flush_interval: float = 1.0, enqueue_timeout: float = 2.0,
+                 retry_backoff: float = 0.5, retry_backoff_max: float = 30.0,
+                 max_retries: int = 5, dead_letter_path: str = ""):
+        self.db = db
+        self.batch_size = min(batch_size, self.MAX_BATCH_SIZE)
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.retry_backoff = retry_backoff
+        self.retry_backoff_max = retry_backoff_max
+        self.max_retries = max_retries
+        self.dead_letter_path = dead_letter_path
+
+        # Each queue item is the list of (doc_ref, data, merge) writes of one save
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.pending = []
+        self.stopping = threading.Event()
+        self.idle = threading.Condition()
+        self.lock = threading.Lock()
+        self.counters = {
+            "committed_writes": 0,
+            "committed_batches": 0,
+            "failed_commits": 0,
+            "dead_lettered": 0,
+            "rejected": 0
+        }
+
+        self.worker = threading.Thread(target=self._run, name="firestore-write-behind", daemon=True)
+        self.worker.start()
+        atexit.register(self.shutdown)
+
+    def enqueue(self, writes: List[tuple]) -> bool:
+        """Queue the writes of one save, blocking while the queue is full"""
+        if self.stopping.is_set():
+            return False
+        try:
+            self.queue.put(list(writes), timeout=self.enqueue_timeout)
+            return True
+        except queue.Full:
+            with self.lock:
+                self.counters["rejected"] += 1
+            return False
+
+    def _run(self):
+        while not (self.stopping.is_set() and self.queue.empty() and not self.pending):
+            self._collect()
+            if self.pending:
+                self._commit_pending()
+            with self.idle:
+                self.idle.notify_all()
+
+    def _collect(self):
+        """Move queued saves into the pending list until a batch is full or the interval ends"""
+        deadline = None
+        while sum(len(writes) for writes in self.pending) < self.batch_size:
+            if deadline is None:
+                # Wait for the first write, waking up regularly to check for shutdown
+                timeout = self.flush_interval
+            else:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+
+            try:
+                writes = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                if deadline is None and not self.stopping.is_set() and not self.pending:
+                    continue
+                break
+
+            with self.lock:
+                self.pending.append(writes)
+            if deadline is None:
+                deadline = time.monotonic() + self.flush_interval
+            if self.stopping.is_set():
+                deadline = time.monotonic()
+
+    def _commit_pending(self):
+        """Commit pending saves in batches, dead-lettering a batch that keeps failing"""
+        attempt = 0
+        while self.pending:
+            # Never split the writes of a single save across batches
+            chunk, size = [], 0
+            for writes in self.pending:
+                if chunk and size + len(writes) > self.batch_size:
+                    break
+                chunk.append(writes)
+                size += len(writes)
+
+            try:
+                self._commit(chunk)
+            except Exception as e:
+                with self.lock:
+                    self.counters["failed_commits"] += 1
+                logger.warning("Write-behind commit of %d writes failed: %s", size, e)
+                if attempt >= self.max_retries:
+                    # A batch that keeps failing (e.g. an invalid document) must not block the queue
+                    self._isolate_failures(chunk)
+                    attempt = 0
+                    continue
+                delay = min(self.retry_backoff_max, self.retry_backoff * (2 ** attempt))
+                attempt += 1
+                if self.stopping.wait(delay) and attempt > 3:
+                    # Shutting down and the backend is still failing - give up
+                    with self.lock:
+                        chunk = list(self.pending)
+                    self._dead_letter(chunk, e)
+                continue
+
+            attempt = 0
+            with self.lock:
+                self.pending = self.pending[len(chunk):]
+                self.counters["committed_writes"] += size
+                self.counters["committed_batches"] += 1
+
+    def _commit(self, chunk: List[List[tuple]]):
+        batch = self.db.batch()
+        for writes in chunk:
+            for doc_ref, data, merge in writes:
+                if data is None:
+                    batch.delete(doc_ref)
+                else:
+                    batch.set(doc_ref, data, merge=merge)
+        batch.commit()
+
+    def _isolate_failures(self, chunk: List[List[tuple]]):
+        """Commit the saves of a failing batch one by one, dead-lettering those that still fail"""
+        for writes in chunk:
+            try:
+                self._commit([writes])
+            except Exception as e:
+                self._dead_letter([writes], e)
+                continue
+            with self.lock:
+                self.pending = self.pending[1:]
+                self.counters["committed_writes"] += len(writes)
+                self.counters["committed_batches"] += 1
+
+    def _dead_letter(self, chunk: List[List[tuple]], error: Exception):
+        """Take saves out of the pending list and append them to the dead-letter log"""
+        size = sum(len(writes) for writes in chunk)
+        with self.lock:
+            self.pending = self.pending[len(chunk):]
+            self.counters["dead_lettered"] += size
+        logger.error("Dead-lettering %d writes of %d saves after repeated failures: %s",
+                     size, len(chunk), error)
+        if not self.dead_letter_path:
+            return
+
+        try:
+            with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+                for writes in chunk:
+                    record = {
+                        "failed_at": datetime.now().isoformat(),
+                        "error": str(error),
+                        "writes": [
+                            {"path": getattr(doc_ref, "path", str(doc_ref)), "data": data, "merge": merge}
+                            for doc_ref, data, merge in writes
+                        ]
+                    }
+                    # Sentinels and timestamps are not JSON - keep their repr for manual replay
+                    f.write(json.dumps(record, default=str, ensure_ascii=False) + "\n")
+        except OSError as e:
+            logger.error("Could not write the dead-letter log %s: %s", self.dead_letter_path, e)
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Block until everything queued so far has been committed"""
+        deadline = time.monotonic() + timeout
+        with self.idle:
+            while not (self.queue.empty() and not self.pending):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self.worker.is_alive():
+                    return False
+                self.idle.wait(min(remaining, self.flush_interval))
+        return True
+
+    def shutdown(self, timeout: float = 10.0):
+        """Stop accepting writes and flush everything pending"""
+        self.stopping.set()
+        self.worker.join(timeout)
+
+    def stats(self) -> Dict:
+        with self.lock:
+            stats = dict(self.counters)
+            stats["pending"] = sum(len(writes) for writes in self.pending)
+        stats["queued"] = self.queue.qsize()
+        return stats
+
+@st.cache_resource
+def get_conversation_writer() -> Optional[WriteBehindQueue]:
+    """Process-wide write-behind queue, or None when writes should be synchronous"""
+    if not get_setting("write_behind", True):
+        return None
+    return WriteBehindQueue(
+        init_firebase(),
+        max_queue_size=get_setting("write_queue_size", 1000),
+        batch_size=get_setting("write_batch_size", 500),
+        flush_interval=get_setting("write_flush_interval", 1.0),
+        max_retries=get_setting("write_max_retries", 5),
+        dead_letter_path=get_setting("write_dead_letter_path", "")
+    )
+
+# Conversation storage
+class ConversationStore(ABC):
+    """Persistence behind ChatManager: messages, history pages, admin reads and usage rollups"""
+
+    name = "base"
+
+    @abstractmethod
+    def save_message(self, user_id: str, user_input: str, bot_response: str, timestamp: datetime,
+                     has_context: bool = False, from_index: bool = False):
+        """Store one exchange and update the usage rollups"""
+
+    def begin_message(self, user_id: str, user_input: str, timestamp: datetime) -> str:
+        """Store the user's input before the answer exists, returns the message id"""
+        return uuid.uuid4().hex[:20]
+
+    def complete_message(self, user_id: str, message_id: str, user_input: str, bot_response: str,
+                         timestamp: datetime, has_context: bool = False, from_index: bool = False):
+        """Fill in the answer of a begun message and update the usage rollups"""
+        self.save_message(user_id, user_input, bot_response, timestamp, has_context, from_index)
+
+    def discard_message(self, user_id: str, message_id: str):
+        """Remove a begun message whose turn failed"""
+
+    def purge_pending(self, older_than: datetime) -> int:
+        """Remove begun messages that were never completed (closed tab, rerun), returns how many"""
+        return 0
+
+    @abstractmethod
+    def probe(self):
+        """Cheapest read that opens the connection, used by the startup warm-up"""
+
+    @abstractmethod
+    def count_messages(self, user_id: str) -> int:
+        """Number of stored messages of one user"""
+
+    @abstractmethod
+    def get_history_page(self, user_id: str, page: int, page_size: int, total: int,
+                         cursors: Dict) -> List[Dict]:
+        """Messages of one history page, newest first"""
+
+    @abstractmethod
+    def get_all_conversations(self, limit: Optional[int] = None, since: Optional[datetime] = None,
+                              mode: str = "collection_group", max_workers: int = 16) -> List[Dict]:
+        """Admin rows of every user, newest first"""
+
+    @abstractmethod
+    def iter_conversations(self, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                           user_id: str = "", chunk_size: int = 500):
+        """Yield admin rows oldest first, reading chunk_size messages at a time"""
+
+    @abstractmethod
+    def get_usage_rollups(self, days: int = 30) -> Dict:
+        """Totals, unique users and the daily rows of the last `days` days"""
+
+    @abstractmethod
+    def rebuild_usage_rollups(self) -> Dict:
+        """Recount the rollups from the stored messages"""
+
+    @abstractmethod
+    def get_answer_curation(self) -> Dict[str, bool]:
+        """Admin decisions on which stored answers may be reused, by question key"""
+
+    @abstractmethod
+    def set_answer_curation(self, key: str, question: str, eligible: bool, updated_by: str = ""):
+        """Record whether the stored answer of a question may be reused"""
+
+class FirestoreStore(ConversationStore):
+    """conversations/{user_id}/messages/{message_id} plus usage_* rollup documents"""
+
+    name = "firestore"
+
+    def __init__(self, db, writer: Optional[WriteBehindQueue] = None):
+        self.db = db
+        self.writer = writer
+        # Users already counted in usage_daily/{day}.users by this process, for the latest days
+        self.day_users = {}
+        self.lock = threading.Lock()
+
+    def _messages(self, user_id: str):
+        return self.db.collection("conversations").document(user_id).collection("messages")
+
+    def save_message(self, user_id: str, user_input: str, bot_response: str, timestamp: datetime,
+                     has_context: bool = False, from_index: bool = False):
+        self.complete_message(user_id, self._messages(user_id).document().id, user_input, bot_response, timestamp,
+                              has_context, from_index)
+
+    def begin_message(self, user_id: str, user_input: str, timestamp: datetime) -> str:
+        # Kept outside conversations/ so history, admin reads and counts never see unanswered turns.
+        # Written directly rather than through the write-behind queue, so it is committed before
+        # complete_message or discard_message can remove it
+        doc_ref = self.db.collection("pending_messages").document()
+        doc_ref.set({
+            "user_id": user_id,
+            "input": user_input,
+            "timestamp": timestamp,
+            "is_anonymous": user_id.startswith("anon_")
+        })
+        return doc_ref.id
+
+    def complete_message(self, user_id: str, message_id: str, user_input: str, bot_response: str,
+                         timestamp: datetime, has_context: bool = False, from_index: bool = False):
+        doc_ref = self._messages(user_id).document(message_id)
+        data = {
+            "input": user_input,
+            "response": bot_response,
+            "timestamp": timestamp,
+            "is_anonymous": user_id.startswith("anon_"),  # Track if user is anonymous
+            "has_context": has_context,
+            "from_index": from_index
+        }
+        pending_ref = self.db.collection("pending_messages").document(message_id)
+        self._write([(doc_ref, data, False), (pending_ref, None, False)])
+
+        # Rollups are a separate save so a failed counter update never loses the message;
+        # rebuild_usage_rollups repairs any drift
+        try:
+            self._write(self._rollup_writes(user_id, timestamp))
+        except Exception as e:
+            logger.warning("Usage rollup update for %s failed: %s", user_id, e)
+
+    def discard_message(self, user_id: str, message_id: str):
+        self._write([(self.db.collection("pending_messages").document(message_id), None, False)])
+
+    def purge_pending(self, older_than: datetime) -> int:
+        stale = (self.db.collection("pending_messages")
+                 .where(filter=firestore.FieldFilter("timestamp", "<", older_than))
+                 .select([])
+                 .stream())
+        refs = [doc.reference for doc in stale]
+        for start in range(0, len(refs), 500):
+            self._write([(ref, None, False) for ref in refs[start:start + 500]])
+        return len(refs)
+
+    def _write(self, writes: List[tuple]):
+        """Commit (ref, data, merge) writes together; data None deletes the document"""
+        # Hand the writes to the background worker; write inline if its queue is full
+        if self.writer is not None and self.writer.enqueue(writes):
+            return
+
+        batch = self.db.batch()
+        for ref, write_data, merge in writes:
+            if write_data is None:
+                batch.delete(ref)
+            else:
+                batch.set(ref, write_data, merge=merge)
+        batch.commit()
+
+    def _rollup_writes(self, user_id: str, timestamp: datetime) -> List[tuple]:
+        """Counter updates that keep the usage rollups in step with a saved message"""
+        is_anonymous = user_id.startswith("anon_")
+        audience_field = "anonymous_messages" if is_anonymous else "logged_in_messages"
+        day = timestamp.strftime("%Y-%m-%d")
+
+        day_ref = self.db.collection("usage_daily").document(day)
+        day_data = {
+            "date": day,
+            "messages": firestore.Increment(1),
+            audience_field: firestore.Increment(1)
+        }
+        if self._first_message_of_day(day_ref, day, user_id):
+            day_data["users"] = firestore.Increment(1)
+
+        return [
+            (day_ref, day_data, True),
+            # Distinct users per day are documents too - an array on the day would hit the 1 MiB
+            # document limit and serialize every write of the day on one hot document
+            (day_ref.collection("users").document(user_id), {"last_seen": timestamp}, True),
+            (self.db.collection("usage_totals").document("all"), {
+                "messages": firestore.Increment(1),
+                audience_field: firestore.Increment(1)
+            }, True),
+            # One document per user so unique users is a count aggregation
+            (self.db.collection("usage_users").document(user_id), {
+                "is_anonymous": is_anonymous,
+                "last_seen": timestamp
+            }, True)
+        ]
+
+    def _first_message_of_day(self, day_ref, day: str, user_id: str) -> bool:
+        """Whether the user has no usage_daily/{day}/users document yet, read once per user and day"""
+        with self.lock:
+            if user_id in self.day_users.get(day, ()):
+                return False
+        exists = day_ref.collection("users").document(user_id).get().exists
+
+        with self.lock:
+            seen = self.day_users.setdefault(day, set())
+            if user_id in seen:
+                return False
+            seen.add(user_id)
+            for old_day in sorted(self.day_users)[:-2]:
+                del self.day_users[old_day]
+        # Two instances seeing the same new user at once count it twice; rebuild_usage_rollups repairs that
+        return not exists
+
+    def probe(self):
+        # One document read sets up the gRPC channel and the credentials' access token
+        self.db.collection("usage_totals").document("all").get()
+
+    def count_messages(self, user_id: str) -> int:
+        """Count a user's messages with an aggregation query instead of reading them"""
+        result = self._messages(user_id).count(alias="total").get()
+        return int(result[0][0].value)
+
+    def get_history_page(self, user_id: str, page: int, page_size: int, total: int,
+                         cursors: Dict) -> List[Dict]:
+        # cursors remembers the first/last timestamp of every visited page so
+        # neighbouring pages are fetched with start_after instead of offset
+        messages_ref = self._messages(user_id)
+        newest_first = messages_ref.order_by("timestamp", direction=firestore.Query.DESCENDING)
+        oldest_first = messages_ref.order_by("timestamp", direction=firestore.Query.ASCENDING)
+        total_pages = (total + page_size - 1) // page_size
+
+        # New messages shift every page boundary - forget stale cursors
+        if cursors.get("total") != total or cursors.get("page_size") != page_size:
+            cursors.clear()
+            cursors.update({"total": total, "page_size": page_size, "pages": {}})
+        pages = cursors["pages"]
+
+        reverse = False
+        if page == 1:
+            query = newest_first.limit(page_size)
+        elif page - 1 in pages:
+            query = newest_first.start_after({"timestamp": pages[page - 1][1]}).limit(page_size)
+        elif page + 1 in pages:
+            # Walk backwards from the page after this one
+            query = oldest_first.start_after({"timestamp": pages[page + 1][0]}).limit(page_size)
+            reverse = True
+        elif page == total_pages:
+            # The last page is the oldest remainder of the collection
+            query = oldest_first.limit(total - (page - 1) * page_size)
+            reverse = True
+        else:
+            # Jump without a known neighbour: skip forward from the nearest cursor
+            known = max((p for p in pages if p < page), default=0)
+            skip_query = newest_first.select(["timestamp"])
+            if known:
+                skip_query = skip_query.start_after({"timestamp": pages[known][1]})
+            last_timestamp = None
+            for doc in skip_query.limit((page - 1 - known) * page_size).stream():
+                last_timestamp = doc.get("timestamp")
+            if last_timestamp is not None:
+                query = newest_first.start_after({"timestamp": last_timestamp}).limit(page_size)
+            else:
+                query = newest_first.limit(page_size)
+
+        messages = []
+        for doc in query.stream():
+            data = doc.to_dict()
+            messages.append({
+                "id": doc.id,
+                "input": data.get("input", ""),
+                "response": data.get("response", ""),
+                "timestamp": data.get("timestamp")
+            })
+        if reverse:
+            messages.reverse()
+
+        if messages:
+            pages[page] = (messages[0]["timestamp"], messages[-1]["timestamp"])
+        return messages
+
+    def get_all_conversations(self, limit: Optional[int] = None, since: Optional[datetime] = None,
+                              mode: str = "collection_group", max_workers: int = 16) -> List[Dict]:
+        if mode == "parallel" and since is None:
+            return self._get_all_conversations_parallel(limit, max_workers)
+
+        # One query over every user's messages subcollection
+        query = self.db.collection_group("messages")
+        if since is not None:
+            query = query.where(filter=firestore.FieldFilter("timestamp", ">", since))
+        query = query.order_by("timestamp", direction=firestore.Query.DESCENDING)
+        if limit:
+            query = query.limit(limit)
+        return [self._conversation_from_doc(doc) for doc in query.stream()]
+
+    def _get_all_conversations_parallel(self, limit: Optional[int], max_workers: int) -> List[Dict]:
+        """Fan out per-user message queries over a thread pool"""
+        # Gunakan list_documents() untuk mendapatkan semua document references
+        user_doc_refs = list(self.db.collection("conversations").list_documents())
+
+        def fetch_user_messages(user_doc_ref) -> List[Dict]:
+            query = (user_doc_ref.collection("messages")
+                    .order_by("timestamp", direction=firestore.Query.DESCENDING))
+            if limit:
+                query = query.limit(limit)
+            return [self._conversation_from_doc(doc) for doc in query.stream()]
+
+        conversations = []
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for messages in executor.map(fetch_user_messages, user_doc_refs):
+                conversations.extend(messages)
+
+        conversations.sort(key=lambda c: c["timestamp"], reverse=True)
+        return conversations[:limit] if limit else conversations
+
+    def _conversation_from_doc(self, msg_doc) -> Dict:
+        """Flatten a message document into an admin panel row"""
+        data = msg_doc.to_dict()
+        return {
+            # conversations/{user_id}/messages/{message_id}
+            "user_id": msg_doc.reference.parent.parent.id,
+            "message_id": msg_doc.id,
+            "input": data.get("input", ""),
+            "response": data.get("response", ""),
+            "timestamp": data.get("timestamp"),
+            "has_context": bool(data.get("has_context")),
+            "from_index": bool(data.get("from_index"))
+        }
+
+    def iter_conversations(self, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                           user_id: str = "", chunk_size: int = 500):
+        query = self._messages(user_id) if user_id else self.db.collection_group("messages")
+        if start:
+            query = query.where(filter=firestore.FieldFilter("timestamp", ">=", start))
+        if end:
+            query = query.where(filter=firestore.FieldFilter("timestamp", "<", end))
+        query = query.order_by("timestamp")
+
+        last_doc = None
+        while True:
+            page_query = query.start_after(last_doc) if last_doc is not None else query
+            docs = list(page_query.limit(chunk_size).stream())
+            for doc in docs:
+                yield self._conversation_from_doc(doc)
+
+            if len(docs) < chunk_size:
+                break
+            last_doc = docs[-1]
+
+    def get_usage_rollups(self, days: int = 30) -> Dict:
+        totals = self.db.collection("usage_totals").document("all").get().to_dict() or {}
+        unique_users = self.db.collection("usage_users").count(alias="total").get()[0][0].value
+
+        start_day = (datetime.now() - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+        query = (self.db.collection("usage_daily")
+                .where(filter=firestore.FieldFilter("date", ">=", start_day))
+                .order_by("date"))
+
+        # Daily users are a counter on the day document, so the chart is one query
+        daily = []
+        for doc in query.stream():
+            data = doc.to_dict()
+            daily.append({
+                "date": data["date"],
+                "messages": data.get("messages", 0),
+                "users": data.get("users", 0),
+                "anonymous_messages": data.get("anonymous_messages", 0),
+                "logged_in_messages": data.get("logged_in_messages", 0)
+            })
+
+        return {"totals": totals, "unique_users": int(unique_users), "daily": daily}
+
+    def rebuild_usage_rollups(self) -> Dict:
+        """Backfill the usage rollups from the stored messages with a single scan"""
+        daily = {}
+        daily_users = {}
+        totals = {"messages": 0, "anonymous_messages": 0, "logged_in_messages": 0}
+        users = {}
+
+        for doc in self.db.collection_group("messages").stream():
+            data = doc.to_dict()
+            timestamp = data.get("timestamp")
+            if timestamp is None:
+                continue
+
+            user_id = doc.reference.parent.parent.id
+            is_anonymous = user_id.startswith("anon_")
+            audience_field = "anonymous_messages" if is_anonymous else "logged_in_messages"
+            day = timestamp.strftime("%Y-%m-%d")
+
+            row = daily.setdefault(day, {"date": day, "messages": 0, "anonymous_messages": 0,
+                                         "logged_in_messages": 0})
+            row["messages"] += 1
+            row[audience_field] += 1
+            day_users = daily_users.setdefault(day, {})
+            if user_id not in day_users or timestamp > day_users[user_id]:
+                day_users[user_id] = timestamp
+            totals["messages"] += 1
+            totals[audience_field] += 1
+            if user_id not in users or timestamp > users[user_id]["last_seen"]:
+                users[user_id] = {"is_anonymous": is_anonymous, "last_seen": timestamp}
+
+        writes = [(self.db.collection("usage_totals").document("all"), totals)]
+        for day, row in daily.items():
+            day_ref = self.db.collection("usage_daily").document(day)
+            row["users"] = len(daily_users[day])
+            # Overwriting the day also drops the users array older versions kept on it
+            writes.append((day_ref, row))
+            for user_id, last_seen in daily_users[day].items():
+                writes.append((day_ref.collection("users").document(user_id), {"last_seen": last_seen}))
+        for user_id, data in users.items():
+            writes.append((self.db.collection("usage_users").document(user_id), data))
+
+        for start in range(0, len(writes), WriteBehindQueue.MAX_BATCH_SIZE):
+            batch = self.db.batch()
+            for ref, data in writes[start:start + WriteBehindQueue.MAX_BATCH_SIZE]:
+                batch.set(ref, data)
+            batch.commit()
+
+        return {"messages": totals["messages"], "days": len(daily), "users": len(users)}
+
+    def get_answer_curation(self) -> Dict[str, bool]:
+        return {doc.id: bool(doc.to_dict().get("eligible"))
+                for doc in self.db.collection("answer_curation").stream()}
+
+    def set_answer_curation(self, key: str, question: str, eligible: bool, updated_by: str = ""):
+        self.db.collection("answer_curation").document(key).set({
+            "question": question,
+            "eligible": eligible,
+            "updated_by": updated_by,
+            "updated_at": firestore.SERVER_TIMESTAMP
+        })
+
+class SQLiteStore(ConversationStore):
+    """Local SQLite database in WAL mode, for single-host deployments and performance tests"""
+
+    name = "sqlite"
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS messages (
+            id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            input TEXT NOT NULL,
+            response TEXT NOT NULL,
+            timestamp REAL NOT NULL,
+            is_anonymous INTEGER NOT NULL,
+            has_context INTEGER NOT NULL DEFAULT 0,
+            from_index INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS idx_messages_user_timestamp ON messages (user_id, timestamp);
+        CREATE INDEX IF NOT EXISTS idx_messages_timestamp ON messages (timestamp);
+
+        -- Inputs of turns still being answered, moved to messages once complete
+        CREATE TABLE IF NOT EXISTS pending_messages (
+            id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            input TEXT NOT NULL,
+            timestamp REAL NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS usage_daily (
+            date TEXT PRIMARY KEY,
+            messages INTEGER NOT NULL DEFAULT 0,
+            anonymous_messages INTEGER NOT NULL DEFAULT 0,
+            logged_in_messages INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS usage_daily_users (
+            date TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            PRIMARY KEY (date, user_id)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS usage_users (
+            user_id TEXT PRIMARY KEY,
+            is_anonymous INTEGER NOT NULL,
+            last_seen REAL NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS answer_curation (
+            key TEXT PRIMARY KEY,
+            question TEXT NOT NULL,
+            eligible INTEGER NOT NULL,
+            updated_by TEXT NOT NULL DEFAULT '',
+            updated_at REAL NOT NULL
+        );
+    """
+
+    def __init__(self, path: str = "chatbot.db", pool_size: int = 8, busy_timeout: float = 5.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        # Streamlit runs every rerun on its own thread, so connections are pooled
+        # instead of kept per thread
+        self.pool = queue.LifoQueue(maxsize=pool_size)
+        with self._connection() as conn:
+            conn.executescript(self.SCHEMA)
+            # Databases created before the answer origin was recorded
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(messages)")}
+            for column in ("has_context", "from_index"):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE messages ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        # WAL lets readers run while a save is being committed
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @contextmanager
+    def _connection(self):
+        try:
+            conn = self.pool.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        try:
+            yield conn
+        finally:
+            try:
+                self.pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    def _row(self, row: sqlite3.Row) -> Dict:
+        return {
+            "user_id": row["user_id"],
+            "message_id": row["id"],
+            "input": row["input"],
+            "response": row["response"],
+            "timestamp": datetime.fromtimestamp(row["timestamp"]),
+            "has_context": bool(row["has_context"]),
+            "from_index": bool(row["from_index"])
+        }
+
+    def save_message(self, user_id: str, user_input: str, bot_response: str, timestamp: datetime,
+                     has_context: bool = False, from_index: bool = False):
+        self.complete_message(user_id, uuid.uuid4().hex[:20], user_input, bot_response, timestamp,
+                              has_context, from_index)
+
+    def begin_message(self, user_id: str, user_input: str, timestamp: datetime) -> str:
+        message_id = uuid.uuid4().hex[:20]
+        with self._connection() as conn, conn:
+            conn.execute("INSERT INTO pending_messages (id, user_id, input, timestamp) VALUES (?, ?, ?, ?)",
+                         (message_id, user_id, user_input, timestamp.timestamp()))
+        return message_id
+
+    def complete_message(self, user_id: str, message_id: str, user_input: str, bot_response: str,
+                         timestamp: datetime, has_context: bool = False, from_index: bool = False):
+        is_anonymous = user_id.startswith("anon_")
+        audience_field = "anonymous_messages" if is_anonymous else "logged_in_messages"
+        day = timestamp.strftime("%Y-%m-%d")
+        epoch = timestamp.timestamp()
+
+        # Message and rollups are committed in one transaction
+        with self._connection() as conn, conn:
+            conn.execute(
+                "INSERT INTO messages (id, user_id, input, response, timestamp, is_anonymous, has_context, "
+                "from_index) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (message_id, user_id, user_input, bot_response, epoch, int(is_anonymous), int(has_context),
+                 int(from_index))
+            )
+            conn.execute("DELETE FROM pending_messages WHERE id = ?", (message_id,))
+            conn.execute(
+                f"INSERT INTO usage_daily (date, messages, {audience_field}) VALUES (?, 1, 1) "
+                f"ON CONFLICT(date) DO UPDATE SET messages = messages + 1, "
+                f"{audience_field} = {audience_field} + 1",
+                (day,)
+            )
+            conn.execute("INSERT OR IGNORE INTO usage_daily_users (date, user_id) VALUES (?, ?)",
+                         (day, user_id))
+            conn.execute(
+                "INSERT INTO usage_users (user_id, is_anonymous, last_seen) VALUES (?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET last_seen = MAX(last_seen, excluded.last_seen)",
+                (user_id, int(is_anonymous), epoch)
+            )
+
+    def discard_message(self, user_id: str, message_id: str):
+        with self._connection() as conn, conn:
+            conn.execute("DELETE FROM pending_messages WHERE id = ?", (message_id,))
+
+    def purge_pending(self, older_than: datetime) -> int:
+        with self._connection() as conn, conn:
+            return conn.execute("DELETE FROM pending_messages WHERE timestamp < ?",
+                                (older_than.timestamp(),)).rowcount
+
+    def probe(self):
+        with self._connection() as conn:
+            conn.execute("SELECT 1 FROM messages LIMIT 1").fetchall()
+
+    def count_messages(self, user_id: str) -> int:
+        with self._connection() as conn:
+            return conn.execute("SELECT COUNT(*) FROM messages WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+    def get_history_page(self, user_id: str, page: int, page_size: int, total: int,
+                         cursors: Dict) -> List[Dict]:
+        # OFFSET only walks the local (user_id, timestamp) index, no cursors needed
+        with self._connection() as conn:
+            rows = conn.execute(
+                "SELECT id, user_id, input, response, timestamp FROM messages WHERE user_id = ? "
+                "ORDER BY timestamp DESC LIMIT ? OFFSET ?",
+                (user_id, page_size, (page - 1) * page_size)
+            ).fetchall()
+        return [{
+            "id": row["id"],
+            "input": row["input"],
+            "response": row["response"],
+            "timestamp": datetime.fromtimestamp(row["timestamp"])
+        } for row in rows]
+
+    def get_all_conversations(self, limit: Optional[int] = None, since: Optional[datetime] = None,
+                              mode: str = "collection_group", max_workers: int = 16) -> List[Dict]:
+        sql = "SELECT id, user_id, input, response, timestamp, has_context, from_index FROM messages"
+        params = []
+        if since is not None:
+            sql += " WHERE timestamp > ?"
+            params.append(since.timestamp())
+        sql += " ORDER BY timestamp DESC"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        with self._connection() as conn:
+            return [self._row(row) for row in conn.execute(sql, params)]
+
+    def iter_conversations(self, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                           user_id: str = "", chunk_size: int = 500):
+        conditions, params = [], []
+        if user_id:
+            conditions.append("user_id = ?")
+            params.append(user_id)
+        if start:
+            conditions.append("timestamp >= ?")
+            params.append(start.timestamp())
+        if end:
+            conditions.append("timestamp < ?")
+            params.append(end.timestamp())
+
+        sql = "SELECT id, user_id, input, response, timestamp, has_context, from_index FROM messages"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY timestamp"
+
+        with self._connection() as conn:
+            cursor = conn.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield self._row(row)
+
+    def get_usage_rollups(self, days: int = 30) -> Dict:
+        start_day = (datetime.now() - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+        with self._connection() as conn:
+            totals = conn.execute(
+                "SELECT COALESCE(SUM(messages), 0) AS messages, "
+                "COALESCE(SUM(anonymous_messages), 0) AS anonymous_messages, "
+                "COALESCE(SUM(logged_in_messages), 0) AS logged_in_messages FROM usage_daily"
+            ).fetchone()
+            unique_users = conn.execute("SELECT COUNT(*) FROM usage_users").fetchone()[0]
+            daily = conn.execute(
+                "SELECT d.date, d.messages, d.anonymous_messages, d.logged_in_messages, "
+                "(SELECT COUNT(*) FROM usage_daily_users u WHERE u.date = d.date) AS users "
+                "FROM usage_daily d WHERE d.date >= ? ORDER BY d.date",
+                (start_day,)
+            ).fetchall()
+
+        return {"totals": dict(totals), "unique_users": unique_users, "daily": [dict(row) for row in daily]}
+
+    def rebuild_usage_rollups(self) -> Dict:
+        day = "date(timestamp, 'unixepoch', 'localtime')"
+        with self._connection() as conn, conn:
+            conn.execute("DELETE FROM usage_daily")
+            conn.execute("DELETE FROM usage_daily_users")
+            conn.execute("DELETE FROM usage_users")
+            conn.execute(
+                f"INSERT INTO usage_daily (date, messages, anonymous_messages, logged_in_messages) "
+                f"SELECT {day}, COUNT(*), SUM(is_anonymous), SUM(1 - is_anonymous) FROM messages GROUP BY 1"
+            )
+            conn.execute(f"INSERT INTO usage_daily_users (date, user_id) SELECT DISTINCT {day}, user_id FROM messages")
+            conn.execute(
+                "INSERT INTO usage_users (user_id, is_anonymous, last_seen) "
+                "SELECT user_id, MAX(is_anonymous), MAX(timestamp) FROM messages GROUP BY user_id"
+            )
+            messages = conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+            days = conn.execute("SELECT COUNT(*) FROM usage_daily").fetchone()[0]
+            users = conn.execute("SELECT COUNT(*) FROM usage_users").fetchone()[0]
+
+        return {"messages": messages, "days": days, "users": users}
+
+    def get_answer_curation(self) -> Dict[str, bool]:
+        with self._connection() as conn:
+            return {row["key"]: bool(row["eligible"])
+                    for row in conn.execute("SELECT key, eligible FROM answer_curation")}
+
+    def set_answer_curation(self, key: str, question: str, eligible: bool, updated_by: str = ""):
+        with self._connection() as conn, conn:
+            conn.execute(
+                "INSERT INTO answer_curation (key, question, eligible, updated_by, updated_at) "
+                "VALUES (?, ?, ?, ?, ?) ON CONFLICT(key) DO UPDATE SET question = excluded.question, "
+                "eligible = excluded.eligible, updated_by = excluded.updated_by, updated_at = excluded.updated_at",
+                (key, question, int(eligible), updated_by, time.time())
+            )
+
+@st.cache_resource
+def get_conversation_store() -> ConversationStore:
+    """Process-wide conversation store selected by the storage_backend setting"""
+    backend = get_setting("storage_backend", "firestore")
+    if backend == "sqlite":
+        return SQLiteStore(get_setting("sqlite_path", "chatbot.db"))
+    if backend != "firestore":
+        raise ValueError(f"Unknown storage_backend: {backend}")
+    return FirestoreStore(init_firebase(), writer=get_conversation_writer())
+
+# Answer retrieval
+STOPWORDS = frozenset("""
+yang dan di ke dari untuk pada dengan ini itu adalah atau juga saya aku kamu anda kami kita
+ya tidak bisa ada akan sudah dalam oleh karena jika kalau tolong mohon dong sih nya kah
+the a an of to in on for is are was be do does can i you my me please
+""".split())
+
+def tokenize(text: str) -> List[str]:
+    """Case-folded word tokens without stopwords"""
+    return [token for token in re.findall(r"\w+", text.casefold())
+            if len(token) > 1 and token not in STOPWORDS]
+
+def question_key(question: str) -> str:
+    """Stable id of a question, shared by its repeats and by the curation records"""
+    return hashlib.sha1(normalize_prompt(question).encode("utf-8")).hexdigest()[:20]
+
+class AnswerIndex:
+    """TF-IDF index over stored questions, so repeated questions can be answered without the model"""
+
+    def __init__(self, store: ConversationStore, answer_threshold: float = 0.9,
+                 suggest_threshold: float = 0.6, require_approval: bool = False,
+                 min_answer_chars: int = 20, overlap_seconds: float = 120.0):
+        self.store = store
+        self.answer_threshold = answer_threshold
+        self.suggest_threshold = suggest_threshold
+        self.require_approval = require_approval
+        self.min_answer_chars = min_answer_chars
+        self.overlap = timedelta(seconds=overlap_seconds)
+
+        # One entry per distinct question; repeats only bump the count and keep the latest answer
+        self.entries = []
+        self.positions = {}
+        self.vocab = {}
+        self.df = []
+        self.seen_ids = set()
+        self.curation = {}
+        self.high_water_mark = None
+
+        # Postings of entries added since the last lookup, merged in one vectorized rebuild
+        self.pending = ([], [], [])
+        self.doc_ids = self.term_ids = self.tfs = None
+        self.arrays = None
+        self.dirty = False
+
+        self.ready = False
+        self.last_refreshed_at = None
+        self.last_refresh_rows = 0
+        self.last_refresh_seconds = 0.0
+        self.counters = {"lookups": 0, "answered": 0, "suggested": 0}
+        self.lock = threading.Lock()
+
+    def add(self, row: Dict) -> bool:
+        """Index one stored exchange, returns False when it was skipped"""
+        with self.lock:
+            if row["message_id"] in self.seen_ids:
+                return False
+            self.seen_ids.add(row["message_id"])
+            # A context answer may lean on earlier turns, and a served answer is already indexed
+            if row.get("has_context") or row.get("from_index"):
+                return False
+
+            answer = (row.get("response") or "").strip()
+            if len(answer) < self.min_answer_chars:
+                return False
+            timestamp = row.get("timestamp")
+
+            key = question_key(row["input"])
+            position = self.positions.get(key)
+            if position is not None:
+                entry = self.entries[position]
+                entry["count"] += 1
+                if timestamp is not None and (entry["last_asked"] is None or timestamp >= entry["last_asked"]):
+                    entry["answer"] = answer
+                    entry["last_asked"] = timestamp
+                return True
+
+            terms = {}
+            for token in tokenize(row["input"]):
+                terms[token] = terms.get(token, 0) + 1
+            if not terms:
+                return False
+
+            position = len(self.entries)
+            self.entries.append({"key": key, "question": row["input"], "answer": answer,
+                                 "count": 1, "last_asked": timestamp})
+            self.positions[key] = position
+            doc_ids, term_ids, tfs = self.pending
+            for term, tf in terms.items():
+                term_id = self.vocab.setdefault(term, len(self.vocab))
+                if term_id == len(self.df):
+                    self.df.append(0)
+                self.df[term_id] += 1
+                doc_ids.append(position)
+                term_ids.append(term_id)
+                tfs.append(tf)
+            self.dirty = True
+            return True
+
+    def _is_eligible(self, key: str) -> bool:
+        return self.curation.get(key, not self.require_approval)
+
+    def _rebuild(self):
+        """Merge pending postings and recompute weights, norms and the term-sorted layout"""
+        import numpy as np
+
+        doc_ids, term_ids, tfs = self.pending
+        if doc_ids:
+            new = (np.array(doc_ids, dtype=np.int32), np.array(term_ids, dtype=np.int32),
+                   np.array(tfs, dtype=np.float32))
+            if self.doc_ids is None:
+                self.doc_ids, self.term_ids, self.tfs = new
+            else:
+                self.doc_ids = np.concatenate([self.doc_ids, new[0]])
+                self.term_ids = np.concatenate([self.term_ids, new[1]])
+                self.tfs = np.concatenate([self.tfs, new[2]])
+            self.pending = ([], [], [])
+
+        count = len(self.entries)
+        idf = np.log((count + 1) / (np.array(self.df, dtype=np.float32) + 1)) + 1
+        weights = (1 + np.log(self.tfs)) * idf[self.term_ids]
+        norms = np.sqrt(np.bincount(self.doc_ids, weights=weights ** 2, minlength=count))
+
+        # Postings grouped by term: the documents of term t are order[pointers[t]:pointers[t + 1]]
+        order = np.argsort(self.term_ids, kind="stable")
+        pointers = np.concatenate([[0], np.cumsum(np.bincount(self.term_ids, minlength=len(self.df)))])
+        eligible = np.array([self._is_eligible(entry["key"]) for entry in self.entries], dtype=bool)
+
+        self.arrays = {"idf": idf, "norms": norms, "pointers": pointers, "docs": self.doc_ids[order],
+                       "weights": weights[order], "eligible": eligible, "count": count}
+        self.dirty = False
+
+    def search(self, text: str, top_k: int = 5, eligible_only: bool = True) -> List[Dict]:
+        """Stored questions most similar to `text`, with their cosine similarity"""
+        query = {}
+        for token in tokenize(text):
+            query[token] = query.get(token, 0) + 1
+
+        with self.lock:
+            if not query or not self.entries:
+                return []
+            if self.dirty:
+                self._rebuild()
+            arrays = self.arrays
+            known = [(self.vocab[term], tf) for term, tf in query.items() if term in self.vocab]
+            unseen = [tf for term, tf in query.items() if term not in self.vocab]
+            # Entries are only appended, positions below the rebuilt count stay valid
+            entries = self.entries
+
+        if not known:
+            return []
+        import numpy as np
+
+        count = arrays["count"]
+        # Words never seen in a stored question still count towards the query length
+        unseen_idf = np.log(count + 1) + 1
+        query_norm_sq = sum((1 + np.log(tf)) ** 2 for tf in unseen) * unseen_idf ** 2
+
+        scores = np.zeros(count, dtype=np.float32)
+        for term_id, tf in known:
+            weight = (1 + np.log(tf)) * arrays["idf"][term_id]
+            query_norm_sq += weight ** 2
+            start, end = arrays["pointers"][term_id], arrays["pointers"][term_id + 1]
+            scores[arrays["docs"][start:end]] += weight * arrays["weights"][start:end]
+
+        scores /= np.maximum(arrays["norms"], 1e-9) * np.sqrt(query_norm_sq)
+        if eligible_only:
+            scores[~arrays["eligible"]] = 0
+
+        top_k = min(top_k, count)
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-scores[top])]
+        return [dict(entries[i], score=float(scores[i]), eligible=bool(arrays["eligible"][i]))
+                for i in top if scores[i] > 0]
+
+    def lookup(self, prompt: str, has_context: bool = False) -> Optional[Dict]:
+        """Best stored answer above the suggest threshold, with mode "answer" or "suggest" """
+        if not self.ready:
+            return None
+        matches = self.search(prompt, top_k=1)
+        with self.lock:
+            self.counters["lookups"] += 1
+            if not matches or matches[0]["score"] < self.suggest_threshold:
+                return None
+
+            # A follow-up question may only make sense with the conversation, so it is never
+            # answered from the index directly
+            best = matches[0]
+            mode = "answer" if best["score"] >= self.answer_threshold and not has_context else "suggest"
+            self.counters["answered" if mode == "answer" else "suggested"] += 1
+        return dict(best, mode=mode)
+
+    def refresh(self) -> int:
+        """Index messages stored since the last refresh and reload the curation decisions"""
+        start = time.perf_counter()
+        since = self.high_water_mark - self.overlap if self.high_water_mark is not None else None
+        rows = 0
+        for row in self.store.iter_conversations(start=since):
+            self.add(row)
+            rows += 1
+            if row["timestamp"] is not None and (self.high_water_mark is None
+                                                 or row["timestamp"] > self.high_water_mark):
+                self.high_water_mark = row["timestamp"]
+
+        curation = self.store.get_answer_curation()
+        with self.lock:
+            if curation != self.curation:
+                self.curation = curation
+                self.dirty = True
+            # Rebuilt here so a chat turn never pays for it after a refresh
+            if self.dirty and self.entries:
+                self._rebuild()
+            self.ready = True
+            self.last_refreshed_at = datetime.now()
+            self.last_refresh_rows = rows
+            self.last_refresh_seconds = time.perf_counter() - start
+        return rows
+
+    def start(self, interval: float):
+        """Build the index and keep it fed from a background thread"""
+        def run():
+            while True:
+                try:
+                    self.refresh()
+                except Exception as e:
+                    logger.warning("Answer index refresh failed: %s", e)
+                time.sleep(interval)
+
+        threading.Thread(target=run, name="answer-index", daemon=True).start()
+
+    def set_eligible(self, key: str, eligible: bool, updated_by: str = ""):
+        """Persist an admin decision and apply it to the next lookup"""
+        with self.lock:
+            position = self.positions.get(key)
+            question = self.entries[position]["question"] if position is not None else ""
+        self.store.set_answer_curation(key, question, eligible, updated_by)
+        with self.lock:
+            self.curation[key] = eligible
+            self.dirty = True
+
+    def top_entries(self, limit: int = 50) -> List[Dict]:
+        """Most frequently asked questions with their current eligibility"""
+        with self.lock:
+            entries = sorted(self.entries, key=lambda entry: entry["count"], reverse=True)[:limit]
+            return [dict(entry, eligible=self._is_eligible(entry["key"])) for entry in entries]
+
+    def stats(self) -> Dict:
+        with self.lock:
+            lookups = self.counters["lookups"]
+            return dict(
+                self.counters,
+                entries=len(self.entries),
+                terms=len(self.vocab),
+                ready=self.ready,
+                hit_ratio=(self.counters["answered"] + self.counters["suggested"]) / lookups if lookups else 0.0,
+                last_refreshed_at=self.last_refreshed_at,
+                last_refresh_rows=self.last_refresh_rows,
+                last_refresh_seconds=self.last_refresh_seconds
+            )
+
+@st.cache_resource
+def get_answer_index() -> Optional[AnswerIndex]:
+    """Process-wide answer index, None when retrieval is disabled"""
+    if not get_setting("retrieval_enabled", True):
+        return None
+    index = AnswerIndex(
+        get_conversation_store(),
+        answer_threshold=get_setting("retrieval_answer_threshold", 0.9),
+        suggest_threshold=get_setting("retrieval_suggest_threshold", 0.6),
+        require_approval=get_setting("retrieval_require_approval", False)
+    )
+    index.start(get_setting("retrieval_refresh_interval", 60.0))
+    return index
+
+# Latency metrics
+class LatencyHistogram:
+    """Cumulative Prometheus-style histogram plus a window of recent samples"""
+
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+    def __init__(self, recent_size: int = 1000):
+        self.counts = [0] * (len(self.BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=recent_size)
+
+    def observe(self, seconds: float):
+        index = next((i for i, bound in enumerate(self.BUCKETS) if seconds <= bound), len(self.BUCKETS))
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += seconds
+        self.recent.append(seconds)
+
+    def summary(self) -> Dict:
+        recent = sorted(self.recent)
+
+        def pick(q: float) -> float:
+            return recent[min(len(recent) - 1, int(q * len(recent)))] if recent else 0.0
+
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "avg": self.sum / self.count if self.count else 0.0,
+            "p50": pick(0.50),
+            "p95": pick(0.95),
+            "p99": pick(0.99),
+            "max": recent[-1] if recent else 0.0
+        }
+
+class SizeHistogram(LatencyHistogram):
+    """Histogram of prompt sizes in characters"""
+
+    BUCKETS = (128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+class TurnTrace:
+    """Stage timings of one chat turn"""
+
+    def __init__(self, metrics: "MetricsRegistry", user_id: str, prompt: str):
+        self.metrics = metrics
+        self.user_id = user_id
+        self.prompt = prompt[:80]
+        self.started_at = datetime.now()
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.sizes = {}
+        self.success = True
+
+    @contextmanager
+    def span(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stages[stage] = self.stages.get(stage, 0.0) + elapsed
+            self.metrics.observe(stage, elapsed)
+
+    def record_overlap(self, waited: float, stages=("persist_input", "visualization", "save")):
+        """Record how much of the background stages' time the turn did not have to wait for"""
+        saved = max(0.0, sum(self.stages.get(stage, 0.0) for stage in stages) - waited)
+        self.stages["overlap_saved"] = saved
+        self.metrics.observe("overlap_saved", saved)
+
+    def record_size(self, name: str, chars: int):
+        """Record how many characters a part of the request had"""
+        self.sizes[name] = chars
+        self.metrics.observe_size(name, chars)
+
+    def first_chunk(self, chunks, stage: str = "first_token"):
+        """Pass chunks through, recording the time until the first one arrived"""
+        for chunk in chunks:
+            if stage not in self.stages:
+                elapsed = time.perf_counter() - self.start
+                self.stages[stage] = elapsed
+                self.metrics.observe(stage, elapsed)
+            yield chunk
+
+    def to_dict(self) -> Dict:
+        return {
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "user_id": self.user_id,
+            "prompt": self.prompt,
+            "success": self.success,
+            "total": self.stages.get("turn", 0.0),
+            "stages": dict(self.stages),
+            "sizes": dict(self.sizes)
+        }
+
+class MetricsRegistry:
+    """Per-stage latency histograms and the most recent chat turns"""
+
+    def __init__(self, recent_turns: int = 200):
+        self.histograms = {}
+        self.sizes = {}
+        self.counters = {}
+        self.turns = deque(maxlen=recent_turns)
+        self.started_at = datetime.now()
+        self.lock = threading.Lock()
+
+    def observe(self, stage: str, seconds: float):
+        with self.lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = LatencyHistogram()
+            histogram.observe(seconds)
+
+    def observe_size(self, name: str, chars: int):
+        with self.lock:
+            histogram = self.sizes.get(name)
+            if histogram is None:
+                histogram = self.sizes[name] = SizeHistogram()
+            histogram.observe(chars)
+
+    def count(self, event: str, amount: int = 1):
+        """Count an event such as a cache hit"""
+        with self.lock:
+            self.counters[event] = self.counters.get(event, 0) + amount
+
+    def counter_summary(self) -> Dict:
+        with self.lock:
+            return dict(sorted(self.counters.items()))
+
+    @contextmanager
+    def span(self, stage: str):
+        """Time a block outside of a chat turn (history reads, rendering)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def start_turn(self, user_id: str, prompt: str) -> TurnTrace:
+        return TurnTrace(self, user_id, prompt)
+
+    def finish_turn(self, turn: TurnTrace, success: bool = True):
+        turn.success = success
+        elapsed = time.perf_counter() - turn.start
+        turn.stages["turn"] = elapsed
+        self.observe("turn", elapsed)
+        with self.lock:
+            self.turns.append(turn.to_dict())
+
+    def slowest_turns(self, count: int = 10) -> List[Dict]:
+        with self.lock:
+            turns = list(self.turns)
+        return sorted(turns, key=lambda turn: turn["total"], reverse=True)[:count]
+
+    def summary(self) -> Dict:
+        with self.lock:
+            return {stage: histogram.summary() for stage, histogram in sorted(self.histograms.items())}
+
+    def size_summary(self) -> Dict:
+        with self.lock:
+            return {name: histogram.summary() for name, histogram in sorted(self.sizes.items())}
+
+    def to_prometheus(self) -> str:
+        """Histograms in the Prometheus text exposition format"""
+        lines = [
+            "# HELP chatbot_stage_seconds Latency of chat turn stages and storage reads",
+            "# TYPE chatbot_stage_seconds histogram"
+        ]
+        with self.lock:
+            for stage, histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip(LatencyHistogram.BUCKETS + ("+Inf",), histogram.counts):
+                    cumulative += count
+                    lines.append(f'chatbot_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'chatbot_stage_seconds_sum{{stage="{stage}"}} {histogram.sum:.6f}')
+                lines.append(f'chatbot_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+
+            if self.sizes:
+                lines.append("# HELP chatbot_prompt_chars Characters sent to the model per chat turn")
+                lines.append("# TYPE chatbot_prompt_chars histogram")
+            for name, histogram in sorted(self.sizes.items()):
+                cumulative = 0
+                for bound, count in zip(SizeHistogram.BUCKETS + ("+Inf",), histogram.counts):
+                    cumulative += count
+                    lines.append(f'chatbot_prompt_chars_bucket{{part="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'chatbot_prompt_chars_sum{{part="{name}"}} {histogram.sum:.0f}')
+                lines.append(f'chatbot_prompt_chars_count{{part="{name}"}} {histogram.count}')
+
+            if self.counters:
+                lines.append("# HELP chatbot_events_total Counted events such as auth cache hits")
+                lines.append("# TYPE chatbot_events_total counter")
+            for event, value in sorted(self.counters.items()):
+                lines.append(f'chatbot_events_total{{event="{event}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "exported_at": datetime.now().isoformat(timespec="seconds"),
+            "buckets": list(LatencyHistogram.BUCKETS),
+            "stages": {stage: dict(summary, buckets=self.histograms[stage].counts)
+                       for stage, summary in self.summary().items()},
+            "prompt_chars": {name: dict(summary, buckets=self.sizes[name].counts)
+                             for name, summary in self.size_summary().items()},
+            "events": self.counter_summary(),
+            "slowest_turns": self.slowest_turns()
+        }, indent=2)
+
+@st.cache_resource
+def get_metrics() -> MetricsRegistry:
+    """Latency metrics shared by all sessions"""
+    return MetricsRegistry()
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    """Serves /metrics (Prometheus text), /metrics.json and /ready (startup warm-up)"""
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        metrics = self.server.metrics
+        status = 200
+        if self.path == "/metrics":
+            body, content_type = metrics.to_prometheus(), "text/plain; version=0.0.4"
+        elif self.path == "/metrics.json":
+            body, content_type = metrics.to_json(), "application/json"
+        elif self.path == "/ready":
+            report = self.server.warmup.report()
+            body, content_type = json.dumps(report, indent=2), "application/json"
+            status = 200 if report["ready"] else 503
+        else:
+            self.send_error(404)
+            return
+
+        payload = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+@st.cache_resource
+def start_metrics_server() -> Optional[ThreadingHTTPServer]:
+    """Expose the metrics over HTTP when metrics_port is set"""
+    port = get_setting("metrics_port", 0)
+    if not port:
+        return None
+    try:
+        server = ThreadingHTTPServer((get_setting("metrics_host", "127.0.0.1"), port), MetricsRequestHandler)
+    except OSError as e:
+        logger.warning("Metrics server not started on port %s: %s", port, e)
+        return None
+    server.daemon_threads = True
+    server.metrics = get_metrics()
+    server.warmup = start_warmup()
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
+
+# Authentication functions
+FIREBASE_SIGN_IN_URL = "https://identitytoolkit.googleapis.com/v1/accounts:signInWithPassword"
+FIREBASE_REFRESH_URL = "https://securetoken.googleapis.com/v1/token"
+# Refresh an ID token this many seconds before it expires
+TOKEN_REFRESH_MARGIN = 60.0
+DEFAULT_ADMIN_EMAILS = ["rizkyanandaalamsyahdly@gmail.com", "administrator@akademik.com"]
+
+class TTLCache:
+    """Thread-safe key/value cache whose entries expire after a TTL"""
+
+    def __init__(self, ttl: float = 300.0, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Return the cached value, or None when missing or expired"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[1] <= time.monotonic():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, ttl: Optional[float] = None):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, key=None):
+        """Drop one entry, or all of them"""
+        with self.lock:
+            if key is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(key, None)
+
+    def stats(self) -> Dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0
+            }
+
+class AuthManager:
+    def __init__(self):
+        self.db = init_firebase()
+        # Web API key of the Firebase project; enables real password checks and ID-token sessions
+        self.api_key = get_setting("firebase_web_api_key", "")
+        admin_emails = get_setting("admin_emails", DEFAULT_ADMIN_EMAILS)
+        if isinstance(admin_emails, str):
+            admin_emails = admin_emails.split(",")
+        self.admin_emails = {email.strip().lower() for email in admin_emails if email.strip()}
+        self.roles_doc = get_setting("admin_roles_doc", "roles/admins")
+        cache_ttl = get_setting("auth_cache_ttl", 300.0)
+        # Shared by all sessions: user records, the roles document and verified ID tokens
+        self.users = TTLCache(cache_ttl)
+        self.roles = TTLCache(cache_ttl)
+        self.tokens = TTLCache(cache_ttl)
+        self.http = requests.Session()
+        self.metrics = get_metrics()
+    
+    def create_user_account(self, email: str, password: str, display_name: str):
+        """Create a new user account"""
+        try:
+            user = auth.create_user(
+                email=email,
+                password=password,
+                display_name=display_name
+            )
+            return {"success": True, "user_id": user.uid}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+    
+    def verify_user_credentials(self, email: str, password: str):
+        """Sign in with email and password, returns the user and, with an API key, its tokens"""
+        try:
+            with self.metrics.span("auth_login"):
+                if self.api_key:
+                    return self._sign_in_with_password(email, password)
+
+                # Without an API key the password cannot be checked, only that the user exists
+                user = self.users.get(email.lower())
+                self.metrics.count("auth_user_cache_hit" if user is not None else "auth_user_cache_miss")
+                if user is None:
+                    record = auth.get_user_by_email(email)
+                    user = {"user_id": record.uid, "display_name": record.display_name,
+                            "claims": record.custom_claims or {}}
+                    self.users.put(email.lower(), user)
+                return {"success": True, **user}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+
+    def _sign_in_with_password(self, email: str, password: str) -> Dict:
+        response = self.http.post(FIREBASE_SIGN_IN_URL, params={"key": self.api_key}, timeout=10,
+                                  json={"email": email, "password": password, "returnSecureToken": True})
+        body = response.json()
+        if response.status_code != 200:
+            return {"success": False, "error": body.get("error", {}).get("message", f"HTTP {response.status_code}")}
+
+        claims = self.verify_session(body["idToken"])
+        return {
+            "success": True,
+            "user_id": claims["uid"],
+            "display_name": body.get("displayName") or claims.get("name"),
+            "claims": claims,
+            "id_token": body["idToken"],
+            "refresh_token": body["refreshToken"]
+        }
+
+    def verify_session(self, id_token: str) -> Dict:
+        """Claims of a Firebase ID token, verified locally and cached until it expires"""
+        key = hashlib.sha256(id_token.encode("utf-8")).hexdigest()
+        claims = self.tokens.get(key)
+        self.metrics.count("auth_token_cache_hit" if claims is not None else "auth_token_cache_miss")
+        if claims is not None:
+            return claims
+
+        # Signature check against Google's public keys, which firebase_admin caches
+        with self.metrics.span("auth_verify"):
+            claims = auth.verify_id_token(id_token)
+        self.tokens.put(key, claims, ttl=min(self.tokens.ttl, claims["exp"] - time.time()))
+        return claims
+
+    def check_session(self, id_token: str, refresh_token: str = "") -> Dict:
+        """Re-authenticate a signed-in session, refreshing its ID token once it has expired"""
+        try:
+            try:
+                claims = self.verify_session(id_token)
+            except auth.ExpiredIdTokenError:
+                if not refresh_token or not self.api_key:
+                    raise
+                with self.metrics.span("auth_refresh"):
+                    response = self.http.post(FIREBASE_REFRESH_URL, params={"key": self.api_key}, timeout=10,
+                                              data={"grant_type": "refresh_token", "refresh_token": refresh_token})
+                    response.raise_for_status()
+                    body = response.json()
+                id_token, refresh_token = body["id_token"], body["refresh_token"]
+                claims = self.verify_session(id_token)
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+
+        return {
+            "success": True,
+            "id_token": id_token,
+            "refresh_token": refresh_token,
+            "expires_at": claims.get("exp", 0),
+            "is_admin": self.is_admin(claims.get("email", ""), claims)
+        }
+    
+    def is_admin(self, email: str, claims: Optional[Dict] = None) -> bool:
+        """Check if user is admin: custom claims, the roles document or the configured admin emails"""
+        claims = claims or {}
+        if claims.get("admin") is True or claims.get("role") == "admin":
+            return True
+        email = (email or "").lower()
+        return email in self.admin_emails or email in self.role_emails()
+
+    def role_emails(self) -> frozenset:
+        """Admin emails listed in the Firestore roles document, e.g. roles/admins {"emails": [...]}"""
+        if not self.roles_doc:
+            return frozenset()
+        emails = self.roles.get(self.roles_doc)
+        self.metrics.count("auth_role_cache_hit" if emails is not None else "auth_role_cache_miss")
+        if emails is not None:
+            return emails
+
+        with self.metrics.span("auth_roles"):
+            try:
+                collection, document = self.roles_doc.split("/", 1)
+                snapshot = self.db.collection(collection).document(document).get()
+                data = (snapshot.to_dict() or {}) if snapshot.exists else {}
+                emails = frozenset(email.lower() for email in data.get("emails", []))
+            except Exception as e:
+                logger.warning("Reading admin roles from %s failed: %s", self.roles_doc, e)
+                # Retry soon instead of hiding admins for a whole TTL
+                self.roles.put(self.roles_doc, frozenset(), ttl=min(self.roles.ttl, 30.0))
+                return frozenset()
+        self.roles.put(self.roles_doc, emails)
+        return emails
+
+    def stats(self) -> Dict:
+        return {"users": self.users.stats(), "roles": self.roles.stats(), "tokens": self.tokens.stats()}
+
+@st.cache_resource
+def get_auth_manager() -> AuthManager:
+    """AuthManager shared by all sessions"""
+    return AuthManager()
+
+def generate_anonymous_user_id():
+    """Generate anonymous user ID"""
+    if "anonymous_user_id" not in st.session_state:
+        st.session_state.anonymous_user_id = f"anon_{uuid.uuid4().hex[:8]}"
+    return st.session_state.anonymous_user_id
+
+# Chat functions
+EXPORT_FIELDS = ["user_id", "message_id", "input", "response", "timestamp", "is_anonymous", "has_context",
+                 "from_index"]
+
+class ChatManager:
+    def __init__(self):
+        self.store = get_conversation_store()
+        self.api_url = get_setting("ngrok_api_url", "YOUR_NGROK_URL_HERE")
+        self.stream_responses = get_setting("stream_responses", True)
+        self.llm_client = get_llm_client()
+        self.answer_cache = get_answer_cache()
+        self.inflight = SingleFlight()
+        self.batcher = get_micro_batcher()
+        self.answer_index = get_answer_index()
+        self.rate_limiter = RateLimiter(get_setting("rate_limit_per_minute", 10.0),
+                                        get_setting("rate_limit_burst", 5))
+        self.admission = get_admission_queue()
+        self.queue_timeout = get_setting("admission_queue_timeout", 120.0)
+        # Persistence and visualization extraction run here, off the turn's critical path
+        self.pipeline = ThreadPoolExecutor(max_workers=get_setting("turn_pipeline_workers", 8),
+                                           thread_name_prefix="turn-pipeline")
+        # Inputs of turns cut off by a rerun or a closed tab are dropped after this long
+        self.pending_ttl = get_setting("pending_message_ttl", 900.0)
+        self.last_pending_purge = 0.0
+        # Export files of sessions that never downloaded them are deleted after this long
+        self.export_ttl = get_setting("export_file_ttl", 3600.0)
+        self.lock = threading.Lock()
+        self.viz_manager = DataVisualizationManager()
+    
+    def process_response_with_visualization(self, user_input: str, bot_response: str) -> Dict:
+        """Process response and extract visualization data if needed"""
+        viz_info = self.viz_manager.detect_data_request(user_input, bot_response)
+
+        # Only the extracted data is kept - figures and tables are built when rendered
+        result = {
+            "response": bot_response,
+            "viz_type": None,
+            "viz_data": []
+        }
+
+        if viz_info["needs_visualization"] and viz_info["has_data"]:
+            data = self.viz_manager.extract_data_from_response(bot_response)
+
+            if data:
+                result["viz_type"] = viz_info["type"]
+                result["viz_data"] = [{"label": d["label"], "value": d["value"]} for d in data]
+
+        return result
+    
+    def find_stored_answer(self, prompt: str, context: Optional[Dict] = None) -> Optional[Dict]:
+        """Look the question up in the index of past answers"""
+        if self.answer_index is None:
+            return None
+        try:
+            return self.answer_index.lookup(prompt, has_context=bool(context))
+        except Exception as e:
+            logger.warning("Answer index lookup failed: %s", e)
+            return None
+
+    def context_digest(self, context: Optional[Dict]) -> str:
+        """Short hash of the conversation context, empty when there is none"""
+        if not context:
+            return ""
+        return hashlib.sha1(json.dumps(context, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+    def _check_rate(self, user_id: str) -> Optional[Dict]:
+        """Error result when the user has used up their request budget"""
+        retry_after = self.rate_limiter.acquire(user_id) if user_id else 0.0
+        if not retry_after:
+            return None
+        return {"success": False, "rate_limited": True, "retry_after": retry_after,
+                "error": f"Too many questions in a short time, please try again in {math.ceil(retry_after)}s"}
+
+    def _admit(self, user_id: str, on_queue=None, weight: float = 1.0) -> tuple:
+        """Wait for an upstream slot, or a share of one; returns (ticket, error result)"""
+        if self.admission is None:
+            return None, None
+        start = time.perf_counter()
+        ticket = self.admission.enter(user_id, self.queue_timeout, on_queue, weight=weight)
+        waited = time.perf_counter() - start
+        if waited > 0.001:
+            get_metrics().observe("queue_wait", waited)
+        if ticket is None:
+            return None, {"success": False, "error": "The model is busy, please try again in a moment"}
+        return ticket, None
+
+    def _release(self, ticket: Optional[AdmissionTicket]):
+        if self.admission is not None:
+            self.admission.release(ticket)
+
+    def send_message_to_api(self, prompt: str, context: Optional[Dict] = None, user_id: str = "",
+                            on_queue=None) -> Dict:
+        """Send message to ngrok API"""
+        digest = self.context_digest(context)
+        cached = self.answer_cache.get(prompt, scope=digest)
+        if cached is not None:
+            return {"success": True, "response": cached, "cached": True}
+
+        limited = self._check_rate(user_id)
+        if limited is not None:
+            return limited
+
+        # Identical prompts already on their way to the backend share its answer
+        key = ("send", normalize_prompt(prompt), digest)
+        call, is_leader = self.inflight.join(key)
+        if not is_leader:
+            result = self.inflight.wait(call, self._coalesce_timeout())
+            if result is None:
+                return {"success": False, "error": "Timed out waiting for an identical request"}
+            return dict(result, coalesced=True)
+
+        result = {"success": False, "error": "Request aborted"}
+        ticket = None
+        try:
+            batched = (self._send_batched(prompt, context, digest, user_id, on_queue)
+                       if self.batcher is not None else None)
+            if batched is not None:
+                # The prompt held its share of a slot until its batch came back
+                result = batched
+            else:
+                ticket, error = self._admit(user_id, on_queue)
+                result = error if error is not None else self._send_message(prompt, context, digest)
+        finally:
+            self._release(ticket)
+            self.inflight.publish(key, call, result)
+        return result
+
+    def _coalesce_timeout(self) -> float:
+        """How long a coalesced call waits for the leader's response to start"""
+        timeout = self.llm_client.timeout * (self.llm_client.max_retries + 1) + self.llm_client.backoff_max
+        # The leader may first have to wait for an upstream slot
+        return timeout + (self.queue_timeout if self.admission is not None else 0)
+
+    def _send_batched(self, prompt: str, context: Optional[Dict] = None, digest: str = "", user_id: str = "",
+                      on_queue=None) -> Optional[Dict]:
+        """Send together with other sessions' prompts; None when the backend has no batch endpoint"""
+        if self.batcher.supported is False:
+            return None
+        payload = {"prompt": prompt}
+        if context:
+            payload["context"] = context
+
+        start = time.perf_counter()
+        # Queued fairly as this user; a full batch costs one upstream slot
+        ticket, error = self._admit(user_id, on_queue, weight=1 / self.batcher.max_batch_size)
+        if error is not None:
+            return error
+        result = self.batcher.submit(payload, self._coalesce_timeout(), ticket=ticket)
+        if result is not None and result["success"] and result["response"] != "No response received":
+            self.answer_cache.put(prompt, result["response"], time.perf_counter() - start, scope=digest)
+        return result
+
+    def _send_message(self, prompt: str, context: Optional[Dict] = None, digest: str = "") -> Dict:
+        try:
+            headers = {"Content-Type": "application/json"}
+            payload = {"prompt": prompt}
+            if context:
+                payload["context"] = context
+
+            start = time.perf_counter()
+            response = self.llm_client.post("/generate", json=payload, headers=headers)
+
+            if response.status_code == 200:
+                data = response.json()
+                if data.get("response"):
+                    self.answer_cache.put(prompt, data["response"], time.perf_counter() - start, scope=digest)
+                return {"success": True, "response": data.get("response", "No response received")}
+            else:
+                return {"success": False, "error": f"API Error: {response.status_code}"}
+        
+        except requests.exceptions.RequestException as e:
+            return {"success": False, "error": f"Connection error: {str(e)}"}
+
+    def stream_message_to_api(self, prompt: str, context: Optional[Dict] = None, user_id: str = "",
+                              on_queue=None) -> Dict:
+        """Send message to ngrok API and stream the generated tokens back"""
+        digest = self.context_digest(context)
+        cached = self.answer_cache.get(prompt, scope=digest)
+        if cached is not None:
+            return {"success": True, "streaming": False, "error": None,
+                    "stream": iter([cached]), "cached": True}
+
+        limited = self._check_rate(user_id)
+        if limited is not None:
+            return limited
+
+        # Identical prompts already streaming attach to the same upstream response
+        key = ("stream", normalize_prompt(prompt), digest)
+        call, is_leader = self.inflight.join(key)
+        if not is_leader:
+            leader_result = self.inflight.wait(call, self._coalesce_timeout())
+            if leader_result is None:
+                return {"success": False, "error": "Timed out waiting for an identical request"}
+            if call.stream is None:
+                return dict(leader_result, coalesced=True)
+            result = {"success": True, "streaming": leader_result["streaming"], "error": None,
+                      "coalesced": True}
+            result["stream"] = self._follow_stream(iter(call.stream), leader_result, result)
+            return result
+
+        result = {"success": False, "error": "Request aborted"}
+        shared = None
+        ticket = None
+        try:
+            ticket, error = self._admit(user_id, on_queue)
+            if error is not None:
+                result = error
+            else:
+                result = self._stream_message(prompt, context, digest)
+                close = result.pop("close", None)
+                if result["success"]:
+                    # The slot is held until the whole answer has been generated or its last reader
+                    # goes away (rerun, New Chat, closed tab), whichever comes first
+                    shared = SharedStream(result.pop("stream"),
+                                          on_done=lambda: self._finish_stream(key, call, ticket, close))
+        finally:
+            if shared is None:
+                self._release(ticket)
+            self.inflight.publish(key, call, result, stream=shared)
+
+        if shared is not None:
+            # The published result must not hold the leader's reader, or dropping it would never close the stream
+            leader = {"success": True, "streaming": result["streaming"], "error": None}
+            leader["stream"] = self._follow_stream(iter(shared), result, leader)
+            return leader
+        return result
+
+    def _finish_stream(self, key, call: InFlightCall, ticket: Optional[AdmissionTicket], close=None):
+        try:
+            if close is not None:
+                # Also covers a stream abandoned before its first chunk was pulled
+                close()
+        finally:
+            self.inflight.release(key, call)
+            self._release(ticket)
+
+    def _follow_stream(self, reader: SharedStreamReader, leader_result: Dict, result: Dict):
+        """Read a coalesced stream and pick up the leader's error once it ends"""
+        # The reader is opened by the caller, so even a generator that is never started leaves on drop
+        yield from reader
+        result["error"] = leader_result["error"]
+        if reader.shared.aborted and not result["error"]:
+            result["error"] = "Stream interrupted: the request was cancelled"
+
+    def _stream_message(self, prompt: str, context: Optional[Dict] = None, digest: str = "") -> Dict:
+        start = time.perf_counter()
+        try:
+            headers = {
+                "Content-Type": "application/json",
+                "Accept": "text/event-stream, application/x-ndjson, application/json"
+            }
+            payload = {"prompt": prompt, "stream": True}
+            if context:
+                payload["context"] = context
+
+            # Read timeout applies between chunks, not to the whole generation
+            response = self.llm_client.post("/generate", json=payload, headers=headers,
+                                            stream=True, timeout=(10, self.llm_client.timeout))
+
+            if response.status_code != 200:
+                response.close()
+                return {"success": False, "error": f"API Error: {response.status_code}"}
+
+        except requests.exceptions.RequestException as e:
+            return {"success": False, "error": f"Connection error: {str(e)}"}
+
+        content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+        result = {
+            "success": True,
+            "streaming": content_type != "application/json",
+            "error": None
+        }
+        chunks = self._iter_response_chunks(response, content_type, result)
+        result["stream"] = self._cache_streamed_answer(prompt, chunks, result, start, digest)
+        result["close"] = response.close
+        return result
+
+    def _cache_streamed_answer(self, prompt: str, chunks, result: Dict, start: float, digest: str = ""):
+        """Pass chunks through and cache the full answer once the stream completes"""
+        parts = []
+        try:
+            for chunk in chunks:
+                parts.append(chunk)
+                yield chunk
+        finally:
+            # Closing this generator early closes the response reader too
+            chunks.close()
+
+        if parts and not result["error"]:
+            self.answer_cache.put(prompt, "".join(parts), time.perf_counter() - start, scope=digest)
+
+    def _iter_response_chunks(self, response, content_type: str, result: Dict):
+        """Yield text chunks from a streaming (SSE, NDJSON, chunked) or plain JSON response"""
+        try:
+            if content_type == "application/json":
+                # Backend doesn't stream - fall back to the full response body
+                data = response.json()
+                if data.get("response"):
+                    yield data["response"]
+                else:
+                    result["error"] = "No response received"
+
+            elif content_type == "text/event-stream":
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith("data:"):
+                        continue
+                    # SSE strips a single space after the field name
+                    data = line[len("data:"):]
+                    if data.startswith(" "):
+                        data = data[1:]
+                    if data.strip() == "[DONE]":
+                        break
+                    chunk = self._parse_stream_event(data)
+                    if chunk:
+                        yield chunk
+
+            elif content_type in ("application/x-ndjson", "application/jsonl"):
+                for line in response.iter_lines(decode_unicode=True):
+                    if line:
+                        chunk = self._parse_stream_event(line)
+                        if chunk:
+                            yield chunk
+
+            else:
+                # Plain chunked text
+                response.encoding = response.encoding or "utf-8"
+                for chunk in response.iter_content(chunk_size=None, decode_unicode=True):
+                    if chunk:
+                        yield chunk
+
+        except (requests.exceptions.RequestException, ValueError) as e:
+            result["error"] = f"Stream interrupted: {str(e)}"
+            if isinstance(e, requests.exceptions.RequestException) and hasattr(response, "record_failure"):
+                response.record_failure()
+        finally:
+            response.close()
+
+    def _parse_stream_event(self, data: str) -> str:
+        """Extract the text of one streamed event"""
+        if not data.lstrip().startswith("{"):
+            # Raw text token
+            return data
+
+        event = json.loads(data)
+        if event.get("error"):
+            raise ValueError(event["error"])
+        return event.get("token") or event.get("text") or event.get("response") or ""
+
+    def begin_conversation(self, user_id: str, user_input: str, turn: Optional[TurnTrace] = None):
+        """Persist the user's input in the background while the model generates, returns a Future"""
+        def begin():
+            with turn.span("persist_input") if turn is not None else nullcontext():
+                return self.store.begin_message(user_id, user_input, datetime.now())
+
+        self._purge_stale_pending()
+        return self.pipeline.submit(begin)
+
+    def _purge_stale_pending(self):
+        """Drop begun inputs that never got an answer, at most once per pending_message_ttl"""
+        now = time.monotonic()
+        with self.lock:
+            if now - self.last_pending_purge < self.pending_ttl:
+                return
+            self.last_pending_purge = now
+
+        def purge():
+            try:
+                purged = self.store.purge_pending(datetime.now() - timedelta(seconds=self.pending_ttl))
+                if purged:
+                    logger.info("Dropped %d unanswered turns older than %.0fs", purged, self.pending_ttl)
+            except Exception as e:
+                logger.warning("Purging unanswered turns failed: %s", e)
+
+        self.pipeline.submit(purge)
+
+    def complete_conversation(self, user_id: str, begun, user_input: str, bot_response: str,
+                              turn: Optional[TurnTrace] = None, has_context: bool = False,
+                              from_index: bool = False):
+        """Store the answer of a begun turn in the background, returns a Future"""
+        def complete():
+            try:
+                message_id = begun.result()
+            except Exception as e:
+                logger.warning("Persisting the input failed, saving the whole turn instead: %s", e)
+                message_id = None
+
+            with turn.span("save") if turn is not None else nullcontext():
+                if message_id is None:
+                    self.store.save_message(user_id, user_input, bot_response, datetime.now(),
+                                            has_context, from_index)
+                else:
+                    self.store.complete_message(user_id, message_id, user_input, bot_response, datetime.now(),
+                                                has_context, from_index)
+
+        return self.pipeline.submit(complete)
+
+    def discard_conversation(self, user_id: str, begun):
+        """Drop the stored input of a turn that got no answer"""
+        def discard():
+            try:
+                self.store.discard_message(user_id, begun.result())
+            except Exception as e:
+                logger.warning("Discarding a failed turn failed: %s", e)
+
+        self.pipeline.submit(discard)
+
+    def process_response_async(self, user_input: str, bot_response: str, turn: Optional[TurnTrace] = None):
+        """Visualization extraction on the pipeline, returns a Future"""
+        def process():
+            with turn.span("visualization") if turn is not None else nullcontext():
+                return self.process_response_with_visualization(user_input, bot_response)
+
+        return self.pipeline.submit(process)
+
+    def save_conversation(self, user_id: str, user_input: str, bot_response: str):
+        """Save conversation to the configured store"""
+        try:
+            self.store.save_message(user_id, user_input, bot_response, datetime.now())
+            return True
+        except Exception as e:
+            st.error(f"Error saving conversation: {e}")
+            return False
+
+    def get_usage_rollups(self, days: int = 30) -> Dict:
+        """Read pre-aggregated usage metrics instead of scanning messages"""
+        try:
+            rollups = self.store.get_usage_rollups(days)
+            totals = rollups["totals"]
+            today = datetime.now().strftime("%Y-%m-%d")
+            today_row = next((row for row in rollups["daily"] if row["date"] == today), {})
+
+            return {
+                "success": True,
+                "total_messages": totals.get("messages", 0),
+                "anonymous_messages": totals.get("anonymous_messages", 0),
+                "logged_in_messages": totals.get("logged_in_messages", 0),
+                "unique_users": rollups["unique_users"],
+                "today_messages": today_row.get("messages", 0),
+                "daily": rollups["daily"]
+            }
+
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+
+    def export_conversations(self, fmt: str = "csv", compress: bool = False,
+                             start_date=None, end_date=None, user_id: str = "",
+                             chunk_size: int = 500) -> Dict:
+        """Page through stored messages and write them to a temp file in bounded memory"""
+        self._purge_stale_exports()
+        try:
+            start = datetime.combine(start_date, datetime.min.time()) if start_date else None
+            end = datetime.combine(end_date, datetime.min.time()) + timedelta(days=1) if end_date else None
+
+            suffix = ".csv" if fmt == "csv" else ".ndjson"
+            if compress:
+                suffix += ".gz"
+            with tempfile.NamedTemporaryFile(prefix="conversations_export_", suffix=suffix,
+                                             delete=False) as tmp:
+                path = tmp.name
+
+            opener = gzip.open if compress else open
+            rows = 0
+            with opener(path, "wt", encoding="utf-8", newline="") as out:
+                writer = None
+                if fmt == "csv":
+                    writer = csv.DictWriter(out, fieldnames=EXPORT_FIELDS)
+                    writer.writeheader()
+
+                for row in self.store.iter_conversations(start, end, user_id, chunk_size):
+                    row["is_anonymous"] = row["user_id"].startswith("anon_")
+                    row["timestamp"] = row["timestamp"].isoformat() if row["timestamp"] else ""
+                    if writer is not None:
+                        writer.writerow(row)
+                    else:
+                        out.write(json.dumps(row, ensure_ascii=False) + "\n")
+                    rows += 1
+
+            return {"success": True, "path": path, "rows": rows}
+
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+
+    def _purge_stale_exports(self):
+        """Delete export files older than export_file_ttl, left behind by closed sessions"""
+        cutoff = time.time() - self.export_ttl
+        for path in glob.glob(os.path.join(tempfile.gettempdir(), "conversations_export_*")):
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def rebuild_usage_rollups(self) -> Dict:
+        """Backfill the usage rollups from the stored messages"""
+        try:
+            return dict(self.store.rebuild_usage_rollups(), success=True)
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+
+    def count_messages(self, user_id: str) -> int:
+        """Count a user's messages without reading them"""
+        return self.store.count_messages(user_id)
+
+    def get_conversation_history(self, user_id: str, page: int = 1, page_size: int = 10,
+                                 cursors: Optional[Dict] = None) -> Dict:
+        """Get paginated conversation history"""
+        # cursors is kept in session state so the store can continue from the
+        # previously visited page instead of skipping over it again
+        try:
+            if cursors is None:
+                cursors = {}
+
+            # Get total count for pagination
+            with get_metrics().span("history_count"):
+                total_docs = self.count_messages(user_id)
+            total_pages = (total_docs + page_size - 1) // page_size
+            page = min(max(page, 1), max(total_pages, 1))
+
+            with get_metrics().span("history_read"):
+                messages = self.store.get_history_page(user_id, page, page_size, total_docs, cursors)
+
+            return {
+                "success": True,
+                "messages": messages,
+                "total": total_docs,
+                "page": page,
+                "total_pages": total_pages,
+                "cursors": cursors
+            }
+        
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+    
+    def get_all_conversations(self, limit: Optional[int] = None, mode: Optional[str] = None,
+                              max_workers: int = 16, since: Optional[datetime] = None) -> List[Dict]:
+        """Get all conversations for admin panel, newest first"""
+        mode = mode or get_setting("admin_fetch_mode", "collection_group")
+        try:
+            with get_metrics().span("admin_read"):
+                return self.store.get_all_conversations(limit=limit, since=since, mode=mode,
+                                                        max_workers=max_workers)
+
+        except Exception as e:
+            st.error(f"Error fetching conversations: {e}")
+            return []
+
+@st.cache_resource
+def get_chat_manager() -> ChatManager:
+    """ChatManager shared by all sessions - it only holds process-wide resources"""
+    return ChatManager()
+
+# Startup warm-up
+class WarmUp:
+    """Initializes the shared clients and caches in the background after a (re)start"""
+
+    def __init__(self, metrics: MetricsRegistry, timeout: float = 60.0):
+        self.metrics = metrics
+        self.timeout = timeout
+        self.started_at = datetime.now()
+        self.start = time.perf_counter()
+        self.phases = []
+        self.done = threading.Event()
+        self.ready_seconds = None
+        self.first_response_seconds = None
+        self.lock = threading.Lock()
+
+    def _run_phase(self, name: str, step):
+        start = time.perf_counter()
+        detail, error = "", ""
+        try:
+            detail = step() or ""
+        except BaseException as e:
+            # init_firebase() may call st.stop(), which is not an Exception
+            logger.warning("Warm-up phase %s failed: %s", name, e)
+            error = str(e) or type(e).__name__
+        elapsed = time.perf_counter() - start
+        self.metrics.observe(f"warmup_{name}", elapsed)
+        with self.lock:
+            self.phases.append({"phase": name, "seconds": elapsed, "ok": not error, "detail": detail,
+                                "error": error})
+
+    def run(self, phases: List[tuple]):
+        """Run (name, step) phases in order, then signal readiness"""
+        try:
+            for name, step in phases:
+                self._run_phase(name, step)
+        finally:
+            self.ready_seconds = time.perf_counter() - self.start
+            self.metrics.observe("startup_ready", self.ready_seconds)
+            self.done.set()
+            logger.info("Warm-up finished in %.2fs: %s", self.ready_seconds,
+                        ", ".join(f"{phase['phase']} {phase['seconds'] * 1000:.0f} ms" for phase in self.phases))
+
+    def start_background(self, phases: List[tuple]):
+        threading.Thread(target=self.run, args=(phases,), name="warm-up", daemon=True).start()
+
+    def mark_first_response(self):
+        """Record the time from the start to the first answered chat turn"""
+        with self.lock:
+            if self.first_response_seconds is not None:
+                return
+            self.first_response_seconds = time.perf_counter() - self.start
+        self.metrics.observe("startup_first_response", self.first_response_seconds)
+
+    def report(self) -> Dict:
+        with self.lock:
+            phases = [dict(phase) for phase in self.phases]
+        finished = self.done.is_set()
+        return {
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "ready": finished and all(phase["ok"] for phase in phases),
+            "finished": finished,
+            "ready_seconds": self.ready_seconds,
+            "first_response_seconds": self.first_response_seconds,
+            "phases": phases
+        }
+
+def warm_up_phases(timeout: float) -> List[tuple]:
+    """Warm-up steps in order: storage first, every chat turn writes to it"""
+    def store():
+        store = get_conversation_store()
+        store.probe()
+        return f"{store.name} reachable"
+
+    def llm_backends():
+        client = get_llm_client()
+        # Opens the keep-alive connections the first chat turn will reuse
+        client.check_health()
+        stats = client.stats()
+        return f"{stats['healthy_backends']}/{stats['backends']} backends up"
+
+    def shared_caches():
+        get_chat_manager()
+        return f"{get_answer_cache().stats()['entries']} cached answers"
+
+    def answer_index():
+        index = get_answer_index()
+        if index is None:
+            return "disabled"
+        deadline = time.monotonic() + timeout
+        while not index.ready:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"answer index not built within {timeout:.0f}s")
+            time.sleep(0.05)
+        return f"{index.stats()['entries']} questions"
+
+    def admin_roles():
+        return f"{len(get_auth_manager().role_emails())} emails in the roles document"
+
+    def imports():
+        # Modules imported lazily by the answer index, admin panel and charts
+        import numpy  # noqa: F401
+        import pandas  # noqa: F401
+        import plotly.express  # noqa: F401
+        return "numpy, pandas, plotly"
+
+    phases = [("store", store), ("llm_backends", llm_backends), ("shared_caches", shared_caches),
+              ("answer_index", answer_index)]
+    # A SQLite deployment may run without Firebase credentials, so sign-in is only warmed with Firestore
+    if get_setting("storage_backend", "firestore") == "firestore":
+        phases.append(("admin_roles", admin_roles))
+    phases.append(("imports", imports))
+    return phases
+
+@st.cache_resource
+def start_warmup() -> WarmUp:
+    """Warm the shared resources once per process without blocking the first script run"""
+    warmup = WarmUp(get_metrics(), timeout=get_setting("warmup_timeout", 60.0))
+    if get_setting("warmup_enabled", True):
+        warmup.start_background(warm_up_phases(warmup.timeout))
+    else:
+        warmup.run([])
+    return warmup
+
+# Conversation search
+SEARCH_STOPWORDS = STOPWORDS | frozenset("""
+apa apakah bagaimana berapa kapan siapa dimana mana mengapa kenapa bisakah
+what how when who where which why this that there with from as at by it
+""".split())
+
+INDONESIAN_PARTICLES = ("lah", "kah", "tah", "pun")
+INDONESIAN_POSSESSIVES = ("nya", "ku", "mu")
+INDONESIAN_SUFFIXES = ("kan", "an")
+# Longest first; (prefix, letter restored when the stem starts with a vowel)
+INDONESIAN_PREFIXES = (("meny", "s"), ("peny", "s"), ("meng", ""), ("peng", ""), ("mem", "p"), ("pem", "p"),
+                       ("men", "t"), ("pen", "t"), ("ber", ""), ("ter", ""), ("per", ""), ("me", ""),
+                       ("pe", ""), ("di", ""), ("ke", ""), ("se", ""))
+
+@functools.lru_cache(maxsize=50000)
+def stem_token(token: str) -> str:
+    """Light affix stripping for Indonesian words and English plurals / verb forms"""
+    if len(token) <= 4 or not token.isalpha():
+        return token
+
+    for group in (INDONESIAN_PARTICLES, INDONESIAN_POSSESSIVES, INDONESIAN_SUFFIXES):
+        for suffix in group:
+            if token.endswith(suffix) and len(token) - len(suffix) >= 4:
+                token = token[:-len(suffix)]
+                break
+
+    for prefix, restore in INDONESIAN_PREFIXES:
+        if token.startswith(prefix) and len(token) - len(prefix) >= 4:
+            rest = token[len(prefix):]
+            token = restore + rest if restore and rest[0] in "aiueo" else rest
+            break
+
+    for suffix in ("ing", "ed"):
+        if token.endswith(suffix) and len(token) - len(suffix) >= 4:
+            return token[:-len(suffix)]
+    # Indonesian words end in -as/-us/-is (kelas, kampus, praktis), English plurals don't
+    if token.endswith("s") and token[-2] not in "aiusv":
+        return token[:-1]
+    return token
+
+def search_tokens(text: str) -> List[str]:
+    """Stemmed tokens of Indonesian or English text for the admin search"""
+    return [stem_token(token) for token in re.findall(r"\w+", text.casefold())
+            if len(token) > 1 and token not in SEARCH_STOPWORDS]
+
+class ConversationSearchIndex:
+    """In-memory BM25 inverted index over the input and response of stored messages"""
+
+    def __init__(self, input_weight: int = 2, k1: float = 1.2, b: float = 0.75):
+        # A hit in the question says more about a message than one in the long answer
+        self.input_weight = input_weight
+        self.k1 = k1
+        self.b = b
+        self.docs = []
+        self.positions = {}
+        # term -> (doc ids, term frequencies); typed arrays so a query scores them with NumPy
+        self.postings = {}
+        self.lengths = array("f")
+        self.times = array("d")
+        self.user_ids = array("i")
+        self.users = []
+        self.user_positions = {}
+        self.total_length = 0
+        self.lock = threading.Lock()
+
+    def add(self, row: Dict) -> bool:
+        """Index one admin row, returns False when the message is already indexed"""
+        terms = {}
+        for token in search_tokens(row["input"]):
+            terms[token] = terms.get(token, 0) + self.input_weight
+        for token in search_tokens(row["response"]):
+            terms[token] = terms.get(token, 0) + 1
+
+        with self.lock:
+            if row["message_id"] in self.positions:
+                return False
+            doc_id = len(self.docs)
+            self.positions[row["message_id"]] = doc_id
+            self.docs.append(row)
+
+            length = sum(terms.values())
+            self.lengths.append(length)
+            self.total_length += length
+            self.times.append(row["timestamp"].timestamp() if row["timestamp"] is not None else math.nan)
+            user_position = self.user_positions.get(row["user_id"])
+            if user_position is None:
+                user_position = self.user_positions[row["user_id"]] = len(self.users)
+                self.users.append(row["user_id"].casefold())
+            self.user_ids.append(user_position)
+
+            for term, tf in terms.items():
+                postings = self.postings.get(term)
+                if postings is None:
+                    postings = self.postings[term] = (array("i"), array("f"))
+                postings[0].append(doc_id)
+                postings[1].append(tf)
+            return True
+
+    def add_many(self, rows: List[Dict]) -> int:
+        return sum(self.add(row) for row in rows)
+
+    def search(self, query: str, user_filter: str = "", date_range=(), limit: int = 200) -> List[Dict]:
+        """Messages ranked by BM25 score, optionally filtered by user ID substring and date range"""
+        import numpy as np
+
+        terms = set(search_tokens(query))
+        with self.lock:
+            count = len(self.docs)
+            if not terms or not count:
+                return []
+            # Copies, so adds from a refresh never resize an array NumPy still points into
+            matched = [(np.array(self.postings[term][0], dtype=np.int32),
+                        np.array(self.postings[term][1], dtype=np.float32))
+                       for term in terms if term in self.postings]
+            lengths = np.array(self.lengths, dtype=np.float32)
+            times = np.array(self.times, dtype=np.float64)
+            user_ids = np.array(self.user_ids, dtype=np.int32)
+            users = list(self.users)
+            avg_length = self.total_length / count
+            docs = self.docs
+
+        scores = np.zeros(count, dtype=np.float32)
+        length_norm = self.k1 * (1 - self.b + self.b * lengths / avg_length)
+        for doc_ids, tfs in matched:
+            idf = math.log(1 + (count - len(doc_ids) + 0.5) / (len(doc_ids) + 0.5))
+            scores[doc_ids] += idf * tfs * (self.k1 + 1) / (tfs + length_norm[doc_ids])
+
+        mask = scores > 0
+        if user_filter:
+            user_filter = user_filter.casefold()
+            mask &= np.array([user_filter in user for user in users], dtype=bool)[user_ids]
+        if date_range:
+            mask &= times >= datetime.combine(date_range[0], datetime.min.time()).timestamp()
+            if len(date_range) > 1:
+                end = datetime.combine(date_range[1], datetime.min.time()) + timedelta(days=1)
+                mask &= times < end.timestamp()
+
+        candidates = np.flatnonzero(mask)
+        top = candidates[np.argsort(-scores[candidates], kind="stable")[:limit]]
+        return [dict(docs[i], score=float(scores[i])) for i in top]
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return {"messages": len(self.docs), "terms": len(self.postings),
+                    "postings": sum(len(doc_ids) for doc_ids, _ in self.postings.values())}
+
+# Admin snapshot
+class AdminSnapshot:
+    """Process-wide DataFrame of all conversations, refreshed incrementally"""
+
+    COLUMNS = ["user_id", "message_id", "input", "response", "timestamp"]
+
+    def __init__(self, min_refresh_interval: float = 30.0, overlap_seconds: float = 120.0):
+        self.min_refresh_interval = min_refresh_interval
+        # Re-read a window below the high-water mark so write-behind commits that
+        # land late (with an older timestamp) are still picked up
+        self.overlap = timedelta(seconds=overlap_seconds)
+        # Created on first refresh so pandas is only imported once an admin opens the panel
+        self.df = None
+        self.high_water_mark = None
+        self.last_refresh = 0.0
+        self.last_refreshed_at = None
+        self.last_fetch_rows = 0
+        self.last_fetch_seconds = 0.0
+        # Fed with the same incremental fetches, so searching never goes back to the store
+        self.search_index = ConversationSearchIndex()
+        self.lock = threading.Lock()
+
+    def refresh(self, chat_manager: "ChatManager", force: bool = False) -> "pd.DataFrame":
+        """Pull messages newer than the high-water mark and merge them into the snapshot"""
+        import pandas as pd
+
+        with self.lock:
+            if self.df is None:
+                self.df = pd.DataFrame(columns=self.COLUMNS)
+            elif not force and time.monotonic() - self.last_refresh < self.min_refresh_interval:
+                return self.df
+
+            start = time.perf_counter()
+            since = self.high_water_mark - self.overlap if self.high_water_mark is not None else None
+            rows = chat_manager.get_all_conversations(since=since)
+
+            if rows:
+                self.search_index.add_many(rows)
+                self.high_water_mark = max(row["timestamp"] for row in rows)
+                new_df = pd.DataFrame(rows, columns=self.COLUMNS)
+                new_df["timestamp"] = pd.to_datetime(new_df["timestamp"])
+
+                df = new_df if self.df.empty else pd.concat([new_df, self.df], ignore_index=True)
+                df = df.drop_duplicates("message_id", keep="first")
+                self.df = df.sort_values("timestamp", ascending=False, ignore_index=True)
+
+            self.last_refresh = time.monotonic()
+            self.last_refreshed_at = datetime.now()
+            self.last_fetch_rows = len(rows)
+            self.last_fetch_seconds = time.perf_counter() - start
+            return self.df
+
+@st.cache_resource
+def get_admin_snapshot() -> AdminSnapshot:
+    """Admin snapshot shared by all admin sessions"""
+    return AdminSnapshot(min_refresh_interval=get_setting("admin_refresh_interval", 30.0))
+
+def filter_conversations(df: "pd.DataFrame", user_filter: str = "", date_range=()) -> "pd.DataFrame":
+    """Filter the admin snapshot by user ID substring and date range"""
+    import pandas as pd
+
+    mask = pd.Series(True, index=df.index)
+    if user_filter:
+        mask &= df["user_id"].str.contains(user_filter, case=False, regex=False)
+    if date_range:
+        dates = df["timestamp"].dt.date
+        mask &= dates >= date_range[0]
+        if len(date_range) > 1:
+            mask &= dates <= date_range[1]
+    return df[mask]
+
+# Session message store
+class ChatMessage:
+    """Compact chat turn kept in session state"""
+
+    __slots__ = ("role", "content", "created", "viz_type", "viz_data", "html")
+
+    def __init__(self, role: str, content: str, created: Optional[float] = None,
+                 viz_type: Optional[str] = None, viz_data: Optional[List[Dict]] = None):
+        self.role = role
+        self.content = content
+        # Epoch seconds instead of a datetime object
+        self.created = created if created is not None else time.time()
+        self.viz_type = viz_type
+        # (label, value) pairs - the figure is rebuilt only when the message is on screen
+        self.viz_data = tuple((d["label"], d["value"]) for d in viz_data) if viz_data else ()
+        self.html = None
+
+    @property
+    def is_user(self) -> bool:
+        return self.role == "user"
+
+    @property
+    def timestamp(self) -> datetime:
+        return datetime.fromtimestamp(self.created)
+
+    def viz_records(self) -> List[Dict]:
+        return [{"label": label, "value": value} for label, value in self.viz_data]
+
+    def approx_size(self) -> int:
+        """Rough in-memory footprint in bytes, used for the per-session cap"""
+        size = 120 + len(self.content) * 2
+        if self.html is not None:
+            size += len(self.html) * 2
+        return size + sum(80 + len(label) * 2 for label, _ in self.viz_data)
+
+class ConversationContext:
+    """Recent turns within a character budget plus a rolling summary of the older ones"""
+
+    ERROR_PREFIX = "Sorry, I encountered an error"
+
+    def __init__(self, char_budget: int = 2000, max_messages: int = 8, summary_chars: int = 600,
+                 line_chars: int = 160):
+        self.char_budget = char_budget
+        self.max_messages = max_messages
+        self.summary_chars = summary_chars
+        self.line_chars = line_chars
+        self.summary_lines = deque()
+        self.summary_size = 0
+        # Messages created up to this time are already folded into the summary
+        self.folded_until = 0.0
+        self.folded_messages = 0
+
+    def build(self, messages: List[ChatMessage]) -> Optional[Dict]:
+        """Context for the next prompt, or None when there is nothing to send"""
+        if self.char_budget <= 0:
+            return None
+
+        history = [m for m in messages
+                   if m.created > self.folded_until and not m.content.startswith(self.ERROR_PREFIX)]
+        recent, used = [], 0
+        for message in reversed(history):
+            if len(recent) >= self.max_messages or used + len(message.content) > self.char_budget:
+                break
+            recent.append(message)
+            used += len(message.content)
+        recent.reverse()
+
+        # Only turns that just fell out of the window are summarized, earlier ones are already in
+        for message in history[:len(history) - len(recent)]:
+            self._fold(message)
+
+        if not recent and not self.summary_lines:
+            return None
+        return {
+            "summary": "\n".join(self.summary_lines),
+            "turns": [{"role": m.role, "content": m.content} for m in recent]
+        }
+
+    def _fold(self, message: ChatMessage):
+        """Add the first sentence of a message to the summary, dropping the oldest lines over budget"""
+        text = " ".join(message.content.split())
+        sentence = re.split(r"(?<=[.!?])\s", text, maxsplit=1)[0]
+        if len(sentence) > self.line_chars:
+            sentence = sentence[:self.line_chars - 3].rstrip() + "..."
+        line = f"{'User' if message.is_user else 'Assistant'}: {sentence}"
+
+        self.summary_lines.append(line)
+        self.summary_size += len(line) + 1
+        while self.summary_size > self.summary_chars and len(self.summary_lines) > 1:
+            self.summary_size -= len(self.summary_lines.popleft()) + 1
+        self.folded_until = max(self.folded_until, message.created)
+        self.folded_messages += 1
+
+def context_size(context: Optional[Dict]) -> int:
+    """Characters of conversation context sent along with a prompt"""
+    if not context:
+        return 0
+    return len(context["summary"]) + sum(len(turn["content"]) for turn in context["turns"])
+
+def get_conversation_context() -> ConversationContext:
+    """Context builder of the current session"""
+    if "conversation_context" not in st.session_state:
+        st.session_state.conversation_context = ConversationContext(
+            # Off by default: the deployed /generate may ignore the "context" field, and context
+            # scopes the answer cache and request coalescing to a single conversation
+            char_budget=get_setting("context_char_budget", 0),
+            max_messages=get_setting("context_max_messages", 8),
+            summary_chars=get_setting("context_summary_chars", 600)
+        )
+    return st.session_state.conversation_context
+
+def enforce_session_memory_cap(messages: List[ChatMessage], cap_bytes: Optional[int] = None) -> int:
+    """Evict the oldest turns until the session fits its memory cap, return how many were dropped"""
+    if cap_bytes is None:
+        cap_bytes = get_setting("session_memory_cap_kb", 512) * 1024
+
+    total = sum(message.approx_size() for message in messages)
+    dropped = 0
+    # Always keep the latest exchange even if it alone exceeds the cap
+    while total > cap_bytes and len(messages) > 2:
+        total -= messages.pop(0).approx_size()
+        dropped += 1
+    return dropped
+
+# UI Components
+def render_chat_header():
+    """Render chat header"""
+    st.markdown("""
+    <div class="chat-header">
+        <div class="chat-title">
+            <img src="https://hmpstrplpolmed.com/assets/img/logo/hmpstrpl.webp" 
+                 width="60" height="auto" alt="Logo">
+            🎓 Academic Chatbot
+        </div>
+        <div class="chat-subtitle">
+            Powered by Llama 3.1 Fine-tuned Model | Tanyakan Informasi Seputar TRPL | Informasi Dosen, Mahasiswa, RPS, Seputar Magang, Skripsi dan Lainnya
+        </div>
+    </div>
+    """, unsafe_allow_html=True)
+
+def render_typing_indicator(status: str = "AI sedang mengetik..."):
+    """Render typing indicator"""
+    st.markdown(f"""
+    <div class="typing-indicator">
+        <div class="typing-dots">
+            <div class="typing-dot"></div>
+            <div class="typing-dot"></div>
+            <div class="typing-dot"></div>
+            <span style="margin-left: 10px; color: #666;">{status}</span>
+        </div>
+    </div>
+    """, unsafe_allow_html=True)
+
+def render_message_html(message: str, is_user: bool, timestamp: datetime = None) -> str:
+    """Build the HTML markup of a chat bubble"""
+    if timestamp is None:
+        timestamp = datetime.now()
+
+    message_class = "user-message" if is_user else "bot-message"
+    time_str = timestamp.strftime("%H:%M")
+
+    # No leading indentation: bubbles are joined into one markdown block, where an indented
+    # line after a multi-line answer would become a code block instead of HTML
+    return (
+        f'<div class="message-container">\n'
+        f'<div class="{message_class}">\n'
+        f'<div>{message}</div>\n'
+        f'<div class="message-time">{time_str}</div>\n'
+        f'</div>\n'
+        f'</div>\n'
+    )
+
+def render_streaming_message(chunks, placeholder, refresh_interval: float = 0.05) -> str:
+    """Render streamed chunks into a bot bubble as they arrive, return the full text"""
+    text = ""
+    last_render = 0.0
+
+    for chunk in chunks:
+        text += chunk
+
+        # Throttle redraws so fast token streams don't flood the websocket
+        now = time.monotonic()
+        if now - last_render >= refresh_interval:
+            placeholder.markdown(render_message_html(text + " ▌", False), unsafe_allow_html=True)
+            last_render = now
+
+    if text:
+        placeholder.markdown(render_message_html(text, False), unsafe_allow_html=True)
+    return text
+
+def render_message_with_viz(message: str, is_user: bool, timestamp: datetime = None,
+                           visualization=None, table=None, show_text: bool = True):
+    """Render a chat message with optional visualization"""
+    # Render text message
+    if show_text:
+        st.markdown(render_message_html(message, is_user, timestamp), unsafe_allow_html=True)
+
+    # Render visualization if available
+    if not is_user:  # Only for bot messages
+        if visualization is not None:
+            st.plotly_chart(visualization, use_container_width=True)
+        
+        if table is not None:
+            st.subheader("📊 Data Table")
+            st.dataframe(table, use_container_width=True)
+
+def get_message_html(message: ChatMessage) -> str:
+    """Chat bubble markup of a stored message, built once and cached on the message"""
+    if message.html is None:
+        message.html = render_message_html(message.content, message.is_user, message.timestamp)
+    return message.html
+
+def render_message_visualization(message: ChatMessage, viz_manager: DataVisualizationManager):
+    """Rebuild the chart or table of an on-screen message from its compact data"""
+    data = message.viz_records()
+    if message.viz_type == "table":
+        render_message_with_viz(message.content, False, table=viz_manager.create_table(data, "Data Table"),
+                                show_text=False)
+    else:
+        figure = viz_manager.create_visualization(data, message.viz_type, "Academic Data Visualization")
+        render_message_with_viz(message.content, False, visualization=figure, show_text=False)
+
+def render_chat_messages(messages: List[ChatMessage], viz_manager: DataVisualizationManager):
+    """Render the latest window of the conversation with a control to load earlier turns"""
+    window_size = get_setting("chat_window_size", 20)
+    if "chat_window" not in st.session_state:
+        st.session_state.chat_window = window_size
+
+    hidden = len(messages) - st.session_state.chat_window
+    if hidden > 0:
+        if st.button(f"⬆️ Load earlier messages ({hidden} hidden)", key="chat_load_earlier"):
+            st.session_state.chat_window += window_size
+            st.rerun()
+        messages = messages[-st.session_state.chat_window:]
+
+    # Consecutive text-only turns go out as one markdown block
+    text_block = []
+    for message in messages:
+        if not message.viz_data:
+            text_block.append(get_message_html(message))
+            continue
+
+        if text_block:
+            st.markdown("".join(text_block), unsafe_allow_html=True)
+            text_block = []
+        st.markdown(get_message_html(message), unsafe_allow_html=True)
+        render_message_visualization(message, viz_manager)
+
+    if text_block:
+        st.markdown("".join(text_block), unsafe_allow_html=True)
+
+def render_pagination(current_page: int, total_pages: int, key_prefix: str = ""):
+    """Render pagination controls"""
+    if total_pages <= 1:
+        return current_page
+    
+    col1, col2, col3, col4, col5 = st.columns([1, 1, 2, 1, 1])
+    
+    with col1:
+        if st.button("⬅️ First", key=f"{key_prefix}_first", disabled=current_page <= 1):
+            return 1
+    
+    with col2:
+        if st.button("◀️ Prev", key=f"{key_prefix}_prev", disabled=current_page <= 1):
+            return current_page - 1
+    
+    with col3:
+        st.markdown(f"<div style='text-align: center; padding: 10px;'>Page {current_page} of {total_pages}</div>", 
+                   unsafe_allow_html=True)
+    
+    with col4:
+        if st.button("Next ▶️", key=f"{key_prefix}_next", disabled=current_page >= total_pages):
+            return current_page + 1
+    
+    with col5:
+        if st.button("Last ➡️", key=f"{key_prefix}_last", disabled=current_page >= total_pages):
+            return total_pages
+    
+    return current_page
+
+def clear_login():
+    """Log out: keep anonymous ID but clear login data"""
+    anon_id = st.session_state.get("anonymous_user_id")
+    for key in list(st.session_state.keys()):
+        if key != "anonymous_user_id":
+            del st.session_state[key]
+    if anon_id:
+        st.session_state.anonymous_user_id = anon_id
+
+def restore_login():
+    """Re-check the ID token of a signed-in session once it nears expiry or its admin role may have changed"""
+    if not st.session_state.get("id_token"):
+        return
+
+    auth_manager = get_auth_manager()
+    now = time.time()
+    # Reruns in between trust the session state and pay no verification or role lookup
+    if (now < st.session_state.get("token_expires_at", 0) - TOKEN_REFRESH_MARGIN
+            and now - st.session_state.get("auth_checked_at", 0) < auth_manager.roles.ttl):
+        return
+
+    result = auth_manager.check_session(st.session_state.id_token, st.session_state.get("refresh_token", ""))
+    if result["success"]:
+        st.session_state.id_token = result["id_token"]
+        st.session_state.refresh_token = result["refresh_token"]
+        st.session_state.token_expires_at = result["expires_at"]
+        st.session_state.auth_checked_at = now
+        st.session_state.is_admin = result["is_admin"]
+    else:
+        logger.info("Signed-in session ended: %s", result["error"])
+        clear_login()
+        generate_anonymous_user_id()
+
+def render_sidebar():
+    """Render sidebar with login/logout options"""
+    with st.sidebar:
+        if st.session_state.get("user_id"):
+            # Logged in user
+            st.markdown(f"### Welcome, {st.session_state.user_name}! 👋")
+            st.success("✅ Logged in")
+        else:
+            # Anonymous user
+            st.markdown("### 👤 Anonymous User")
+            st.info("💡 Login to save your chat history!")
+            
+            if st.button("🔑 Login", use_container_width=True):
+                st.session_state.show_login = True
+                st.rerun()
+        
+        if st.button("🔄 New Chat", use_container_width=True):
+            st.session_state.messages = []
+            st.session_state.show_history = False
+            st.session_state.pop("chat_window", None)
+            st.session_state.pop("conversation_context", None)
+            st.rerun()
+        
+        # Chat History - only for logged in users
+        if st.session_state.get("user_id"):
+            if st.button("📚 Chat History", use_container_width=True):
+                st.session_state.show_history = not st.session_state.get("show_history", False)
+                st.rerun()
+        else:
+            if st.button("📚 Chat History", use_container_width=True, disabled=True):
+                pass
+            st.caption("Login required to view history")
+        
+        # Admin Panel - only for logged in admins
+        if st.session_state.get("is_admin", False):
+            if st.button("👨‍💼 Admin Panel", use_container_width=True):
+                st.session_state.current_page_name = "admin"
+                st.rerun()
+        
+        # Logout button - only for logged in users
+        if st.session_state.get("user_id"):
+            if st.button("🚪 Logout", use_container_width=True):
+                clear_login()
+                st.rerun()
+
+# Main pages
+# def login_page():
+#     """Login/Register page"""
+#     st.markdown("<h1 style='text-align: center; color: #4682B4;'>🎓 Academic Chatbot</h1>", unsafe_allow_html=True)
+#     st.markdown("<p style='text-align: center; color: #666;'>Sign in to start chatting with our AI assistant</p>", unsafe_allow_html=True)
+    
+#     auth_manager = AuthManager()
+    
+#     tab1, tab2 = st.tabs(["Sign In", "Sign Up"])
+    
+#     with tab1:
+#         with st.form("login_form"):
+#             email = st.text_input("Email", placeholder="Enter your email")
+#             password = st.text_input("Password", type="password", placeholder="Enter your password")
+            
+#             if st.form_submit_button("Sign In", use_container_width=True):
+#                 if email and password:
+#                     result = auth_manager.verify_user_credentials(email, password)
+#                     if result["success"]:
+#                         st.session_state.user_id = result["user_id"]
+#                         st.session_state.user_email = email
+#                         st.session_state.user_name = result.get("display_name", email.split("@")[0])
+#                         st.session_state.is_admin = auth_manager.is_admin(email)
+#                         st.success("Login successful!")
+#                         st.rerun()
+#                     else:
+#                         st.error(f"Login failed: {result['error']}")
+#                 else:
+#                     st.warning("Please fill in all fields")
+    
+#     with tab2:
+#         with st.form("register_form"):
+#             reg_name = st.text_input("Full Name", placeholder="Enter your full name")
+#             reg_email = st.text_input("Email", placeholder="Enter your email")
+#             reg_password = st.text_input("Password", type="password", placeholder="Create a password")
+#             reg_confirm = st.text_input("Confirm Password", type="password", placeholder="Confirm your password")
+            
+#             if st.form_submit_button("Sign Up", use_container_width=True):
+#                 if all([reg_name, reg_email, reg_password, reg_confirm]):
+#                     if reg_password == reg_confirm:
+#                         result = auth_manager.create_user_account(reg_email, reg_password, reg_name)
+#                         if result["success"]:
+#                             st.success("Account created successfully! Please sign in.")
+#                         else:
+#                             st.error(f"Registration failed: {result['error']}")
+#                     else:
+#                         st.error("Passwords don't match")
+#                 else:
+#                     st.warning("Please fill in all fields")
+
+def show_login_modal():
+    """Show login modal for anonymous users"""
+    st.markdown("## 🔑 Login to Save Your Chat History")
+
+    auth_manager = get_auth_manager()
+    
+    tab1, tab2 = st.tabs(["Sign In", "Sign Up"])
+    
+    with tab1:
+        with st.form("login_form_modal"):
+            email = st.text_input("Email", placeholder="Enter your email")
+            password = st.text_input("Password", type="password", placeholder="Enter your password")
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                if st.form_submit_button("Sign In", use_container_width=True):
+                    if email and password:
+                        result = auth_manager.verify_user_credentials(email, password)
+                        if result["success"]:
+                            st.session_state.user_id = result["user_id"]
+                            st.session_state.user_email = email
+                            st.session_state.user_name = result.get("display_name") or email.split("@")[0]
+                            st.session_state.is_admin = auth_manager.is_admin(email, result.get("claims"))
+                            if result.get("id_token"):
+                                st.session_state.id_token = result["id_token"]
+                                st.session_state.refresh_token = result["refresh_token"]
+                                st.session_state.token_expires_at = result["claims"].get("exp", 0)
+                                st.session_state.auth_checked_at = time.time()
+                            st.session_state.show_login = False
+                            st.success("Login successful!")
+                            st.rerun()
+                        else:
+                            st.error(f"Login failed: {result['error']}")
+                    else:
+                        st.warning("Please fill in all fields")
+            
+            with col2:
+                if st.form_submit_button("Cancel", use_container_width=True):
+                    st.session_state.show_login = False
+                    st.rerun()
+    
+    with tab2:
+        with st.form("register_form_modal"):
+            reg_name = st.text_input("Full Name", placeholder="Enter your full name")
+            reg_email = st.text_input("Email", placeholder="Enter your email")
+            reg_password = st.text_input("Password", type="password", placeholder="Create a password")
+            reg_confirm = st.text_input("Confirm Password", type="password", placeholder="Confirm your password")
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                if st.form_submit_button("Sign Up", use_container_width=True):
+                    if all([reg_name, reg_email, reg_password, reg_confirm]):
+                        if reg_password == reg_confirm:
+                            result = auth_manager.create_user_account(reg_email, reg_password, reg_name)
+                            if result["success"]:
+                                st.success("Account created successfully! Please sign in.")
+                            else:
+                                st.error(f"Registration failed: {result['error']}")
+                        else:
+                            st.error("Passwords don't match")
+                    else:
+                        st.warning("Please fill in all fields")
+            
+            with col2:
+                if st.form_submit_button("Cancel", use_container_width=True):
+                    st.session_state.show_login = False
+                    st.rerun()
+
+def run_chat_turn(chat_manager: "ChatManager", messages: List[ChatMessage], context_builder: ConversationContext,
+                  user_id: str, user_input: str, turn: TurnTrace, on_queue=None, on_suggestion=None,
+                  show_stream=None, show_answer=None) -> Dict:
+    """One chat turn for chat_page and the load benchmark, all rendering goes through the callbacks"""
+    messages.append(ChatMessage("user", user_input))
+    # The input is stored while the model generates
+    begun = chat_manager.begin_conversation(user_id, user_input, turn)
+
+    # Recent turns and a summary of older ones, the new message itself is the prompt
+    context = context_builder.build(messages[:-1])
+    turn.record_size("prompt", len(user_input) + context_size(context))
+    turn.record_size("context", context_size(context))
+
+    # Questions answered before are served from the index without the model
+    with turn.span("retrieval"):
+        match = chat_manager.find_stored_answer(user_input, context)
+
+    if match is not None and match["mode"] == "answer":
+        result = {"success": True, "response": match["answer"], "retrieved": True}
+    else:
+        if match is not None and on_suggestion is not None:
+            on_suggestion(match)
+
+        # Get AI response
+        with turn.span("model"):
+            if chat_manager.stream_responses:
+                result = chat_manager.stream_message_to_api(user_input, context, user_id, on_queue)
+                if result["success"]:
+                    chunks = turn.first_chunk(result["stream"])
+                    bot_response = show_stream(chunks) if show_stream is not None else "".join(chunks)
+                    if result["error"]:
+                        # A cut-off answer is shown but never stored, cached or indexed
+                        result = {"success": False, "error": result["error"], "partial": bot_response}
+                    elif not bot_response:
+                        result = {"success": False, "error": "Empty response received"}
+                    else:
+                        result["response"] = bot_response
+            else:
+                result = chat_manager.send_message_to_api(user_input, context, user_id, on_queue)
+
+    if result["success"]:
+        bot_response = result["response"]
+
+        # Visualization extraction and the write run while the answer is already on screen
+        processing = chat_manager.process_response_async(user_input, bot_response, turn)
+        saving = chat_manager.complete_conversation(user_id, begun, user_input, bot_response, turn,
+                                                    has_context=context is not None,
+                                                    from_index=bool(result.get("retrieved")))
+        if show_answer is not None and (not chat_manager.stream_responses or result.get("retrieved")):
+            show_answer(bot_response)
+
+        waited_from = time.perf_counter()
+        processed_result = processing.result()
+        # Add bot message with visualization data
+        messages.append(ChatMessage(
+            "assistant",
+            processed_result["response"],
+            viz_type=processed_result["viz_type"],
+            viz_data=processed_result["viz_data"]
+        ))
+
+        # Save to database (works for both logged in and anonymous users)
+        try:
+            saving.result()
+        except Exception as e:
+            logger.error("Error saving conversation: %s", e)
+            result["save_error"] = str(e)
+        turn.record_overlap(time.perf_counter() - waited_from)
+    else:
+        chat_manager.discard_conversation(user_id, begun)
+        error_text = f"Sorry, I encountered an error: {result['error']}"
+        if result.get("partial"):
+            error_text += f"\n\n{result['partial']}"
+        messages.append(ChatMessage("assistant", error_text))
+
+    enforce_session_memory_cap(messages)
+    turn.metrics.finish_turn(turn, success=result["success"])
+    return result
+
+def chat_page():
+    """Main chat interface"""
+    load_css()
+    render_chat_header()
+    
+    chat_manager = get_chat_manager()
+    
+    # Initialize session state
+    if "messages" not in st.session_state:
+        st.session_state.messages = []
+    if "current_page" not in st.session_state:
+        st.session_state.current_page = 1
+    
+    # Get user ID (logged in or anonymous)
+    current_user_id = st.session_state.get("user_id", generate_anonymous_user_id())
+    
+    # Render sidebar
+    render_sidebar()
+    
+    # Show login modal if requested
+    if st.session_state.get("show_login", False):
+        show_login_modal()
+        return
+    
+    # Main chat area
+    if st.session_state.get("show_history", False):
+        if not st.session_state.get("user_id"):
+            st.warning("⚠️ Please login to view chat history")
+            return
+            
+        st.subheader("📚 Chat History")
+        
+        if "history_cursors" not in st.session_state:
+            st.session_state.history_cursors = {}
+
+        history_result = chat_manager.get_conversation_history(
+            st.session_state.user_id, 
+            st.session_state.current_page,
+            cursors=st.session_state.history_cursors
+        )
+        
+        if history_result["success"]:
+            messages = history_result["messages"]
+            
+            if messages:
+                for msg in reversed(messages):
+                    with st.expander(f"💬 {msg['input'][:50]}... - {msg['timestamp'].strftime('%Y-%m-%d %H:%M')}"):
+                        st.markdown(f"**You:** {msg['input']}")
+                        st.markdown(f"**AI:** {msg['response']}")
+                
+                st.session_state.current_page = render_pagination(
+                    history_result["page"], 
+                    history_result["total_pages"],
+                    "history"
+                )
+            else:
+                st.info("No chat history found.")
+        else:
+            st.error(f"Error loading history: {history_result['error']}")
+        
+        return
+    
+    # Chat interface
+    st.markdown('<div class="chat-container">', unsafe_allow_html=True)
+    
+    # Display messages
+    metrics = get_metrics()
+    with metrics.span("render"):
+        render_chat_messages(st.session_state.messages, chat_manager.viz_manager)
+
+    # Chat input
+    user_input = st.chat_input("Type your academic question here...")
+    
+    if user_input:
+        turn = metrics.start_turn(current_user_id, user_input)
+
+        # Show the user message and typing indicator while waiting for the first token
+        st.markdown(get_message_html(ChatMessage("user", user_input)), unsafe_allow_html=True)
+        suggestion = st.empty()
+        placeholder = st.empty()
+        with placeholder:
+            render_typing_indicator()
+
+        def show_suggestion(match: Dict):
+            suggestion.info(f"💡 Pertanyaan serupa pernah dijawab ({match['score']:.0%} mirip): "
+                            f"**{match['question']}**\n\n{match['answer']}")
+
+        def show_queue_position(position: int):
+            with placeholder:
+                if position:
+                    render_typing_indicator(f"Kamu antrian ke-{position}, mohon tunggu...")
+                else:
+                    render_typing_indicator()
+
+        def show_answer(text: str):
+            placeholder.markdown(get_message_html(ChatMessage("assistant", text)), unsafe_allow_html=True)
+
+        result = run_chat_turn(chat_manager, st.session_state.messages, get_conversation_context(),
+                               current_user_id, user_input, turn, on_queue=show_queue_position,
+                               on_suggestion=show_suggestion,
+                               show_stream=lambda chunks: render_streaming_message(chunks, placeholder),
+                               show_answer=show_answer)
+        if result.get("save_error"):
+            st.error(f"Error saving conversation: {result['save_error']}")
+
+        if result["success"]:
+            start_warmup().mark_first_response()
+        st.rerun()
+    
+    st.markdown('</div>', unsafe_allow_html=True)
+
+def render_backend_metrics(llm_client: LLMClient, inflight: Optional[SingleFlight] = None,
+                           admission: Optional[FairQueue] = None, rate_limiter: Optional[RateLimiter] = None):
+    """Render connection pool and circuit breaker metrics of the model backend"""
+    stats = llm_client.stats()
+    total_requests = stats["connections_opened"] + stats["connections_reused"]
+    reuse_rate = stats["connections_reused"] / total_requests if total_requests else 0
+
+    with st.expander("🔌 LLM Backend"):
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("Requests", stats["requests"])
+        with col2:
+            st.metric("Connection Reuse", f"{reuse_rate:.0%}",
+                      help=f"{stats['connections_opened']} opened, {stats['connections_reused']} reused")
+        with col3:
+            st.metric("Failures", stats["failures"], help=f"{stats['retries']} retries")
+        with col4:
+            st.metric("Circuit", stats["circuit_state"].replace("_", " ").title(),
+                      help=f"{stats['circuit_rejections']} requests rejected while open")
+        st.caption(f"Last request reused connection: {'yes' if stats['last_request_reused_connection'] else 'no'}")
+
+        if stats["backends"] > 1:
+            st.caption(f"{stats['healthy_backends']} of {stats['backends']} backends available, "
+                       f"routing: {llm_client.routing.replace('_', ' ')}")
+            st.dataframe([{
+                "backend": backend["url"],
+                "status": "up" if backend["healthy"] and backend["circuit_state"] != "open" else "ejected",
+                "circuit": backend["circuit_state"].replace("_", " "),
+                "in flight": backend["outstanding"],
+                "ewma ms": round(backend["ewma_ms"]) if backend["ewma_ms"] is not None else None,
+                "requests": backend["requests"],
+                "failures": backend["failures"],
+                "ejections": backend["ejections"],
+                "readmissions": backend["readmissions"],
+                "last check error": backend["last_health_error"] or ""
+            } for backend in llm_client.backend_stats()], use_container_width=True, hide_index=True)
+
+        if inflight is not None:
+            coalescing = inflight.stats()
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.metric("Coalesced Calls", coalescing["coalesced"],
+                          help="Identical prompts that waited on an in-flight request instead of calling the backend")
+            with col2:
+                st.metric("Coalesced Share", f"{coalescing['coalesced_ratio']:.0%}")
+            with col3:
+                st.metric("In Flight", coalescing["in_flight"])
+
+        batcher = get_micro_batcher()
+        if batcher is not None:
+            batching = batcher.stats()
+            status = {True: "active", False: "endpoint missing, single calls", None: "waiting for first batch"}
+            st.caption(f"Micro-batching: {status[batching['supported']]} - {batching['batches']} batches, "
+                       f"avg {batching['avg_batch_size']:.1f} prompts, largest {batching['largest_batch']}, "
+                       f"{batching['failed_batches']} failed")
+
+        if admission is not None:
+            queue_stats = admission.stats()
+            col1, col2, col3, col4 = st.columns(4)
+            with col1:
+                st.metric("Upstream Slots", f"{queue_stats['load']:.3g}/{queue_stats['max_concurrent']}",
+                          help="Batched prompts each hold a share of a slot")
+            with col2:
+                st.metric("Waiting", queue_stats["waiting"],
+                          help=f"{queue_stats['waiting_users']} users, longest queue {queue_stats['longest_queue']}")
+            with col3:
+                st.metric("Avg Queue Wait", f"{queue_stats['avg_wait']:.1f}s",
+                          help=f"{queue_stats['queued']} of {queue_stats['admitted']} calls had to wait")
+            with col4:
+                st.metric("Rate Limited", rate_limiter.rejected if rate_limiter is not None else 0,
+                          help=f"{queue_stats['timeouts']} queue timeouts, "
+                               f"{queue_stats['expired_slots']} slots reclaimed")
+
+def render_answer_cache_admin(answer_cache: ResponseCache):
+    """Render answer cache metrics and invalidation controls"""
+    stats = answer_cache.stats()
+
+    with st.expander("🗄️ Answer Cache"):
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Hit Ratio", f"{stats['hit_ratio']:.0%}",
+                      help=f"{stats['hits']} hits, {stats['misses']} misses")
+        with col2:
+            st.metric("Cached Answers", stats["entries"])
+        with col3:
+            st.metric("Backend Time Saved", f"{stats['saved_seconds']:.1f}s")
+
+        cached_prompts = answer_cache.cached_prompts()
+        if cached_prompts:
+            selected = st.selectbox("Cached question", cached_prompts, key="answer_cache_selected")
+            col1, col2 = st.columns(2)
+            with col1:
+                if st.button("🗑️ Invalidate Answer", key="answer_cache_invalidate"):
+                    answer_cache.invalidate(selected)
+                    st.rerun()
+            with col2:
+                if st.button("🧹 Clear Cache", key="answer_cache_clear"):
+                    answer_cache.clear()
+                    st.rerun()
+
+def render_auth_admin(auth_manager: AuthManager, metrics: MetricsRegistry):
+    """Render auth cache hit ratios, sign-in latency and a reload of the admin roles"""
+    stats = auth_manager.stats()
+    latency = metrics.summary()
+
+    with st.expander("🔐 Authentication"):
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            login = latency.get("auth_login")
+            st.metric("Sign-in p95", f"{login['p95'] * 1000:.0f} ms" if login else "-",
+                      help=f"{login['count']} sign-ins" if login else None)
+        with col2:
+            st.metric("Token Cache", f"{stats['tokens']['hit_ratio']:.0%}",
+                      help=f"{stats['tokens']['hits']} sessions verified from cache, "
+                           f"{stats['tokens']['misses']} signature checks")
+        with col3:
+            st.metric("Role Cache", f"{stats['roles']['hit_ratio']:.0%}",
+                      help=f"{stats['roles']['misses']} reads of {auth_manager.roles_doc or 'no roles document'}")
+        with col4:
+            st.metric("User Cache", f"{stats['users']['hit_ratio']:.0%}",
+                      help="User lookups by email (sign-in without firebase_web_api_key)")
+        st.caption("ID tokens: " + ("verified sessions via firebase_web_api_key" if auth_manager.api_key
+                                    else "off, set firebase_web_api_key for password checks"))
+        if st.button("🔄 Reload Admin Roles", key="auth_reload_roles"):
+            auth_manager.roles.invalidate()
+            auth_manager.users.invalidate()
+            st.rerun()
+
+def render_startup_report(warmup: WarmUp):
+    """Render the warm-up phases and the time to the first answer since the last restart"""
+    report = warmup.report()
+
+    with st.expander("🚀 Startup"):
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            status = "ready" if report["ready"] else "warming up" if not report["finished"] else "degraded"
+            st.metric("Status", status.title(), help=f"Started {report['started_at']}")
+        with col2:
+            ready = report["ready_seconds"]
+            st.metric("Time To Ready", f"{ready:.1f}s" if ready is not None else "-")
+        with col3:
+            first = report["first_response_seconds"]
+            st.metric("First Answer", f"{first:.1f}s" if first is not None else "-",
+                      help="From the first script run after the restart to the first answered chat turn")
+        if report["phases"]:
+            st.dataframe([{
+                "phase": phase["phase"],
+                "ms": round(phase["seconds"] * 1000),
+                "ok": phase["ok"],
+                "detail": phase["error"] or phase["detail"]
+            } for phase in report["phases"]], use_container_width=True, hide_index=True)
+
+def render_usage_rollups(chat_manager: ChatManager):
+    """Render usage metrics and daily volume from the pre-aggregated rollups"""
+    rollups = chat_manager.get_usage_rollups()
+    if not rollups["success"]:
+        st.error(f"Error loading usage metrics: {rollups['error']}")
+        return
+
+    # Stats
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Total Messages", rollups["total_messages"])
+    with col2:
+        st.metric("Unique Users", rollups["unique_users"])
+    with col3:
+        st.metric("Today's Messages", rollups["today_messages"])
+    with col4:
+        share = rollups["anonymous_messages"] / rollups["total_messages"] if rollups["total_messages"] else 0
+        st.metric("Anonymous Share", f"{share:.0%}")
+
+    if rollups["daily"]:
+        import pandas as pd
+        daily_df = pd.DataFrame(rollups["daily"]).set_index("date")
+        st.line_chart(daily_df[["messages", "users"]])
+
+    if st.button("🧮 Rebuild Usage Rollups", help="Recount every stored message (full scan)"):
+        with st.spinner("Rebuilding rollups..."):
+            result = chat_manager.rebuild_usage_rollups()
+        if result["success"]:
+            st.success(f"Rebuilt {result['days']} days from {result['messages']} messages "
+                       f"({result['users']} users)")
+        else:
+            st.error(f"Rebuild failed: {result['error']}")
+
+def discard_export_file():
+    """Delete the session's export file, once downloaded or replaced by a new export"""
+    export_file = st.session_state.pop("export_file", None)
+    if export_file and os.path.exists(export_file["path"]):
+        os.remove(export_file["path"])
+
+def render_export_panel(chat_manager: ChatManager):
+    """Render export controls that stream conversations to a temp file"""
+    with st.expander("📥 Export Data"):
+        col1, col2 = st.columns(2)
+        with col1:
+            fmt = st.selectbox("Format", ["csv", "ndjson"], key="export_format")
+            compress = st.checkbox("Gzip", key="export_gzip")
+        with col2:
+            date_range = st.date_input("Date range", value=(), key="export_date_range")
+            user_id = st.text_input("User ID (optional)", key="export_user_id").strip()
+
+        if st.button("Prepare Export", key="export_prepare"):
+            # Remove the previous export of this session before writing a new one
+            discard_export_file()
+
+            with st.spinner("Exporting conversations..."):
+                result = chat_manager.export_conversations(
+                    fmt, compress,
+                    start_date=date_range[0] if date_range else None,
+                    end_date=date_range[-1] if date_range else None,
+                    user_id=user_id
+                )
+            if result["success"]:
+                st.session_state.export_file = result
+            else:
+                st.error(f"Export failed: {result['error']}")
+
+        export_file = st.session_state.get("export_file")
+        if export_file and os.path.exists(export_file["path"]):
+            extension = os.path.basename(export_file["path"]).split(".", 1)[-1]
+            with open(export_file["path"], "rb") as f:
+                st.download_button(
+                    label=f"Download {export_file['rows']} rows",
+                    data=f,
+                    file_name=f"conversations_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}",
+                    mime="application/gzip" if extension.endswith("gz") else
+                         ("text/csv" if extension == "csv" else "application/x-ndjson"),
+                    # The button already holds the bytes, the temp file is not needed after the click
+                    on_click=discard_export_file
+                )
+
+def admin_page():
+    """Admin panel for viewing all conversations"""
+    st.title("👨‍💼 Admin Panel")
+    
+    chat_manager = get_chat_manager()
+    
+    # Back button
+    if st.button("⬅️ Back to Chat"):
+        st.session_state.current_page_name = "chat"
+        st.rerun()
+
+    tab_conversations, tab_answers, tab_latency = st.tabs(["📊 Conversations", "📚 FAQ Index", "⏱️ Latency"])
+    with tab_conversations:
+        render_conversations_panel(chat_manager)
+    with tab_answers:
+        render_answer_index_panel(chat_manager.answer_index)
+    with tab_latency:
+        render_backend_metrics(chat_manager.llm_client, chat_manager.inflight, chat_manager.admission,
+                               chat_manager.rate_limiter)
+        render_answer_cache_admin(chat_manager.answer_cache)
+        if st.session_state.get("user_email"):
+            render_auth_admin(get_auth_manager(), get_metrics())
+        render_startup_report(start_warmup())
+        render_latency_panel(get_metrics())
+
+def render_answer_index_panel(answer_index: Optional[AnswerIndex]):
+    """Render answer index metrics, a test search and the curation of reusable answers"""
+    import pandas as pd
+
+    st.subheader("📚 FAQ Index")
+    if answer_index is None:
+        st.info("Answer retrieval is disabled (retrieval_enabled = false).")
+        return
+
+    stats = answer_index.stats()
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Indexed Questions", stats["entries"], help=f"{stats['terms']} distinct terms")
+    with col2:
+        st.metric("Answered From Index", stats["answered"])
+    with col3:
+        st.metric("Suggested", stats["suggested"])
+    with col4:
+        st.metric("Hit Ratio", f"{stats['hit_ratio']:.0%}", help=f"{stats['lookups']} lookups")
+
+    if stats["last_refreshed_at"]:
+        st.caption(f"Last refresh {stats['last_refreshed_at'].strftime('%H:%M:%S')}: "
+                   f"{stats['last_refresh_rows']} messages in {stats['last_refresh_seconds'] * 1000:.0f} ms. "
+                   f"Answer threshold {answer_index.answer_threshold:.0%}, "
+                   f"suggest threshold {answer_index.suggest_threshold:.0%}.")
+    else:
+        st.caption("Index is still being built...")
+    if st.button("🔄 Refresh Index", key="answer_index_refresh"):
+        answer_index.refresh()
+        st.rerun()
+
+    query = st.text_input("Test a question", key="answer_index_query")
+    if query:
+        matches = answer_index.search(query, top_k=5, eligible_only=False)
+        if matches:
+            st.dataframe(pd.DataFrame([{
+                "score": round(match["score"], 3),
+                "question": match["question"],
+                "answer": match["answer"][:200],
+                "asked": match["count"],
+                "eligible": match["eligible"]
+            } for match in matches]), use_container_width=True, hide_index=True)
+        else:
+            st.info("No similar question in the index.")
+
+    entries = answer_index.top_entries(100)
+    if not entries:
+        return
+    st.markdown("**Most asked questions** — untick answers that must not be reused")
+    original = pd.DataFrame([{
+        "key": entry["key"],
+        "eligible": entry["eligible"],
+        "asked": entry["count"],
+        "question": entry["question"],
+        "answer": entry["answer"][:300]
+    } for entry in entries])
+    edited = st.data_editor(original, key="answer_index_curation", use_container_width=True, hide_index=True,
+                            disabled=["key", "asked", "question", "answer"], column_config={"key": None})
+
+    changed = edited[edited["eligible"] != original["eligible"]]
+    if st.button(f"💾 Save Curation ({len(changed)} changed)", key="answer_index_save", disabled=changed.empty):
+        for row in changed.itertuples():
+            answer_index.set_eligible(row.key, bool(row.eligible), st.session_state.get("user_email", ""))
+        st.success(f"Saved {len(changed)} curation decisions")
+
+def render_conversations_panel(chat_manager: ChatManager):
+    """Conversation snapshot, usage metrics, export and the paginated message list"""
+    st.subheader("📊 All Conversations")
+    
+    # Tambahkan debug info
+    # with st.expander("🐛 Debug Info"):
+    #     try:
+    #         # Debug 1: Cek semua collections di root level
+    #         collections = chat_manager.db.collections()
+    #         st.write("Available collections:")
+    #         for collection in collections:
+    #             st.write(f"- {collection.id}")
+            
+    #         # Debug 2: Cek apakah ada data di collection conversations
+    #         conversations_ref = chat_manager.db.collection("conversations")
+            
+    #         # Coba ambil semua documents (termasuk yang tidak ada parent doc)
+    #         all_docs = list(conversations_ref.list_documents())
+    #         st.write(f"Documents in conversations collection: {len(all_docs)}")
+            
+    #         # Debug 3: Cek setiap document
+    #         for doc_ref in all_docs:
+    #             st.write(f"Document ID: {doc_ref.id}")
+                
+    #             # Cek apakah document benar-benar ada
+    #             doc_snapshot = doc_ref.get()
+    #             if doc_snapshot.exists:
+    #                 st.write(f"  - Document exists with data: {doc_snapshot.to_dict()}")
+    #             else:
+    #                 st.write(f"  - Document doesn't exist (only subcollections)")
+                
+    #             # Cek subcollections
+    #             subcollections = doc_ref.collections()
+    #             for subcoll in subcollections:
+    #                 subcoll_docs = list(subcoll.stream())
+    #                 st.write(f"  - Subcollection '{subcoll.id}': {len(subcoll_docs)} messages")
+            
+    #         # Debug 4: Langsung cek method save_conversation
+    #         st.write(f"Current user_id: {st.session_state.get('user_id', 'Not set')}")
+            
+    #     except Exception as e:
+    #         st.error(f"Debug error: {e}")
+    #         import traceback
+    #         st.code(traceback.format_exc())
+            
+    # Get all conversations
+    # Get all conversations from the shared snapshot, pulling only new messages
+    snapshot = get_admin_snapshot()
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        force_refresh = st.button("🔄 Refresh Data")
+    df = snapshot.refresh(chat_manager, force=force_refresh)
+    with col2:
+        if snapshot.last_refreshed_at:
+            st.caption(f"Snapshot of {len(df)} messages, updated "
+                       f"{snapshot.last_refreshed_at.strftime('%H:%M:%S')} "
+                       f"({snapshot.last_fetch_rows} rows in {snapshot.last_fetch_seconds * 1000:.0f} ms)")
+
+    render_usage_rollups(chat_manager)
+
+    render_export_panel(chat_manager)
+
+    if not df.empty:
+        # Display conversations
+        st.subheader("Recent Conversations")
+
+        # Search and filters run against the local snapshot and its index
+        search_query = st.text_input("🔍 Search messages", key="admin_search_query",
+                                     placeholder="Kata kunci di pertanyaan atau jawaban")
+        col1, col2 = st.columns(2)
+        with col1:
+            user_filter = st.text_input("Filter by user ID", key="admin_user_filter")
+        with col2:
+            date_range = st.date_input("Date range", value=(), key="admin_date_filter")
+
+        if search_query:
+            import pandas as pd
+
+            start = time.perf_counter()
+            with get_metrics().span("admin_search"):
+                results = snapshot.search_index.search(search_query, user_filter, date_range)
+            view_df = pd.DataFrame(results, columns=AdminSnapshot.COLUMNS + ["score"])
+            st.caption(f"{len(view_df)} messages ranked by relevance "
+                       f"({(time.perf_counter() - start) * 1000:.1f} ms)")
+        else:
+            view_df = filter_conversations(df, user_filter, date_range)
+            st.caption(f"{len(view_df)} matching messages")
+
+        # Pagination for admin view
+        page_size = 20
+        total_pages = (len(view_df) + page_size - 1) // page_size
+
+        if "admin_page" not in st.session_state:
+            st.session_state.admin_page = 1
+        st.session_state.admin_page = min(st.session_state.admin_page, max(total_pages, 1))
+
+        start_idx = (st.session_state.admin_page - 1) * page_size
+        end_idx = start_idx + page_size
+        page_df = view_df.iloc[start_idx:end_idx]
+        
+        for _, row in page_df.iterrows():
+            title = f"👤 {row['user_id'][:8]}... - {row['timestamp'].strftime('%Y-%m-%d %H:%M:%S')}"
+            if search_query:
+                title += f" — {row['input'][:60]} (score {row['score']:.2f})"
+            with st.expander(title):
+                st.markdown(f"**User Input:** {row['input']}")
+                st.markdown(f"**AI Response:** {row['response']}")
+                st.markdown(f"**Timestamp:** {row['timestamp']}")
+        
+        # Admin pagination
+        st.session_state.admin_page = render_pagination(
+            st.session_state.admin_page, 
+            total_pages,
+            "admin"
+        )
+        
+    else:
+        st.info("No conversations found.")
+
+def render_latency_panel(metrics: MetricsRegistry):
+    """Render the per-stage latency breakdown and the slowest recent turns"""
+    import pandas as pd
+
+    summary = metrics.summary()
+    if not summary:
+        st.info("No timings recorded yet.")
+        return
+
+    st.subheader("⏱️ Stage Latency")
+    st.caption(f"Since {metrics.started_at.strftime('%Y-%m-%d %H:%M:%S')}; percentiles over the last "
+               f"1000 samples of each stage")
+    stage_df = pd.DataFrame([{
+        "stage": stage,
+        "count": stats["count"],
+        "avg ms": stats["avg"] * 1000,
+        "p50 ms": stats["p50"] * 1000,
+        "p95 ms": stats["p95"] * 1000,
+        "p99 ms": stats["p99"] * 1000,
+        "max ms": stats["max"] * 1000
+    } for stage, stats in summary.items()]).set_index("stage").round(1)
+    st.dataframe(stage_df, use_container_width=True)
+
+    if "overlap_saved" in summary:
+        st.caption("overlap_saved: time of persist_input, visualization and save that ran alongside the "
+                   "model call or the answer display instead of adding to the turn.")
+
+    # Where an average turn spends its time
+    turn_stages = [stage for stage in ("model", "visualization", "save") if stage in summary]
+    if turn_stages:
+        st.bar_chart(stage_df.loc[turn_stages, ["avg ms", "p95 ms"]])
+
+    sizes = metrics.size_summary()
+    if sizes:
+        st.subheader("📏 Prompt Size")
+        st.caption("Characters sent to the model per turn; \"context\" is the recent turns plus the summary. "
+                   "Tune context_char_budget against the model latency above.")
+        st.dataframe(pd.DataFrame([{
+            "part": name,
+            "count": stats["count"],
+            "avg chars": stats["avg"],
+            "p50 chars": stats["p50"],
+            "p95 chars": stats["p95"],
+            "max chars": stats["max"]
+        } for name, stats in sizes.items()]).set_index("part").round(0), use_container_width=True)
+
+    slowest = metrics.slowest_turns(10)
+    if slowest:
+        st.subheader("🐢 Slowest Recent Turns")
+        st.dataframe(pd.DataFrame([{
+            "time": turn["started_at"],
+            "user": turn["user_id"][:12],
+            "prompt": turn["prompt"],
+            "total ms": round(turn["total"] * 1000),
+            "first token ms": round(turn["stages"].get("first_token", 0) * 1000),
+            "model ms": round(turn["stages"].get("model", 0) * 1000),
+            "viz ms": round(turn["stages"].get("visualization", 0) * 1000),
+            "save ms": round(turn["stages"].get("save", 0) * 1000),
+            "saved ms": round(turn["stages"].get("overlap_saved", 0) * 1000),
+            "prompt chars": turn["sizes"].get("prompt", 0),
+            "ok": turn["success"]
+        } for turn in slowest]), use_container_width=True, hide_index=True)
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button("Download JSON", data=metrics.to_json(),
+                           file_name=f"latency_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+                           mime="application/json")
+    with col2:
+        st.download_button("Download Prometheus", data=metrics.to_prometheus(),
+                           file_name="metrics.prom", mime="text/plain")
+
+# Main app
+def main():
+    load_css()
+    # Clients and caches are warmed in the background on the first run after a restart
+    start_warmup()
+    start_metrics_server()
+    
+    # Sesi login dengan ID token dicek ulang (lokal selama token masih di cache)
+    restore_login()
+
+    # Initialize anonymous user ID jika belum ada user_id
+    if "user_id" not in st.session_state:
+        generate_anonymous_user_id()
+    
+    # Route to appropriate page
+    current_page = st.session_state.get("current_page_name", "chat")
+    
+    if current_page == "admin" and st.session_state.get("is_admin", False):
+        admin_page()
+    else:
+        chat_page()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+# scripts/backfill_rollups.py
+"""Rebuild the usage rollup documents from the stored conversations
+
+    python scripts/backfill_rollups.py
+
+Uses the same Firebase credentials as the app (.streamlit/secrets.toml or
+firebase-credentials.json in the working directory).
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+
+if __name__ == "__main__":
+    chat_manager = main.ChatManager()
+    result = chat_manager.rebuild_usage_rollups()
+    if not result["success"]:
+        print(f"Rebuild failed: {result['error']}")
+        sys.exit(1)
+    print(f"Rebuilt {result['days']} days from {result['messages']} messages ({result['users']} users)")
@@ -0,0 +1,47 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+from fake_firestore import FakeFirestore  # noqa: E402
+
+
+@pytest.fixture(params=["sqlite", "firestore"])
+def store(request, tmp_path):
+    """Each ConversationStore backend, empty"""
+    if request.param == "sqlite":
+        return main.SQLiteStore(str(tmp_path / "chat.db"))
+    return main.FirestoreStore(FakeFirestore())
+
+
+@pytest.fixture
+def mock_backend():
+    """Mock /generate backend from benchmarks/, returns (config, base_url)"""
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+    from mock_llm_server import MockLLMConfig, start_mock_server
+
+    config = MockLLMConfig(latency=0.5, latency_dist="fixed", first_token_share=0.0, seed=1)
+    server, url = start_mock_server(config)
+    yield config, url
+    server.shutdown()
+
+
+@pytest.fixture
+def chat_manager(monkeypatch, tmp_path, mock_backend):
+    """ChatManager on SQLite and the mock backend, with fresh shared resources"""
+    _, url = mock_backend
+    for key, value in {
+        "NGROK_API_URL": url,
+        "STORAGE_BACKEND": "sqlite",
+        "SQLITE_PATH": str(tmp_path / "chat.db"),
+        "ANSWER_CACHE_PATH": "",
+        "LLM_MAX_CONCURRENT": "2",
+        "RETRIEVAL_ENABLED": "false"
+    }.items():
+        monkeypatch.setenv(key, value)
+    main.st.cache_resource.clear()
+    yield main.ChatManager()
+    main.st.cache_resource.clear()
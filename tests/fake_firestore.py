@@ -0,0 +1,285 @@
+# tests/fake_firestore.py
+"""In-process stand-in for the parts of the Firestore client used by main.py
+
+Every RPC (stream, get, commit, count) sleeps for ``latency`` seconds so
+round-trip heavy access patterns show up in benchmarks, and every document
+returned is counted in ``reads`` the same way Firestore bills them.
+"""
+import threading
+import time
+import uuid
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from google.cloud.firestore_v1.transforms import Increment
+
+
+class FakeSnapshot:
+    def __init__(self, reference, data: Optional[Dict]):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+
+    @property
+    def exists(self) -> bool:
+        return self._data is not None
+
+    def to_dict(self) -> Optional[Dict]:
+        return dict(self._data) if self._data is not None else None
+
+    def get(self, field: str):
+        return (self._data or {}).get(field)
+
+
+class FakeAggregationResult:
+    def __init__(self, alias: str, value: int):
+        self.alias = alias
+        self.value = value
+
+
+class FakeAggregationQuery:
+    def __init__(self, query, alias: str):
+        self.query = query
+        self.alias = alias
+
+    def get(self):
+        db = self.query.db
+        db._round_trip()
+        count = len(self.query._matching())
+        # Firestore bills one read per 1000 index entries counted
+        db._count_reads(max(1, (count + 999) // 1000))
+        return [[FakeAggregationResult(self.alias, count)]]
+
+
+class FakeQuery:
+    def __init__(self, db, paths_fn, filters=None, orders=None, limit=None, cursor=None, fields=None):
+        self.db = db
+        self._paths_fn = paths_fn
+        self._filters = filters or []
+        self._orders = orders or []
+        self._limit = limit
+        self._cursor = cursor
+        self._fields = fields
+
+    def _copy(self, **changes):
+        values = {
+            "filters": self._filters, "orders": self._orders, "limit": self._limit,
+            "cursor": self._cursor, "fields": self._fields
+        }
+        values.update(changes)
+        return FakeQuery(self.db, self._paths_fn, **values)
+
+    def where(self, field: str = None, op: str = None, value=None, filter=None):
+        if filter is not None:
+            field, op, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + [(field, op, value)])
+
+    def order_by(self, field: str, direction: str = "ASCENDING"):
+        return self._copy(orders=self._orders + [(field, direction)])
+
+    def limit(self, count: int):
+        return self._copy(limit=count)
+
+    def start_after(self, values):
+        if isinstance(values, FakeSnapshot):
+            values = values.to_dict()
+        return self._copy(cursor=values)
+
+    def select(self, fields: List[str]):
+        return self._copy(fields=list(fields))
+
+    def count(self, alias: str = "count"):
+        return FakeAggregationQuery(self, alias)
+
+    def _matching(self) -> List[tuple]:
+        ops = {
+            "==": lambda a, b: a == b, "!=": lambda a, b: a != b,
+            ">": lambda a, b: a is not None and a > b, ">=": lambda a, b: a is not None and a >= b,
+            "<": lambda a, b: a is not None and a < b, "<=": lambda a, b: a is not None and a <= b,
+            "in": lambda a, b: a in b
+        }
+        with self.db.lock:
+            rows = [(path, dict(self.db.docs[path])) for path in self._paths_fn() if path in self.db.docs]
+
+        rows = [row for row in rows
+                if all(ops[op](row[1].get(field), value) for field, op, value in self._filters)]
+
+        for field, direction in reversed(self._orders):
+            rows = [row for row in rows if row[1].get(field) is not None]
+            rows.sort(key=lambda row: row[1][field], reverse=direction == "DESCENDING")
+
+        if self._cursor is not None and self._orders:
+            field, direction = self._orders[0]
+            anchor = self._cursor[field]
+            if direction == "DESCENDING":
+                rows = [row for row in rows if row[1][field] < anchor]
+            else:
+                rows = [row for row in rows if row[1][field] > anchor]
+        return rows
+
+    def stream(self):
+        self.db._round_trip()
+        rows = self._matching()
+        if self._limit is not None:
+            rows = rows[:self._limit]
+        self.db._count_reads(len(rows))
+        for path, data in rows:
+            if self._fields is not None:
+                data = {field: data.get(field) for field in self._fields}
+            yield FakeSnapshot(self.db._document_from_path(path), data)
+
+    def get(self):
+        return list(self.stream())
+
+
+class FakeDocumentReference:
+    def __init__(self, db, path: str):
+        self.db = db
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    @property
+    def parent(self):
+        return FakeCollectionReference(self.db, self.path.rsplit("/", 1)[0])
+
+    def collection(self, name: str):
+        return FakeCollectionReference(self.db, f"{self.path}/{name}")
+
+    def collections(self):
+        prefix = self.path + "/"
+        with self.db.lock:
+            names = {path.rsplit("/", 1)[-1] for path in self.db.children if path.startswith(prefix)
+                     and "/" not in path[len(prefix):]}
+        return [self.collection(name) for name in sorted(names)]
+
+    def set(self, data: Dict, merge: bool = False):
+        self.db._round_trip()
+        self.db._apply(self.path, data, merge)
+
+    def get(self):
+        self.db._round_trip()
+        self.db._count_reads(1)
+        with self.db.lock:
+            data = self.db.docs.get(self.path)
+        return FakeSnapshot(self, dict(data) if data is not None else None)
+
+
+class FakeCollectionReference(FakeQuery):
+    def __init__(self, db, path: str):
+        super().__init__(db, lambda: db._collection_paths(path))
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    @property
+    def parent(self):
+        if "/" not in self.path:
+            return None
+        return FakeDocumentReference(self.db, self.path.rsplit("/", 1)[0])
+
+    def document(self, document_id: str = None):
+        return FakeDocumentReference(self.db, f"{self.path}/{document_id or uuid.uuid4().hex[:20]}")
+
+    def list_documents(self):
+        # Includes "missing" parent documents that only hold subcollections
+        self.db._round_trip()
+        with self.db.lock:
+            paths = sorted(self.db.children.get(self.path, ()))
+        return [FakeDocumentReference(self.db, path) for path in paths]
+
+
+class FakeWriteBatch:
+    def __init__(self, db):
+        self.db = db
+        self.writes = []
+
+    def set(self, reference, data: Dict, merge: bool = False):
+        self.writes.append((reference.path, data, merge))
+
+    def delete(self, reference):
+        self.writes.append((reference.path, None, False))
+
+    def commit(self):
+        self.db._round_trip()
+        with self.db.lock:
+            for path, data, merge in self.writes:
+                if data is None:
+                    self.db._delete(path)
+                else:
+                    self.db._apply(path, data, merge)
+
+
+class FakeFirestore:
+    """Dictionary backed Firestore client with simulated round-trip latency"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.docs = {}
+        # collection path -> document paths (existing or implied by subcollections)
+        self.children = defaultdict(set)
+        # collection id -> document paths, for collection group queries
+        self.groups = defaultdict(set)
+        self.reads = 0
+        self.round_trips = 0
+        self.lock = threading.RLock()
+
+    def _round_trip(self):
+        with self.lock:
+            self.round_trips += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _count_reads(self, count: int):
+        with self.lock:
+            self.reads += count
+
+    def _all_paths(self) -> List[str]:
+        with self.lock:
+            return list(self.docs)
+
+    def _collection_paths(self, path: str) -> List[str]:
+        with self.lock:
+            return [p for p in self.children.get(path, ()) if p in self.docs]
+
+    def _group_paths(self, name: str) -> List[str]:
+        with self.lock:
+            return list(self.groups.get(name, ()))
+
+    def _register(self, path: str):
+        parts = path.split("/")
+        self.groups[parts[-2]].add(path)
+        for end in range(2, len(parts) + 1, 2):
+            self.children["/".join(parts[:end - 1])].add("/".join(parts[:end]))
+
+    def _document_from_path(self, path: str):
+        return FakeDocumentReference(self, path)
+
+    def _apply(self, path: str, data: Dict, merge: bool):
+        with self.lock:
+            if path not in self.docs:
+                self._register(path)
+            current = dict(self.docs.get(path, {})) if merge else {}
+            for field, value in data.items():
+                if isinstance(value, Increment):
+                    current[field] = current.get(field, 0) + value.value
+                else:
+                    current[field] = value
+            self.docs[path] = current
+
+    def _delete(self, path: str):
+        with self.lock:
+            self.docs.pop(path, None)
+            self.groups[path.split("/")[-2]].discard(path)
+
+    def collection(self, name: str):
+        return FakeCollectionReference(self, name)
+
+    def collection_group(self, name: str):
+        return FakeQuery(self, lambda: self._group_paths(name))
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    def collections(self):
+        with self.lock:
+            names = {path for path in self.children if "/" not in path}
+        return [self.collection(name) for name in sorted(names)]
@@ -0,0 +1,45 @@
+import json
+import os
+from datetime import datetime, timedelta
+
+import main
+from fake_firestore import FakeFirestore
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _filled_store() -> main.FirestoreStore:
+    store = main.FirestoreStore(FakeFirestore())
+    start = datetime(2026, 3, 1, 8)
+    for minute in range(12):
+        store.save_message(f"anon_{minute % 4}", f"Question {minute}", "Answer", start + timedelta(minutes=minute))
+    return store
+
+
+def test_collection_group_and_parallel_fetch_agree():
+    store = _filled_store()
+
+    grouped = store.get_all_conversations(limit=5)
+    parallel = store.get_all_conversations(limit=5, mode="parallel", max_workers=3)
+
+    assert [row["input"] for row in grouped] == [f"Question {minute}" for minute in range(11, 6, -1)]
+    assert [row["message_id"] for row in parallel] == [row["message_id"] for row in grouped]
+    assert grouped[0]["user_id"] == "anon_3"
+
+
+def test_incremental_fetch_only_returns_newer_messages():
+    store = _filled_store()
+    since = datetime(2026, 3, 1, 8, 9)
+
+    rows = store.get_all_conversations(since=since, mode="parallel")
+
+    assert [row["input"] for row in rows] == ["Question 11", "Question 10"]
+
+
+def test_index_config_covers_both_timestamp_directions():
+    with open(os.path.join(ROOT, "firestore.indexes.json")) as f:
+        overrides = json.load(f)["fieldOverrides"]
+
+    timestamp = next(o for o in overrides if (o["collectionGroup"], o["fieldPath"]) == ("messages", "timestamp"))
+    scopes = {(index["queryScope"], index["order"]) for index in timestamp["indexes"]}
+    assert {("COLLECTION_GROUP", "ASCENDING"), ("COLLECTION_GROUP", "DESCENDING")} <= scopes
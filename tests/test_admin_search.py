@@ -0,0 +1,45 @@
+from datetime import date, datetime
+
+import main
+
+
+def _row(message_id: str, user_id: str, question: str, answer: str, day: int) -> dict:
+    return {"message_id": message_id, "user_id": user_id, "input": question, "response": answer,
+            "timestamp": datetime(2026, 3, day, 10)}
+
+
+def _index() -> main.ConversationSearchIndex:
+    index = main.ConversationSearchIndex()
+    index.add_many([
+        _row("m1", "anon_1", "Jadwal perwalian kapan?", "Perwalian minggu depan di ruang dosen.", 1),
+        _row("m2", "user_budi", "Cara mengisi KRS", "Buka SIAKAD lalu isi jadwal kuliah.", 2),
+        _row("m3", "anon_2", "Syarat skripsi", "Lulus 120 SKS.", 3),
+        _row("m4", "user_budi", "Daftar dosen pembimbing", "Lihat daftar dosen di website.", 4)
+    ])
+    return index
+
+
+def test_question_hits_rank_above_answer_hits_and_stems_match():
+    index = _index()
+
+    assert [row["message_id"] for row in index.search("jadwal")] == ["m1", "m2"]
+    # "pendaftaran" is stemmed to the stored "daftar"
+    assert [row["message_id"] for row in index.search("pendaftaran")] == ["m4"]
+    assert index.search("yang dan di") == []
+
+
+def test_filters_by_user_and_date_range():
+    index = _index()
+
+    assert [row["message_id"] for row in index.search("dosen", user_filter="BUDI")] == ["m4"]
+    assert [row["message_id"] for row in index.search("dosen", date_range=(date(2026, 3, 2), date(2026, 3, 5)))] == [
+        "m4"
+    ]
+    assert index.search("dosen", date_range=(date(2026, 3, 2), date(2026, 3, 3))) == []
+
+
+def test_rows_are_indexed_once():
+    index = _index()
+
+    assert index.add(_row("m1", "anon_1", "Jadwal perwalian kapan?", "Ulang", 1)) is False
+    assert index.stats()["messages"] == 4
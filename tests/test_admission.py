@@ -0,0 +1,94 @@
+import gc
+import threading
+import time
+
+import main
+
+
+def test_abandoned_streams_do_not_lock_out_other_users(chat_manager):
+    chat_manager.queue_timeout = 0.5
+    abandoned = [chat_manager.stream_message_to_api(f"Pertanyaan {index}", user_id=f"anon_{index}")
+                 for index in range(chat_manager.admission.max_concurrent)]
+    for stream in abandoned:
+        next(stream["stream"])
+    del stream
+    abandoned.clear()
+    gc.collect()
+
+    result = chat_manager.stream_message_to_api("Pertanyaan lain", user_id="anon_other")
+
+    assert result["success"], result["error"]
+    assert "".join(result["stream"])
+    assert chat_manager.admission.stats()["active"] == 0
+
+
+def test_rate_limiter_table_is_bounded_by_evicting_the_least_recent_user():
+    limiter = main.RateLimiter(rate_per_minute=1.0, burst=1, max_users=2)
+
+    assert limiter.acquire("a") == 0.0
+    assert limiter.acquire("b") == 0.0
+    assert limiter.acquire("a") > 0
+    assert limiter.acquire("c") == 0.0
+
+    assert list(limiter.buckets) == ["a", "c"]
+    assert limiter.acquire("a") > 0
+    assert limiter.rejected == 2
+
+
+def _wait_for(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def test_waiting_users_are_served_round_robin():
+    queue = main.FairQueue(max_concurrent=1)
+    holder = queue.enter("holder", timeout=1)
+    order, positions = [], {}
+
+    def ask(label: str, user_id: str):
+        ticket = queue.enter(user_id, timeout=5, on_position=lambda position: positions.update({label: position}))
+        order.append(label)
+        queue.release(ticket)
+
+    threads = []
+    for count, (label, user_id) in enumerate([("g1", "greedy"), ("g2", "greedy"), ("g3", "greedy"),
+                                              ("n1", "normal")], start=1):
+        threads.append(threading.Thread(target=ask, args=(label, user_id)))
+        threads[-1].start()
+        _wait_for(lambda: queue.stats()["waiting"] == count)
+    # Later arrivals move ahead of the greedy user's extra tickets; waiters re-check every second
+    _wait_for(lambda: positions == {"g1": 1, "g2": 3, "g3": 4, "n1": 2})
+
+    queue.release(holder)
+    for thread in threads:
+        thread.join()
+
+    assert set(positions.values()) == {0}
+    assert order == ["g1", "n1", "g2", "g3"]
+    assert queue.stats()["longest_queue"] == 4
+
+
+def test_timed_out_ticket_leaves_the_queue():
+    queue = main.FairQueue(max_concurrent=1)
+    holder = queue.enter("anon_1", timeout=1)
+
+    assert queue.enter("anon_2", timeout=0.05) is None
+
+    stats = queue.stats()
+    assert (stats["timeouts"], stats["waiting"], stats["active"]) == (1, 0, 1)
+    queue.release(holder)
+    assert queue.enter("anon_2", timeout=0) is not None
+
+
+def test_fractional_shares_and_expired_slots():
+    queue = main.FairQueue(max_concurrent=1, max_hold=0.05)
+    shares = [queue.enter(f"anon_{index}", timeout=0, weight=0.25) for index in range(4)]
+    assert all(shares) and queue.stats()["load"] == 1.0
+    assert queue.enter("anon_5", timeout=0, weight=0.25) is None
+
+    # Holders that never release are reclaimed after max_hold
+    time.sleep(0.1)
+    assert queue.enter("anon_5", timeout=0) is not None
+    assert queue.stats()["expired_slots"] == 4
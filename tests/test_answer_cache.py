@@ -0,0 +1,79 @@
+from streamlit.testing.v1 import AppTest
+
+import main
+
+
+def test_invalidate_drops_the_answer_under_every_scope(tmp_path):
+    cache = main.ResponseCache(path=str(tmp_path / "answers.json"))
+    cache.put("What is RAG?", "plain")
+    cache.put("what is  rag?", "with context", scope="abc123")
+    cache.put("Other question", "kept", scope="abc123")
+
+    assert cache.cached_prompts() == ["Other question", "what is  rag?"]
+    assert cache.invalidate("WHAT IS RAG?") == 2
+    assert cache.get("What is RAG?") is None
+    assert cache.get("What is RAG?", scope="abc123") is None
+    assert cache.get("Other question", scope="abc123") == "kept"
+
+    reloaded = main.ResponseCache(path=str(tmp_path / "answers.json"))
+    assert reloaded.cached_prompts() == ["Other question"]
+    assert reloaded.invalidate("Other question") == 1
+
+
+def _answer_cache_admin(path):
+    import main
+
+    main.render_answer_cache_admin(main.ResponseCache(path=path))
+
+
+def test_admin_invalidate_removes_scoped_answers(tmp_path):
+    path = str(tmp_path / "answers.json")
+    cache = main.ResponseCache(path=path)
+    cache.put("What is RAG?", "with context", scope="abc123")
+    cache.put("What is RAG?", "other context", scope="def456")
+    cache.persist()
+
+    at = AppTest.from_function(_answer_cache_admin, args=(path,)).run()
+    assert at.selectbox(key="answer_cache_selected").value == "What is RAG?"
+    at.button(key="answer_cache_invalidate").click().run()
+
+    assert not at.exception
+    assert main.ResponseCache(path=path).stats()["entries"] == 0
+
+
+def test_least_recently_used_answer_is_evicted_first():
+    cache = main.ResponseCache(max_entries=2)
+    cache.put("Kapan perwalian?", "Senin")
+    cache.put("Cara isi KRS?", "Lewat SIAKAD")
+    assert cache.get("kapan perwalian?") == "Senin"
+
+    cache.put("Siapa dosen PA?", "Lihat KHS")
+
+    assert cache.get("Cara isi KRS?") is None
+    assert cache.get("Kapan perwalian?") == "Senin"
+    assert cache.stats()["entries"] == 2
+
+
+def test_expired_answer_is_a_miss_and_hits_count_saved_time(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(main.time, "time", lambda: clock[0])
+    cache = main.ResponseCache(ttl=60)
+    cache.put("Kapan perwalian?", "Senin", latency=2.5)
+
+    assert cache.get("Kapan perwalian?") == "Senin"
+    clock[0] += 61
+    assert cache.get("Kapan perwalian?") is None
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 0)
+    assert stats["saved_seconds"] == 2.5
+
+
+def test_scoped_answers_are_not_served_without_their_scope(tmp_path):
+    path = str(tmp_path / "answers.json")
+    cache = main.ResponseCache(path=path, persist_interval=0)
+    cache.put("Di ruang mana?", "Ruang 3.1", scope="abc123")
+
+    assert cache.get("Di ruang mana?") is None
+    assert cache.get("Di ruang mana?", scope="def456") is None
+    assert main.ResponseCache(path=path).get("di ruang mana?", scope="abc123") == "Ruang 3.1"
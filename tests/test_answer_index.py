@@ -0,0 +1,85 @@
+import sqlite3
+from datetime import datetime, timedelta
+
+import main
+
+ANSWER = "Retrieval augmented generation looks documents up before answering."
+
+
+def test_refresh_skips_context_and_served_answers(store):
+    now = datetime.now()
+    store.save_message("anon_a", "What is RAG?", ANSWER, now - timedelta(minutes=3))
+    store.save_message("anon_b", "What is RAG?", "It builds on the question before.", now - timedelta(minutes=2),
+                       has_context=True)
+    store.save_message("anon_c", "What is RAG?", ANSWER, now - timedelta(minutes=1), from_index=True)
+    store.save_message("anon_d", "Explain TF-IDF", "Term frequency weighted by inverse document frequency.",
+                       now, has_context=True)
+
+    index = main.AnswerIndex(store)
+    assert index.refresh() == 4
+
+    assert [(entry["question"], entry["count"], entry["answer"]) for entry in index.entries] == [
+        ("What is RAG?", 1, ANSWER)
+    ]
+    assert index.lookup("what is rag")["mode"] == "answer"
+    assert index.lookup("explain tf-idf") is None
+
+
+def test_sqlite_store_migrates_messages_without_origin_columns(tmp_path):
+    path = tmp_path / "old.db"
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE messages (id TEXT PRIMARY KEY, user_id TEXT NOT NULL, input TEXT NOT NULL, "
+                 "response TEXT NOT NULL, timestamp REAL NOT NULL, is_anonymous INTEGER NOT NULL)")
+    conn.execute("INSERT INTO messages VALUES ('m1', 'anon_a', 'What is RAG?', ?, ?, 1)",
+                 (ANSWER, datetime.now().timestamp()))
+    conn.commit()
+    conn.close()
+
+    store = main.SQLiteStore(str(path))
+    store.save_message("anon_b", "What is RAG?", ANSWER, datetime.now(), from_index=True)
+
+    rows = list(store.iter_conversations())
+    assert [(row["message_id"], row["has_context"], row["from_index"]) for row in rows][0] == ("m1", False, False)
+    assert rows[1]["from_index"] is True
+
+
+def _index(store, **options) -> main.AnswerIndex:
+    now = datetime.now()
+    store.save_message("anon_a", "Bagaimana cara mengisi KRS online?", "Login ke SIAKAD lalu pilih menu KRS.",
+                       now - timedelta(minutes=2))
+    store.save_message("anon_b", "Bagaimana cara mengisi KRS online?", "Buka SIAKAD, menu KRS, lalu simpan.",
+                       now - timedelta(minutes=1))
+    store.save_message("anon_c", "Kapan jadwal perwalian?", "Ok.", now)
+    index = main.AnswerIndex(store, answer_threshold=0.9, suggest_threshold=0.5, **options)
+    index.refresh()
+    return index
+
+
+def test_thresholds_decide_between_answer_and_suggestion(store):
+    index = _index(store)
+
+    exact = index.lookup("bagaimana cara mengisi krs online")
+    assert exact["mode"] == "answer"
+    assert (exact["count"], exact["answer"]) == (2, "Buka SIAKAD, menu KRS, lalu simpan.")
+    assert index.lookup("bagaimana mengisi krs")["mode"] == "suggest"
+    assert index.lookup("bagaimana cara mengisi krs online", has_context=True)["mode"] == "suggest"
+    assert index.lookup("jadwal ujian skripsi") is None
+    # Answers shorter than min_answer_chars are never indexed
+    assert index.lookup("kapan jadwal perwalian") is None
+    assert index.stats()["answered"] == 1
+
+
+def test_curation_is_required_when_approval_is_on_and_survives_a_restart(store):
+    index = _index(store, require_approval=True)
+    key = main.question_key("Bagaimana cara mengisi KRS online?")
+    assert index.lookup("bagaimana cara mengisi krs online") is None
+
+    index.set_eligible(key, True, updated_by="admin@example.com")
+    assert index.lookup("bagaimana cara mengisi krs online")["mode"] == "answer"
+
+    restarted = main.AnswerIndex(store, require_approval=True)
+    restarted.refresh()
+    assert restarted.top_entries()[0]["eligible"] is True
+
+    index.set_eligible(key, False)
+    assert index.lookup("bagaimana cara mengisi krs online") is None
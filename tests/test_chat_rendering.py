@@ -0,0 +1,19 @@
+import textwrap
+
+import main
+
+
+def test_joined_bubbles_stay_html_after_dedent():
+    # st.markdown dedents and strips the joined block of text-only bubbles
+    messages = [
+        main.ChatMessage("user", "Berapa jumlah mahasiswa?"),
+        main.ChatMessage("assistant", "Berikut datanya:\n1. Angkatan 2019: 80\n\n2. Angkatan 2020: 95"),
+        main.ChatMessage("user", "Terima kasih")
+    ]
+    block = textwrap.dedent("".join(main.get_message_html(message) for message in messages)).strip()
+    lines = block.splitlines()
+
+    # An indented line after a blank one is an indented code block in CommonMark
+    for previous, line in zip(lines, lines[1:]):
+        assert previous.strip() or not line.startswith("    "), line
+    assert block.count('<div class="message-container">') == 3
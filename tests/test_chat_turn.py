@@ -0,0 +1,35 @@
+import main
+
+
+def test_turn_stores_the_answer_and_records_its_stages(chat_manager):
+    metrics = main.MetricsRegistry()
+    messages = []
+    shown = []
+    turn = metrics.start_turn("anon_1", "Bagaimana cara mengisi KRS?")
+
+    result = main.run_chat_turn(chat_manager, messages, main.ConversationContext(char_budget=2000), "anon_1",
+                                "Bagaimana cara mengisi KRS?", turn,
+                                show_stream=lambda chunks: "".join(shown.append(chunk) or chunk for chunk in chunks))
+
+    assert result["success"] and not result.get("save_error")
+    assert [message.role for message in messages] == ["user", "assistant"]
+    assert messages[1].content == "".join(shown)
+    assert {"retrieval", "model", "first_token", "save", "turn"} <= set(turn.stages)
+    assert metrics.slowest_turns()[0]["success"] is True
+
+    rows = list(chat_manager.store.iter_conversations(user_id="anon_1"))
+    assert [(row["input"], row["has_context"], row["from_index"]) for row in rows] == [
+        ("Bagaimana cara mengisi KRS?", False, False)
+    ]
+
+
+def test_follow_up_turn_is_stored_with_context(chat_manager):
+    metrics = main.MetricsRegistry()
+    messages = []
+    context_builder = main.ConversationContext(char_budget=2000)
+    for prompt in ("Kapan perwalian?", "Di ruang mana?"):
+        main.run_chat_turn(chat_manager, messages, context_builder, "anon_1", prompt,
+                           metrics.start_turn("anon_1", prompt))
+
+    rows = list(chat_manager.store.iter_conversations(user_id="anon_1"))
+    assert [row["has_context"] for row in rows] == [False, True]
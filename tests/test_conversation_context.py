@@ -0,0 +1,68 @@
+from streamlit.testing.v1 import AppTest
+
+import main
+
+
+def _session_context_budget():
+    import streamlit as st
+
+    import main
+
+    st.text(main.get_conversation_context().char_budget)
+
+
+def test_context_is_off_by_default(monkeypatch):
+    monkeypatch.delenv("CONTEXT_CHAR_BUDGET", raising=False)
+    at = AppTest.from_function(_session_context_budget).run()
+    assert at.text[0].value == "0"
+
+
+def test_follow_up_without_context_is_served_from_the_answer_cache(chat_manager):
+    context = main.ConversationContext(char_budget=0).build([
+        main.ChatMessage("user", "Kapan perwalian?"),
+        main.ChatMessage("assistant", "Minggu depan.")
+    ])
+    assert context is None
+
+    first = chat_manager.send_message_to_api("Bagaimana cara mengisi KRS?", context, user_id="anon_1")
+    again = chat_manager.send_message_to_api("Bagaimana cara mengisi KRS?", context, user_id="anon_2")
+
+    assert first["success"] and not first.get("cached")
+    assert again.get("cached") is True
+
+
+def _history(turns: int) -> list:
+    messages = []
+    for turn in range(turns):
+        messages.append(main.ChatMessage("user", f"Pertanyaan nomor {turn}. Detail tambahan.", created=turn * 2 + 1))
+        messages.append(main.ChatMessage("assistant", f"Jawaban nomor {turn}. " + "x" * 60, created=turn * 2 + 2))
+    return messages
+
+
+def test_recent_turns_fit_the_budget_and_older_ones_are_summarized():
+    builder = main.ConversationContext(char_budget=200, max_messages=4, summary_chars=120)
+    messages = _history(6)
+
+    context = builder.build(messages)
+
+    assert [turn["content"] for turn in context["turns"]] == [m.content for m in messages[-3:]]
+    assert sum(len(turn["content"]) for turn in context["turns"]) <= 200
+    # Only first sentences are kept, and the oldest lines are dropped past summary_chars
+    assert len(context["summary"]) <= 120
+    assert context["summary"].splitlines()[-1] == "User: Pertanyaan nomor 4."
+    assert builder.folded_messages == 9
+
+
+def test_each_message_is_folded_once_and_errors_are_skipped():
+    builder = main.ConversationContext(char_budget=200, max_messages=2)
+    messages = _history(3)
+    builder.build(messages)
+    folded = builder.folded_messages
+
+    messages.append(main.ChatMessage("user", "Pertanyaan baru.", created=20))
+    messages.append(main.ChatMessage("assistant", "Sorry, I encountered an error: timeout", created=21))
+    context = builder.build(messages)
+
+    assert builder.folded_messages == folded + 1
+    assert [turn["content"] for turn in context["turns"]] == [messages[-3].content, "Pertanyaan baru."]
+    assert "error" not in context["summary"]
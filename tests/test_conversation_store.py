@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import main
+
+
+def test_backend_missing_methods_fails_at_construction():
+    class PartialStore(main.ConversationStore):
+        def save_message(self, user_id, user_input, bot_response, timestamp):
+            pass
+
+    with pytest.raises(TypeError, match="abstract"):
+        PartialStore()
+
+
+def _save_minutes(store, count: int):
+    start = datetime(2026, 3, 1, 8)
+    for minute in range(count):
+        store.save_message(f"anon_{minute % 3}", f"Question {minute}", f"Answer {minute}",
+                           start + timedelta(minutes=minute))
+    return start
+
+
+def test_admin_reads_are_newest_first_with_limit_and_since(store):
+    start = _save_minutes(store, 6)
+
+    rows = store.get_all_conversations(limit=2)
+    assert [(row["user_id"], row["input"], row["response"]) for row in rows] == [
+        ("anon_2", "Question 5", "Answer 5"), ("anon_1", "Question 4", "Answer 4")
+    ]
+    assert rows[0]["timestamp"] == start + timedelta(minutes=5)
+    assert [row["input"] for row in store.get_all_conversations(since=start + timedelta(minutes=3))] == [
+        "Question 5", "Question 4"
+    ]
+
+
+def test_iteration_is_oldest_first_within_range_and_user(store):
+    start = _save_minutes(store, 9)
+
+    rows = list(store.iter_conversations(start + timedelta(minutes=2), start + timedelta(minutes=7), chunk_size=2))
+    assert [row["input"] for row in rows] == [f"Question {minute}" for minute in range(2, 7)]
+    assert len({row["message_id"] for row in rows}) == 5
+
+    rows = list(store.iter_conversations(user_id="anon_1"))
+    assert [row["input"] for row in rows] == ["Question 1", "Question 4", "Question 7"]
+
+
+def test_curation_decisions_are_stored_per_question(store):
+    store.set_answer_curation("kapan perwalian", "Kapan perwalian?", False, updated_by="admin@example.com")
+    store.set_answer_curation("cara isi krs", "Cara isi KRS?", True)
+    store.set_answer_curation("kapan perwalian", "Kapan perwalian?", True)
+
+    assert store.get_answer_curation() == {"kapan perwalian": True, "cara isi krs": True}
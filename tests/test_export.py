@@ -0,0 +1,61 @@
+import csv
+import gzip
+import json
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import main
+
+
+def _save_days(store, days: int):
+    now = datetime.now()
+    for days_ago in range(days):
+        store.save_message(f"anon_{days_ago}", f"Question {days_ago}", "Answer", now - timedelta(days=days_ago))
+
+
+def test_export_filters_by_date_and_writes_every_field(chat_manager):
+    _save_days(chat_manager.store, 5)
+    today = datetime.now().date()
+
+    result = chat_manager.export_conversations("csv", start_date=today - timedelta(days=1), end_date=today,
+                                               chunk_size=1)
+    try:
+        with open(result["path"], newline="", encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))
+    finally:
+        os.remove(result["path"])
+
+    assert result["rows"] == 2
+    assert list(rows[0]) == main.EXPORT_FIELDS
+    assert [row["input"] for row in rows] == ["Question 1", "Question 0"]
+    assert rows[0]["is_anonymous"] == "True"
+
+
+def test_gzip_ndjson_export_of_one_user(chat_manager):
+    _save_days(chat_manager.store, 3)
+
+    result = chat_manager.export_conversations("ndjson", compress=True, user_id="anon_2")
+    try:
+        with gzip.open(result["path"], "rt", encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f]
+    finally:
+        os.remove(result["path"])
+
+    assert result["path"].endswith(".ndjson.gz")
+    assert [(row["user_id"], row["input"]) for row in rows] == [("anon_2", "Question 2")]
+
+
+def test_export_deletes_files_left_by_closed_sessions(chat_manager):
+    with tempfile.NamedTemporaryFile(prefix="conversations_export_", suffix=".csv", delete=False) as tmp:
+        stale = tmp.name
+    old = time.time() - chat_manager.export_ttl - 60
+    os.utime(stale, (old, old))
+
+    result = chat_manager.export_conversations("csv")
+    try:
+        assert not os.path.exists(stale)
+        assert os.path.exists(result["path"])
+    finally:
+        os.remove(result["path"])
@@ -0,0 +1,47 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+PAGE_SIZE = 3
+TOTAL = 11
+
+
+@pytest.fixture
+def filled_store(store):
+    start = datetime(2026, 3, 1, 8)
+    for minute in range(TOTAL):
+        store.save_message("user_1", f"Question {minute}", "Answer", start + timedelta(minutes=minute))
+    store.save_message("user_2", "Other user", "Answer", start)
+    return store
+
+
+def _inputs(store, page: int, cursors: dict) -> list:
+    return [row["input"] for row in store.get_history_page("user_1", page, PAGE_SIZE, TOTAL, cursors)]
+
+
+def _expected(page: int) -> list:
+    newest = TOTAL - 1 - (page - 1) * PAGE_SIZE
+    return [f"Question {minute}" for minute in range(newest, max(newest - PAGE_SIZE, -1), -1)]
+
+
+def test_count_is_per_user(filled_store):
+    assert filled_store.count_messages("user_1") == TOTAL
+    assert filled_store.count_messages("user_2") == 1
+
+
+@pytest.mark.parametrize("order", [[1, 2, 3, 4], [4, 3, 2, 1], [3, 1, 4, 2]])
+def test_pages_are_newest_first_in_any_visit_order(filled_store, order):
+    cursors = {}
+    for page in order:
+        assert _inputs(filled_store, page, cursors) == _expected(page)
+
+
+def test_cursors_reset_when_new_messages_arrive(filled_store):
+    cursors = {}
+    _inputs(filled_store, 1, cursors)
+    _inputs(filled_store, 2, cursors)
+
+    filled_store.save_message("user_1", "Question 11", "Answer", datetime(2026, 3, 1, 9))
+    rows = filled_store.get_history_page("user_1", 2, PAGE_SIZE, TOTAL + 1, cursors)
+
+    assert [row["input"] for row in rows] == ["Question 8", "Question 7", "Question 6"]
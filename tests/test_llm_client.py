@@ -0,0 +1,71 @@
+import time
+
+import pytest
+import requests
+
+import main
+
+
+def test_failed_half_open_trial_releases_the_backend():
+    client = main.LLMClient("htp:/not-a-backend", max_retries=0, health_check_interval=0)
+    backend = client.backends[0]
+    # Opened long enough ago that the next request is the half-open trial
+    backend.breaker.opened_at = time.monotonic() - backend.breaker.reset_timeout - 1
+
+    with pytest.raises(requests.exceptions.RequestException):
+        client.post("/generate", json={"prompt": "hi"})
+
+    assert backend.outstanding == 0
+    assert backend.breaker.trial_in_flight is False
+    assert backend.breaker.state == "open"
+    assert client.stats()["failures"] == 1
+
+
+def test_breaker_opens_after_threshold_and_lets_one_trial_through(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(main.time, "monotonic", lambda: clock[0])
+    breaker = main.CircuitBreaker(failure_threshold=2, reset_timeout=30)
+
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow_request()
+
+    clock[0] += 30
+    assert breaker.state == "half_open"
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow_request()
+
+
+def test_connection_failure_fails_over_to_the_other_backend(mock_backend):
+    _, url = mock_backend
+    client = main.LLMClient(["http://127.0.0.1:9", url], max_retries=1, backoff_base=0, health_check_interval=0)
+    dead, alive = client.backends
+    # Make the dead backend look idle so it is tried first
+    alive.outstanding = 5
+
+    response = client.post("/generate", json={"prompt": "Kapan perwalian?"})
+
+    assert response.status_code == 200
+    assert dead.counters["failures"] == 1 and alive.counters["requests"] == 1
+    assert client.stats()["retries"] == 1
+    assert (dead.outstanding, alive.outstanding) == (0, 5)
+
+
+def test_routing_policies_and_ejected_backends():
+    client = main.LLMClient(["http://a", "http://b", "http://c"], routing="ewma", health_check_interval=0)
+    fast, slow, ejected = client.backends
+    fast.ewma_latency, slow.ewma_latency, ejected.ewma_latency = 0.5, 2.0, 0.1
+    ejected.set_health(False, "HTTP 503")
+
+    assert client._choose_backend(set()) is fast
+    # Three queued requests make the fast backend's expected wait longer than the slow one's
+    fast.outstanding = 3
+    assert client._choose_backend(set()) is slow
+
+    client.routing = "least_outstanding"
+    assert client._choose_backend(set()) is slow
+    assert client._choose_backend({slow, fast}) is ejected
+    assert ejected.stats()["ejections"] == 1
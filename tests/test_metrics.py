@@ -0,0 +1,45 @@
+import json
+import threading
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+import main
+
+
+def test_stage_histograms_in_prometheus_and_json():
+    metrics = main.MetricsRegistry()
+    turn = metrics.start_turn("anon_1", "Bagaimana cara mengisi KRS?")
+    for seconds in (0.004, 0.3, 0.3, 45.0):
+        metrics.observe("model", seconds)
+    turn.record_size("prompt", 300)
+    metrics.finish_turn(turn, success=False)
+
+    text = metrics.to_prometheus()
+    assert 'chatbot_stage_seconds_bucket{stage="model",le="0.005"} 1' in text
+    assert 'chatbot_stage_seconds_bucket{stage="model",le="0.5"} 3' in text
+    assert 'chatbot_stage_seconds_bucket{stage="model",le="+Inf"} 4' in text
+    assert 'chatbot_stage_seconds_count{stage="model"} 4' in text
+    assert 'chatbot_prompt_chars_bucket{part="prompt",le="512"} 1' in text
+
+    exported = json.loads(metrics.to_json())
+    assert exported["stages"]["model"]["count"] == 4
+    assert exported["stages"]["model"]["max"] == 45.0
+    assert exported["slowest_turns"][0]["success"] is False
+    assert exported["prompt_chars"]["prompt"]["sum"] == 300
+
+
+def test_metrics_endpoint_serves_both_formats():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), main.MetricsRequestHandler)
+    server.metrics = main.MetricsRegistry()
+    server.metrics.observe("save", 0.02)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        with urllib.request.urlopen(f"{base}/metrics") as response:
+            assert response.headers["Content-Type"].startswith("text/plain")
+            assert 'chatbot_stage_seconds_count{stage="save"} 1' in response.read().decode()
+        with urllib.request.urlopen(f"{base}/metrics.json") as response:
+            assert json.load(response)["stages"]["save"]["count"] == 1
+    finally:
+        server.shutdown()
+        server.server_close()
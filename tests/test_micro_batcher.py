@@ -0,0 +1,90 @@
+import pytest
+
+import main
+
+
+class FakeResponse:
+    status_code = 200
+
+    def __init__(self, body):
+        self.body = body
+
+    def json(self):
+        return self.body
+
+    def close(self):
+        pass
+
+
+class FakeClient:
+    def __init__(self, reply):
+        self.reply = reply
+
+    def post(self, path, **kwargs):
+        if isinstance(self.reply, Exception):
+            raise self.reply
+        return FakeResponse(self.reply)
+
+
+@pytest.mark.parametrize("reply", [
+    {"responses": []},
+    {"responses": ["one", "two"]},
+    {"responses": "not a list"},
+    ["a list instead of an object"],
+    {"responses": [42]},
+    KeyError("unexpected"),
+])
+def test_malformed_batch_reply_fails_every_waiter(reply):
+    batcher = main.MicroBatcher(FakeClient(reply), window=0.01)
+
+    result = batcher.submit({"prompt": "hi"}, timeout=5)
+
+    assert result["success"] is False
+    assert "Timed out" not in result["error"]
+    assert batcher.stats()["failed_batches"] == 1
+    assert batcher.stats()["supported"] is None
+
+
+def test_well_formed_batch_reply():
+    batcher = main.MicroBatcher(FakeClient({"responses": [{"response": "hello"}]}), window=0.01)
+
+    assert batcher.submit({"prompt": "hi"}, timeout=5) == {"success": True, "response": "hello"}
+    assert batcher.stats()["supported"] is True
+
+
+class RecordingClient(FakeClient):
+    def __init__(self):
+        super().__init__({"responses": []})
+        self.batches = []
+
+    def post(self, path, **kwargs):
+        prompts = [request["prompt"] for request in kwargs["json"]["requests"]]
+        self.batches.append(prompts)
+        return FakeResponse({"responses": [f"answer to {prompt}" for prompt in prompts]})
+
+
+def test_prompt_of_a_caller_that_timed_out_is_not_sent():
+    admission = main.FairQueue(max_concurrent=1)
+    client = RecordingClient()
+    batcher = main.MicroBatcher(client, window=0.3, admission=admission)
+
+    ticket = admission.enter("anon_1", timeout=1, weight=1 / batcher.max_batch_size)
+    result = batcher.submit({"prompt": "late"}, timeout=0.05, ticket=ticket)
+    assert "Timed out" in result["error"]
+
+    assert batcher.submit({"prompt": "on time"}, timeout=5) == {"success": True, "response": "answer to on time"}
+    assert client.batches == [["on time"]]
+    assert batcher.stats()["abandoned_prompts"] == 1
+    assert admission.stats()["active"] == 0
+
+
+def test_batched_prompts_share_a_slot_and_queue_per_user():
+    admission = main.FairQueue(max_concurrent=1)
+    shares = [admission.enter(f"anon_{index}", timeout=1, weight=0.25) for index in range(4)]
+    assert all(ticket is not None for ticket in shares)
+    assert admission.stats()["load"] == 1.0
+
+    # The slot is full, so the next prompt waits its turn like any other user's call
+    assert admission.enter("anon_greedy", timeout=0.05, weight=0.25) is None
+    admission.release(shares[0])
+    assert admission.enter("anon_greedy", timeout=0.05, weight=0.25) is not None
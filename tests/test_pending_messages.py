@@ -0,0 +1,28 @@
+from datetime import datetime, timedelta
+
+
+def test_unanswered_turns_stay_out_of_reads(store):
+    now = datetime.now()
+    answered = store.begin_message("anon_1", "Kapan perwalian?", now)
+    store.begin_message("anon_1", "Pertanyaan yang belum dijawab", now)
+    discarded = store.begin_message("anon_1", "Gagal", now)
+
+    store.complete_message("anon_1", answered, "Kapan perwalian?", "Minggu depan.", now)
+    store.discard_message("anon_1", discarded)
+
+    assert store.count_messages("anon_1") == 1
+    rows = store.get_all_conversations()
+    assert [(row["input"], row["response"]) for row in rows] == [("Kapan perwalian?", "Minggu depan.")]
+    assert store.get_usage_rollups()["totals"]["messages"] == 1
+
+
+def test_purge_drops_only_stale_pending_turns(store):
+    now = datetime.now()
+    store.begin_message("anon_1", "Tab ditutup", now - timedelta(hours=1))
+    fresh = store.begin_message("anon_1", "Masih dijawab", now)
+
+    assert store.purge_pending(now - timedelta(minutes=15)) == 1
+    assert store.purge_pending(now - timedelta(minutes=15)) == 0
+
+    store.complete_message("anon_1", fresh, "Masih dijawab", "Sudah.", now)
+    assert store.count_messages("anon_1") == 1
@@ -0,0 +1,32 @@
+import pickle
+
+import main
+
+
+def test_visualization_is_kept_as_plain_pairs():
+    records = [{"label": "2019", "value": 80}, {"label": "2020", "value": 95}]
+    message = main.ChatMessage("assistant", "Jumlah mahasiswa per angkatan", viz_type="bar", viz_data=records)
+
+    assert message.viz_data == (("2019", 80), ("2020", 95))
+    assert message.viz_records() == records
+    assert not hasattr(message, "__dict__")
+    # Session state may be pickled by Streamlit, so messages must stay plain data
+    assert pickle.loads(pickle.dumps(message)).viz_records() == records
+
+
+def test_memory_cap_drops_oldest_turns_but_keeps_the_last_exchange():
+    messages = []
+    for turn in range(10):
+        messages.append(main.ChatMessage("user", f"Question {turn}"))
+        messages.append(main.ChatMessage("assistant", "x" * 500))
+    per_turn = messages[0].approx_size() + messages[1].approx_size()
+
+    dropped = main.enforce_session_memory_cap(messages, cap_bytes=per_turn * 3)
+
+    assert dropped == 14
+    assert messages[0].content == "Question 7"
+    assert sum(message.approx_size() for message in messages) <= per_turn * 3
+
+    huge = [main.ChatMessage("user", "q"), main.ChatMessage("assistant", "y" * 10000)]
+    assert main.enforce_session_memory_cap(huge, cap_bytes=100) == 0
+    assert len(huge) == 2
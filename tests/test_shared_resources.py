@@ -0,0 +1,20 @@
+import os
+import subprocess
+import sys
+
+import main
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_managers_are_shared_by_every_session(chat_manager):
+    assert main.get_chat_manager() is main.get_chat_manager()
+    assert main.get_chat_manager().store is main.get_chat_manager().store
+
+
+def test_importing_the_app_leaves_the_heavy_modules_for_later():
+    # Streamlit itself imports plotly.graph_objects, so only what main.py defers is checked
+    code = "import sys, main; print(sorted(m for m in ('pandas', 'numpy', 'plotly.express') if m in sys.modules))"
+    output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True,
+                            check=True).stdout
+    assert output.strip().splitlines()[-1] == "[]"
@@ -0,0 +1,97 @@
+import gc
+
+import main
+
+
+def _open_streams(chat_manager, count):
+    results = [chat_manager.stream_message_to_api(f"Pertanyaan {index}", user_id=f"anon_{index}")
+               for index in range(count)]
+    assert all(result["success"] for result in results)
+    return results
+
+
+def test_abandoned_stream_releases_ticket_call_and_backend(chat_manager):
+    backend = chat_manager.llm_client.backends[0]
+    results = _open_streams(chat_manager, 2)
+    for result in results:
+        next(result["stream"])
+
+    assert chat_manager.inflight.stats()["in_flight"] == 2
+    assert chat_manager.admission.stats()["active"] == 2
+    assert backend.outstanding == 2
+
+    # A rerun mid-answer drops the session's reader without finishing it
+    del result
+    results.clear()
+    gc.collect()
+
+    assert chat_manager.inflight.stats()["in_flight"] == 0
+    assert chat_manager.admission.stats()["active"] == 0
+    assert backend.outstanding == 0
+
+
+def test_stream_dropped_before_first_chunk_is_released(chat_manager):
+    backend = chat_manager.llm_client.backends[0]
+    results = _open_streams(chat_manager, 1)
+    results.clear()
+    gc.collect()
+
+    assert chat_manager.inflight.stats()["in_flight"] == 0
+    assert chat_manager.admission.stats()["active"] == 0
+    assert backend.outstanding == 0
+
+
+def test_follower_keeps_the_stream_alive_after_the_leader_leaves():
+    closed = []
+
+    def source():
+        try:
+            yield from ["a", "b", "c"]
+        finally:
+            closed.append(True)
+
+    shared = main.SharedStream(source(), on_done=lambda: closed.append("done"))
+    leader, follower = iter(shared), iter(shared)
+    assert next(leader) == "a"
+    leader.close()
+    assert closed == []
+
+    assert list(follower) == ["a", "b", "c"]
+    assert shared.aborted is False
+    assert closed == [True, "done"]
+
+
+def test_single_flight_joins_only_fresh_calls(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(main.time, "monotonic", lambda: clock[0])
+    flight = main.SingleFlight(max_age=10)
+
+    call, leader = flight.join("krs")
+    follower_call, follower_leader = flight.join("krs")
+    assert leader and not follower_leader and follower_call is call
+
+    clock[0] += 11
+    stale_call, stale_leader = flight.join("krs")
+    assert stale_leader and stale_call is not call
+
+    flight.publish("krs", call, {"success": True, "response": "old"})
+    # The older leader must not drop the newer call it no longer owns
+    assert flight.stats()["in_flight"] == 1
+    assert flight.wait(follower_call, timeout=0) == {"success": True, "response": "old"}
+    assert flight.wait(stale_call, timeout=0) is None
+    assert flight.stats()["follower_timeouts"] == 1
+
+
+def test_identical_concurrent_prompts_share_one_backend_call(chat_manager):
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(
+            lambda index: chat_manager.send_message_to_api("Bagaimana cara mengisi KRS?", user_id=f"anon_{index}"),
+            range(4)))
+
+    assert all(result["success"] for result in results)
+    assert len({result["response"] for result in results}) == 1
+    assert sum(bool(result.get("coalesced")) for result in results) == 3
+    stats = chat_manager.inflight.stats()
+    assert (stats["leaders"], stats["coalesced"], stats["in_flight"]) == (1, 3, 0)
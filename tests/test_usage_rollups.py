@@ -0,0 +1,63 @@
+from datetime import datetime, timedelta
+
+import main
+from fake_firestore import FakeFirestore, FakeWriteBatch
+
+
+def _daily(store):
+    return {row["date"]: (row["messages"], row["users"]) for row in store.get_usage_rollups()["daily"]}
+
+
+def test_daily_users_are_distinct_and_survive_a_rebuild(store):
+    now = datetime.now()
+    yesterday = now - timedelta(days=1)
+    store.save_message("anon_1", "a", "x", now)
+    store.save_message("anon_1", "b", "y", now)
+    store.save_message("user_2", "c", "z", now)
+    store.save_message("anon_1", "d", "w", yesterday)
+
+    expected = {
+        yesterday.strftime("%Y-%m-%d"): (1, 1),
+        now.strftime("%Y-%m-%d"): (3, 2)
+    }
+    assert _daily(store) == expected
+    assert store.get_usage_rollups()["unique_users"] == 2
+
+    assert store.rebuild_usage_rollups() == {"messages": 4, "days": 2, "users": 2}
+    assert _daily(store) == expected
+
+
+class RollupRejectingBatch(FakeWriteBatch):
+    def commit(self):
+        if any(path.startswith("usage_") for path, _, _ in self.writes):
+            raise ValueError("rollup write rejected")
+        super().commit()
+
+
+class RollupRejectingFirestore(FakeFirestore):
+    def batch(self):
+        return RollupRejectingBatch(self)
+
+
+def test_failed_rollup_update_keeps_the_message():
+    store = main.FirestoreStore(RollupRejectingFirestore())
+
+    store.save_message("anon_1", "Kapan perwalian?", "Minggu depan.", datetime.now())
+
+    assert store.count_messages("anon_1") == 1
+
+
+def test_daily_users_are_read_from_the_day_documents():
+    db = FakeFirestore()
+    store = main.FirestoreStore(db)
+    now = datetime.now()
+    for days_ago in range(5):
+        store.save_message("anon_1", "a", "x", now - timedelta(days=days_ago))
+    # Another instance sees the same user later that day
+    main.FirestoreStore(db).save_message("anon_1", "b", "y", now)
+    main.FirestoreStore(db).save_message("user_2", "c", "z", now)
+
+    round_trips = db.round_trips
+    rollups = store.get_usage_rollups()
+    assert db.round_trips - round_trips == 3
+    assert [row["users"] for row in rollups["daily"]] == [1, 1, 1, 1, 2]
@@ -0,0 +1,63 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+import main
+
+
+def test_failed_phase_is_reported_without_stopping_the_rest():
+    warmup = main.WarmUp(main.MetricsRegistry())
+
+    def stops():
+        raise SystemExit("st.stop")
+
+    warmup.run([("store", lambda: "sqlite reachable"), ("admin_roles", stops), ("imports", lambda: None)])
+
+    report = warmup.report()
+    assert report["finished"] and not report["ready"]
+    assert [(phase["phase"], phase["ok"]) for phase in report["phases"]] == [
+        ("store", True), ("admin_roles", False), ("imports", True)
+    ]
+    assert report["phases"][1]["error"] == "st.stop"
+    assert "warmup_store" in warmup.metrics.summary()
+
+
+def test_sqlite_warm_up_reaches_ready_and_records_the_first_answer(chat_manager, monkeypatch):
+    monkeypatch.setenv("RETRIEVAL_ENABLED", "true")
+    warmup = main.WarmUp(main.MetricsRegistry(), timeout=10)
+
+    warmup.run(main.warm_up_phases(warmup.timeout))
+    warmup.mark_first_response()
+    first = warmup.first_response_seconds
+    warmup.mark_first_response()
+
+    report = warmup.report()
+    assert report["ready"], report["phases"]
+    assert [phase["phase"] for phase in report["phases"]] == [
+        "store", "llm_backends", "shared_caches", "answer_index", "imports"
+    ]
+    assert report["first_response_seconds"] == first
+
+
+def test_ready_endpoint_is_503_until_warm_up_succeeds():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), main.MetricsRequestHandler)
+    server.metrics = main.MetricsRegistry()
+    server.warmup = main.WarmUp(server.metrics)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/ready"
+    try:
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(url)
+        assert error.value.code == 503
+        assert json.load(error.value)["finished"] is False
+
+        server.warmup.run([("store", lambda: "ok")])
+        with urllib.request.urlopen(url) as response:
+            assert json.load(response)["ready"] is True
+    finally:
+        server.shutdown()
+        server.server_close()
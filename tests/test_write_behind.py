@@ -0,0 +1,43 @@
+import json
+
+import main
+from fake_firestore import FakeFirestore, FakeWriteBatch
+
+
+class RejectingBatch(FakeWriteBatch):
+    def commit(self):
+        if any("invalid" in path for path, _, _ in self.writes):
+            raise ValueError("invalid document")
+        super().commit()
+
+
+class RejectingFirestore(FakeFirestore):
+    def batch(self):
+        return RejectingBatch(self)
+
+
+def test_permanently_failing_save_is_dead_lettered(tmp_path):
+    db = RejectingFirestore()
+    dead_letter_path = str(tmp_path / "dead_letter.ndjson")
+    writer = main.WriteBehindQueue(db, flush_interval=0.05, retry_backoff=0.01,
+                                   max_retries=2, dead_letter_path=dead_letter_path)
+    try:
+        writer.enqueue([(db.collection("messages").document("invalid"), {"input": "bad"}, False)])
+        writer.enqueue([(db.collection("messages").document("ok"), {"input": "good"}, False)])
+        assert writer.flush(timeout=5)
+    finally:
+        writer.shutdown()
+
+    assert db.collection("messages").document("ok").get().exists
+    assert not db.collection("messages").document("invalid").get().exists
+
+    stats = writer.stats()
+    assert stats["dead_lettered"] == 1
+    assert stats["committed_writes"] == 1
+    assert stats["pending"] == 0
+
+    with open(dead_letter_path, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    assert len(records) == 1
+    assert records[0]["writes"][0]["path"] == "messages/invalid"
+    assert records[0]["writes"][0]["data"] == {"input": "bad"}